@@ -1,5 +1,5 @@
 from .food_finder_agent import food_finder_agent, create_initial_state
-from .prompts import MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT, TEAM_SUPERVISOR_SYSTEM_PROMPT, DATETIME_EXTRACTOR_SYSTEM_PROMPT, STATE_UPDATER_SYSTEM_PROMPT
+from .prompts import MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT, TEAM_SUPERVISOR_SYSTEM_PROMPT, DATETIME_EXTRACTOR_SYSTEM_PROMPT, STATE_UPDATER_SYSTEM_PROMPT, COMBINED_EXTRACTOR_SYSTEM_PROMPT
 from .setup_environment import set_environment_variables_langsmith
 
 __all__ = ["food_finder_agent", "create_initial_state"]
\ No newline at end of file
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.schemas import StateUpdaterOutputFormat, DateTimeExtract, CombinedExtractionOutputFormat
+from app.graph.preference_parser import parse_preferences
+from app.graph.prompts import MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT
+
+# "openai" for the real model, "fake" for FakeFoodFinderChatModel (no network, deterministic answers)
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "openai")
+DEFAULT_LLM_MODELS = {"openai": "gpt-4o", "fake": "fake-food-finder"}
+# Also part of the LLM result cache keys, so the fake's answers are never served for the real model's
+LLM_MODEL = os.environ.get("LLM_MODEL") or DEFAULT_LLM_MODELS.get(LLM_PROVIDER, "")
+# How long each fake call waits before its first token, and between tokens
+FAKE_LLM_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_LATENCY_SECONDS", 0.0))
+FAKE_LLM_TOKEN_SECONDS = float(os.environ.get("FAKE_LLM_TOKEN_SECONDS", 0.0))
+
+SEARCH_TOOL_NAME = "google_maps_text_search_and_filter"
+SHOW_MORE_TOOL_NAME = "show_more_places"
+# What a user says when they want the next page of the last search
+SHOW_MORE_REQUEST = re.compile(r"\b(?:more|other|others|else|next)\b")
+
+def create_chat_model(provider: str = LLM_PROVIDER, model: str = LLM_MODEL, temperature: float = 0) -> BaseChatModel:
+    """The chat model every node of the graph is bound to"""
+    if provider == "openai":
+        # Imported here, so the fake can run without the OpenAI client configured
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model, temperature=temperature)
+    if provider == "fake":
+        return FakeFoodFinderChatModel(model_name=model)
+    raise ValueError(f"Unknown LLM_PROVIDER {provider!r} (openai or fake)")
+
+def _tokens(text: str) -> List[str]:
+    # Words with the whitespace after them, so the tokens add back up to the text
+    return re.findall(r"\S+\s*|\s+", text)
+
+def _last_human_text(messages: Sequence[BaseMessage]) -> str:
+    return next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+
+def _all_human_text(messages: Sequence[BaseMessage]) -> str:
+    # What the user asked for anywhere in the conversation (a later message wins where they disagree)
+    return ". ".join(m.content for m in messages if isinstance(m, HumanMessage))
+
+def fake_maps_query(user_text: str) -> str:
+    """One query per desired cuisine, a line each (like the maps query formulator is asked for)"""
+    cuisines = parse_preferences(user_text).fields.get("desired_cuisines")
+    names = [c for c in (cuisines.value if cuisines else []) if c != "any"]
+    return "\n".join(f"{c} restaurant" for c in names) or "restaurants"
+
+def fake_structured_output(schema_name: str, messages: Sequence[BaseMessage]) -> Dict[str, Any]:
+    """Arguments of the tool call answering with_structured_output(schema) for the extraction schemas,
+    worked out from the user's message by the preference fast path parser (app/graph/preference_parser.py)"""
+    if schema_name == DateTimeExtract.__name__:
+        # The datetime extractor sends one formatted prompt, with the user's query on its last line
+        lines = _last_human_text(messages).strip().splitlines() or [""]
+        parsed = parse_preferences(lines[-1])
+        # Dinner at 6 PM today if they didn't say (what the prompt tells the model to assume)
+        dt = parsed.dt.value if parsed.dt else datetime.now().replace(hour=18, minute=0, second=0, microsecond=0)
+        return DateTimeExtract(dt=dt).model_dump(mode="json")
+    user_text = _all_human_text(messages)
+    parsed = parse_preferences(user_text)
+    output = parsed.state_updater_output()
+    if schema_name == CombinedExtractionOutputFormat.__name__:
+        output = CombinedExtractionOutputFormat(
+            **output.model_dump(), dt=parsed.dt.value if parsed.dt else None, maps_query=fake_maps_query(user_text)
+        )
+    elif schema_name != StateUpdaterOutputFormat.__name__:
+        raise ValueError(f"The fake chat model has no structured output for {schema_name}")
+    return output.model_dump(mode="json")
+
+class FakeFoodFinderChatModel(BaseChatModel):
+    """A deterministic, offline stand-in for the graph's chat model, for measuring everything that isn't the
+    model (graph overhead, checkpointing, concurrency). It answers each kind of call the graph makes:
+    - with_structured_output(StateUpdaterOutputFormat / DateTimeExtract / CombinedExtractionOutputFormat):
+      the preferences the fast path parser finds in the user's message
+    - the maps query formulator: a query per cuisine the user asked for
+    - the supervisor (bound to the places tools): a search with the formulated query, show_more_places
+      when the user asks for more, or a short reply once a tool has answered
+    Every call waits latency_seconds, then token_seconds per token (streamed token by token)."""
+    model_name: str = DEFAULT_LLM_MODELS["fake"]
+    latency_seconds: float = FAKE_LLM_LATENCY_SECONDS
+    token_seconds: float = FAKE_LLM_TOKEN_SECONDS
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-food-finder"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any):
+        formatted = [convert_to_openai_tool(t) for t in tools]
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return self.bind(tools=formatted, **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict[str, Any]]] = None, tool_choice: Optional[str] = None) -> AIMessage:
+        tool_names = [t["function"]["name"] for t in tools or []]
+        if tool_choice is not None and len(tool_names) == 1:
+            return self._tool_call_message(messages, tool_names[0], fake_structured_output(tool_names[0], messages))
+        if SEARCH_TOOL_NAME in tool_names:
+            return self._supervise(messages)
+        if any(isinstance(m, SystemMessage) and m.content == MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT for m in messages):
+            return AIMessage(content=fake_maps_query(_all_human_text(messages)))
+        return AIMessage(content="Happy to help you find somewhere to eat!")
+
+    def _supervise(self, messages: List[BaseMessage]) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            if "Failed" in last.content:
+                return AIMessage(content="Sorry, I couldn't search for places just now. Could you try again?")
+            return AIMessage(content="Here are some places that fit what you're looking for:")
+        searched = any(isinstance(m, ToolMessage) and m.name == SEARCH_TOOL_NAME for m in messages)
+        if searched and SHOW_MORE_REQUEST.search(_last_human_text(messages).lower()):
+            return self._tool_call_message(messages, SHOW_MORE_TOOL_NAME, {})
+        api_query = next(
+            (m.content for m in reversed(messages) if getattr(m, "originating_node", None) == "maps_query_formulator_node"),
+            fake_maps_query(_all_human_text(messages)),
+        )
+        return self._tool_call_message(messages, SEARCH_TOOL_NAME, {"api_query": api_query})
+
+    def _tool_call_message(self, messages: List[BaseMessage], name: str, args: Dict[str, Any]) -> AIMessage:
+        # Same ids for the same conversation, so runs can be compared
+        digest = hashlib.sha1(f"{len(messages)}:{name}:{json.dumps(args, sort_keys=True)}".encode()).hexdigest()[:12]
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{digest}", "type": "tool_call"}])
+
+    def _with_usage(self, messages: List[BaseMessage], message: AIMessage) -> AIMessage:
+        # Words stand in for tokens
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(message.content.split()) + sum(len(json.dumps(c["args"]).split()) for c in message.tool_calls)
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+        message.response_metadata = {"model_name": self.model_name}
+        return message
+
+    def _num_tokens(self, message: AIMessage) -> int:
+        return len(_tokens(message.content)) + len(message.tool_calls)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self._with_usage(messages, self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice")))
+        time.sleep(self.latency_seconds + self.token_seconds * self._num_tokens(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self._with_usage(messages, self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice")))
+        await asyncio.sleep(self.latency_seconds + self.token_seconds * self._num_tokens(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> Iterator[AIMessageChunk]:
+        for token in _tokens(message.content):
+            yield AIMessageChunk(content=token)
+        for i, call in enumerate(message.tool_calls):
+            yield AIMessageChunk(content="", tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}])
+        yield AIMessageChunk(content="", usage_metadata=message.usage_metadata, response_metadata=message.response_metadata)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        message = self._with_usage(messages, self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice")))
+        time.sleep(self.latency_seconds)
+        for chunk in self._chunks(message):
+            if chunk.content or chunk.tool_call_chunks:
+                time.sleep(self.token_seconds)
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._with_usage(messages, self._respond(messages, kwargs.get("tools"), kwargs.get("tool_choice")))
+        await asyncio.sleep(self.latency_seconds)
+        for chunk in self._chunks(message):
+            if chunk.content or chunk.tool_call_chunks:
+                await asyncio.sleep(self.token_seconds)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
@@ -1,23 +1,37 @@
+import asyncio
 import os
 from typing import Tuple, List
 from datetime import datetime
 
 from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
-from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import ToolNode
 from langgraph.graph import END, StateGraph
 
-from app.schemas import Place, UserPreferences, AgentState, CustomAIMessage, DateTimeExtract, StateUpdaterOutputFormat
-from app.graph.tools.places_search import google_maps_text_search_and_filter
-from app.graph.prompts import MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT, TEAM_SUPERVISOR_SYSTEM_PROMPT, DATETIME_EXTRACTOR_SYSTEM_PROMPT, STATE_UPDATER_SYSTEM_PROMPT
+from app.schemas import Place, UserPreferences, AgentState, CustomAIMessage, DateTimeExtract, StateUpdaterOutputFormat, CombinedExtractionOutputFormat
+from app.graph.tools.places_search import google_maps_text_search_and_filter, show_more_places, PLACES_PAGE_SIZE
+from app.graph.tools.scoring import next_ranked_page
+from app.graph.tools.place_store import get_place_store
+from app.graph.preference_parser import parse_preferences, PREFERENCE_FAST_PATH_ENABLED
+from app.graph.chat_models import create_chat_model, LLM_MODEL
+from app.services.llm_cache import cached_node_call
+from app.graph.prompts import MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT, TEAM_SUPERVISOR_SYSTEM_PROMPT, DATETIME_EXTRACTOR_SYSTEM_PROMPT, STATE_UPDATER_SYSTEM_PROMPT, COMBINED_EXTRACTOR_SYSTEM_PROMPT
 
 import logging
 logging.basicConfig(filename='debug.log', level=logging.DEBUG)
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
+# ChatOpenAI, or a deterministic fake with LLM_PROVIDER=fake (see app/graph/chat_models.py)
+llm = create_chat_model()
+# Runnables for the structured extractions, built once here rather than on every call
+datetime_extractor = llm.with_structured_output(DateTimeExtract)
+state_updater = llm.with_structured_output(StateUpdaterOutputFormat)
+combined_extractor = llm.with_structured_output(CombinedExtractionOutputFormat)
 
-def get_formatted_datetime():
-    now = datetime.now()
+# "multi" runs the state updater, datetime extractor and maps query formulator in parallel, "combined"
+# has one model call do all three. Can be set per run with config["configurable"]["extraction_mode"]
+EXTRACTION_MODE = os.environ.get("EXTRACTION_MODE", "multi")
+
+def get_formatted_datetime(now: datetime | None = None):
+    now = now or datetime.now()
     return now.strftime("It is currently %B %d, %Y. The time is %I:%M %p")
 
 def extract_datetime(message: str) -> DateTimeExtract:
@@ -25,42 +39,38 @@ def extract_datetime(message: str) -> DateTimeExtract:
     message = DATETIME_EXTRACTOR_SYSTEM_PROMPT.format(curr_day_time_msg=get_formatted_datetime(), user_query=message)
     return structured_llm.invoke(message)
 
-def format_response_str_from_places(valid_places: List[Place]):
+NUM_RECS_TO_SHOW = PLACES_PAGE_SIZE
+
+def format_response_str_from_places(valid_places: List[Place], first_rec: int = 1):
     """ Given places that conform to the user preferences, take the top n,
     and insert them into the portion of the supervisor agent's response to
-    the user """
-    NUM_RECS_TO_SHOW = min(5, len(valid_places))
+    the user (numbered from first_rec, for pages after the first) """
     response_str = ""
-    curr_rec = 1
+    curr_rec = first_rec
     for place in valid_places[:NUM_RECS_TO_SHOW]:
         response_str += f"{curr_rec}. {place.display_name_text} - {place.primary_type_display_name_text}. Located at {place.formatted_address}. Phone number is {place.national_phone_number}. Rating is {place.rating} with {place.user_rating_count} ratings. ||"
         curr_rec += 1
     return response_str
 
-def datetime_extractor_node(state: AgentState):
+async def datetime_extractor_node(state: AgentState):
     # Grab the first human message's content
     user_query = next((msg.content for msg in state["messages"] if isinstance(msg, HumanMessage)), None)
-    structured_model = llm.with_structured_output(DateTimeExtract)
-    message = DATETIME_EXTRACTOR_SYSTEM_PROMPT.format(curr_day_time_msg=get_formatted_datetime(), user_query=user_query)
+    # Plainly stated times ("tomorrow at 7pm") are parsed without the LLM
+    parsed = parse_preferences(user_query) if PREFERENCE_FAST_PATH_ENABLED else None
+    if parsed is not None and parsed.is_confident():
+        return {"extracted_datetime": parsed.dt.value if parsed.dt else None}
 
-    response = structured_model.invoke(message)
+    message = DATETIME_EXTRACTOR_SYSTEM_PROMPT.format(curr_day_time_msg=get_formatted_datetime(), user_query=user_query)
 
-    # Now, return the updated desired time to eat
-    new_user_pref = state['user_preferences']
-    orig_stay_duration = new_user_pref.desired_time_and_stay_duration[1]
-    new_user_pref.desired_time_and_stay_duration = (response.dt, orig_stay_duration)
-    return {"user_preferences": new_user_pref, "datetime_extracted": True}
+    response = await datetime_extractor.ainvoke(message)
 
-def state_updater_node(state: AgentState):
-    # Grab the first human message's content
-    user_query_with_preferences = next((msg.content for msg in state["messages"] if isinstance(msg, HumanMessage)), None)
-    structured_model = llm.with_structured_output(StateUpdaterOutputFormat)
+    # Runs at the same time as the state updater, which is what decides whether the user said when
+    # to eat, so the datetime is only applied to the preferences once both are done (join_extractions_node)
+    return {"extracted_datetime": response.dt}
 
-    response = structured_model.invoke([
-        SystemMessage(content=STATE_UPDATER_SYSTEM_PROMPT),
-        HumanMessage(content=user_query_with_preferences)
-    ])
-    new_preferences = response.dict()
+def preferences_update(state: AgentState, response: StateUpdaterOutputFormat):
+    """The state update for the preferences the state updater (or combined extractor) gave back"""
+    new_preferences = response.dict(include=set(StateUpdaterOutputFormat.model_fields))
 
     # After we get response preferences, we update the state
     # Note: We dont need to append an additional message from this agent to the state
@@ -68,32 +78,85 @@ def state_updater_node(state: AgentState):
     state_to_return = {}
     
     pref_restrictions = {k: new_preferences[k] for k in list(new_preferences.keys())[:6]}
-    for k, v in pref_restrictions.items():
-        if k == "length_of_stay":
-            new_user_pref = state["user_preferences"]
-            orig_user_pref_time_of_stay = state["user_preferences"].desired_time_and_stay_duration[0]
-            new_user_pref.desired_time_and_stay_duration = (orig_user_pref_time_of_stay, v)
-            state_to_return["user_preferences"] = new_user_pref
-        else:
-            state_to_return[k] = v
+    length_of_stay = pref_restrictions.pop("length_of_stay")
+    state_to_return.update(pref_restrictions)
 
     pref_rest = {k: new_preferences[k] for k in list(new_preferences.keys())[6:]}
     user_preferences = UserPreferences.model_validate(pref_rest)
+    # Keep the time to eat we already have (a newly extracted one is applied in join_extractions_node)
+    orig_user_pref_time_of_stay = state["user_preferences"].desired_time_and_stay_duration[0]
+    user_preferences.desired_time_and_stay_duration = (orig_user_pref_time_of_stay, length_of_stay)
     state_to_return["user_preferences"] = user_preferences
 
-    # Handling any other state variables not included in the StateUpdaterOutputFormat schema
-    state_to_return["when_to_eat_specified"] = state["when_to_eat_specified"]
+    return state_to_return
 
+async def state_updater_node(state: AgentState):
+    # All of the user's messages, since later ones refine the preferences ("actually we need outdoor
+    # seating"), which re-ranks the last search's places instead of searching again
+    user_messages = [msg.content for msg in state["messages"] if isinstance(msg, HumanMessage)]
+    user_query_with_preferences = "\n".join(user_messages)
+
+    # Plainly stated preferences ("party of 8, within 3 miles") are parsed without the LLM
+    parsed = parse_preferences(user_query_with_preferences) if PREFERENCE_FAST_PATH_ENABLED else None
+    if parsed is not None and parsed.is_confident():
+        return preferences_update(state, parsed.state_updater_output())
+
+    # Deterministic for a given query, so the result is cached (see app/services/llm_cache.py)
+    response = await cached_node_call(
+        "state_updater_node", LLM_MODEL, STATE_UPDATER_SYSTEM_PROMPT, user_query_with_preferences,
+        invoke=lambda: state_updater.ainvoke([
+            SystemMessage(content=STATE_UPDATER_SYSTEM_PROMPT),
+        ] + [HumanMessage(content=content) for content in user_messages]),
+        dump=lambda output: output.model_dump_json(),
+        load=StateUpdaterOutputFormat.model_validate_json,
+    )
+    return preferences_update(state, response)
+
+async def combined_extractor_node(state: AgentState):
+    """Does the work of the three extraction nodes in one model call (EXTRACTION_MODE = "combined").
+    Not cached, since the datetime depends on the current time."""
+    response = await combined_extractor.ainvoke([
+        SystemMessage(content=COMBINED_EXTRACTOR_SYSTEM_PROMPT),
+        SystemMessage(content=get_formatted_datetime()),
+    ] + state["messages"])
+
+    state_to_return = preferences_update(state, response)
+    state_to_return["extracted_datetime"] = response.dt
+    # Stored the same way as the maps query formulator's, where the supervisor looks for it
+    state_to_return["messages"] = [CustomAIMessage(content=response.maps_query, originating_node="maps_query_formulator_node")]
     return state_to_return
 
-def maps_query_formulator_node(state: AgentState):
+async def join_extractions_node(state: AgentState):
+    """Fan-in point of the extraction nodes, which run in parallel. Now that the state updater has
+    said whether the user specified when to eat, apply the datetime the extractor found."""
+    extracted_datetime = state.get("extracted_datetime")
+    if not state["when_to_eat_specified"] or state["datetime_extracted"] or extracted_datetime is None:
+        return {}
+    new_user_pref = state['user_preferences']
+    orig_stay_duration = new_user_pref.desired_time_and_stay_duration[1]
+    new_user_pref.desired_time_and_stay_duration = (extracted_datetime, orig_stay_duration)
+    return {"user_preferences": new_user_pref, "datetime_extracted": True}
+
+async def maps_query_formulator_node(state: AgentState):
     messages = [SystemMessage(content=MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT)] + state["messages"]
-    response = llm.invoke(messages)
+    conversation = "\n".join(f"{msg.type}: {msg.content}" for msg in state["messages"])
+
+    async def formulate_query():
+        return (await llm.ainvoke(messages)).content
+
+    query = await cached_node_call(
+        "maps_query_formulator_node", LLM_MODEL, MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT, conversation,
+        invoke=formulate_query, dump=lambda content: content, load=lambda content: content,
+    )
     # Use custom message, to inform later agent, as it searches past messages, where to retrieve the API query
-    new_message = CustomAIMessage(content=response.content, originating_node="maps_query_formulator_node")
+    new_message = CustomAIMessage(content=query, originating_node="maps_query_formulator_node")
     return {"messages": [new_message]}
 
-def team_supervisor_node(state: AgentState):
+def without_artifact(message: ToolMessage) -> ToolMessage:
+    """The tool message without its artifact, to replace it in the message history (same id)"""
+    return message.model_copy(update={"artifact": None})
+
+async def team_supervisor_node(state: AgentState):
     # Grab the (latest) api query
     api_query = ""
     for message in reversed(state["messages"]):
@@ -102,22 +165,53 @@ def team_supervisor_node(state: AgentState):
             break
     
     messages = [SystemMessage(content=TEAM_SUPERVISOR_SYSTEM_PROMPT.format(api_query=api_query))] + state["messages"]
-    response = team_supervisor.invoke(messages)
+    response = await team_supervisor.ainvoke(messages)
 
-    # If we just called the tool to get back places, process the output of the tool to show user recommended places
+    # If we just called the tool to get back places, process the output of the tool to show user recommended places.
+    # Its artifact is only kept in the state (the maps, ranking and last search), not in the message history too
     last_message = state['messages'][-1]
-    if type(last_message) == ToolMessage and "Failed" not in last_message.content: # So far, just 1 tool is used - Google Maps search
-        valid_places, invalid_places = last_message.artifact
+    if type(last_message) == ToolMessage and last_message.name == "show_more_places":
+        # The next page of the last search's ranking
+        page, ranking, prefetched = last_message.artifact
+        update = {'messages': [without_artifact(last_message)]}
+        # The search's later pages, if the tool merged them in
+        if prefetched is not None:
+            valid_refs, invalid_refs, last_search = prefetched
+            update.update({
+                'valid_places': {**state.get('valid_places', {}), **{ref.name: ref for ref in valid_refs}},
+                'invalid_places': {**state.get('invalid_places', {}), **{ref.name: ref for ref in invalid_refs}},
+                'place_ranking': ranking,
+                'last_search': last_search,
+            })
+        if not page:
+            return {**update, 'messages': update['messages'] + [response]}
+        more_places = await get_place_store().aget_places(page)
+        place_recommendations_str = format_response_str_from_places(more_places, first_rec=ranking.shown - len(page) + 1)
+        return {
+            **update,
+            'messages': update['messages'] + [AIMessage(content=response.content + "\n\n" + place_recommendations_str)],
+            'place_ranking': ranking,
+        }
+    if type(last_message) == ToolMessage and "Failed" not in last_message.content:
+        valid_refs, invalid_refs, ranking, search_context = last_message.artifact
 
+        # Only the places we show are loaded back from the place store
+        page, ranking = next_ranked_page(ranking, NUM_RECS_TO_SHOW)
+        valid_places = await get_place_store().aget_places(page)
         place_recommendations_str = format_response_str_from_places(valid_places)
 
         new_message = AIMessage(content=response.content + "\n\n" + place_recommendations_str)
 
+        # This search's places replace the last search's
         return {
-            'valid_places': {p.display_name_text: p for p in valid_places},
-            'invalid_places': {p[0].display_name_text: p for p in invalid_places},
-            'messages': [new_message]
+            'valid_places': {ref.name: ref for ref in valid_refs},
+            'invalid_places': {ref.name: ref for ref in invalid_refs},
+            'place_ranking': ranking,
+            'last_search': search_context,
+            'messages': [without_artifact(last_message), new_message]
         }
+    if type(last_message) == ToolMessage:
+        return {'messages': [without_artifact(last_message), response]}
     # Otherwise, just return the agent's response
     return {
         'messages': [response]
@@ -128,18 +222,34 @@ def team_supervisor_node(state: AgentState):
 workflow = StateGraph(AgentState)
 
 # Separate tool node so we can pass in state
-tool_node = ToolNode([google_maps_text_search_and_filter])
-team_supervisor = llm.bind_tools([google_maps_text_search_and_filter])
+tool_node = ToolNode([google_maps_text_search_and_filter, show_more_places])
+team_supervisor = llm.bind_tools([google_maps_text_search_and_filter, show_more_places])
 
 workflow.add_node('state_updater_node', state_updater_node)
 workflow.add_node('datetime_extractor_node', datetime_extractor_node)
 workflow.add_node('maps_query_formulator_node', maps_query_formulator_node)
+workflow.add_node('combined_extractor_node', combined_extractor_node)
+workflow.add_node('join_extractions_node', join_extractions_node)
 workflow.add_node('team_supervisor_node', team_supervisor_node)
 workflow.add_node('google_maps_text_search_and_filter', tool_node)
 
-workflow.set_entry_point('state_updater_node')
+# The extraction nodes only read the user's messages, so they all start at once (fan-out)...
+EXTRACTION_NODES = ['state_updater_node', 'datetime_extractor_node', 'maps_query_formulator_node']
+
+def what_to_extract(state: AgentState, config):
+    if (config or {}).get("configurable", {}).get("extraction_mode", EXTRACTION_MODE) == "combined":
+        return ['combined_extractor_node']
+    # The datetime is only extracted once per conversation
+    if state["datetime_extracted"]:
+        return ['state_updater_node', 'maps_query_formulator_node']
+    return EXTRACTION_NODES
 
-workflow.add_edge('maps_query_formulator_node', 'team_supervisor_node')
+workflow.set_conditional_entry_point(what_to_extract, EXTRACTION_NODES + ['combined_extractor_node'])
+
+# ...and join_extractions_node runs once, in the step after all of them are done (fan-in)
+for node in EXTRACTION_NODES + ['combined_extractor_node']:
+    workflow.add_edge(node, 'join_extractions_node')
+workflow.add_edge('join_extractions_node', 'team_supervisor_node')
 
 def what_to_do_next_for_supervisor(state: AgentState, config):
     messages = state['messages']
@@ -161,30 +271,7 @@ workflow.add_conditional_edges(
     },
 )
 
-def what_to_do_next_for_state_updater(state: AgentState, config):
-    when_to_eat_specified = state["when_to_eat_specified"]
-    datetime_extracted = state["datetime_extracted"]
-
-    # If they specify when to eat, and datetime isnt yet extracted, extract datetime
-    if when_to_eat_specified:
-        if not datetime_extracted:
-            return "extract_datetime"
-        else:
-            return "go_to_maps_query_formulator"
-    else:
-        return "go_to_maps_query_formulator"
-
-workflow.add_conditional_edges(
-    'state_updater_node',
-    what_to_do_next_for_state_updater,
-    {
-        'extract_datetime': "datetime_extractor_node",
-        'go_to_maps_query_formulator': "maps_query_formulator_node"
-    }
-)
-
 workflow.add_edge('google_maps_text_search_and_filter', 'team_supervisor_node')
-workflow.add_edge('datetime_extractor_node', 'state_updater_node')
 
 food_finder_agent = workflow.compile()
 
@@ -192,6 +279,7 @@ food_finder_agent = workflow.compile()
 DEFAULT_AGENT_STATE: AgentState = {
     "when_to_eat_specified": False,
     "datetime_extracted": False,
+    "extracted_datetime": None,
     "preferred_price_level": "PRICE_LEVEL_UNSPECIFIED",
     "desired_star_rating": 0.0,
     "user_coordinates": None,
@@ -200,6 +288,8 @@ DEFAULT_AGENT_STATE: AgentState = {
     "user_preferences": UserPreferences(),
     "valid_places": {},
     "invalid_places": {},
+    "place_ranking": None,
+    "last_search": None,
     "found_place": False
 }
 
@@ -226,18 +316,22 @@ if __name__ == "__main__":
     AUSTIN_TEST_COORDINATES = (30.2672, -97.7431)
     initial_state = create_initial_state(user_input, AUSTIN_TEST_COORDINATES)
 
-    tool_called = False
-    for chunk in food_finder_agent.stream(initial_state):
-        for key, value in chunk.items():
-            print(f"Output from node '{key}':")
-            print("---")
-            if key == 'google_maps_text_search_and_filter':
-                print(value['messages'][0].content)
-                tool_called = True
-            elif key == 'team_supervisor_node':
-                if tool_called:
+    async def run():
+        tool_called = False
+        # The Places tool is async, so the graph has to be run with astream
+        async for chunk in food_finder_agent.astream(initial_state):
+            for key, value in chunk.items():
+                print(f"Output from node '{key}':")
+                print("---")
+                if key == 'google_maps_text_search_and_filter':
                     print(value['messages'][0].content)
+                    tool_called = True
+                elif key == 'team_supervisor_node':
+                    if tool_called:
+                        print(value['messages'][0].content)
+                    else:
+                        print(value['messages'])
                 else:
-                    print(value['messages'])
-            else:
-                print(value)
\ No newline at end of file
+                    print(value)
+
+    asyncio.run(run())
\ No newline at end of file
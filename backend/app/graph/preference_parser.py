@@ -0,0 +1,310 @@
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.schemas import DateTimeExtract, PreferenceWeight, StateUpdaterOutputFormat
+from app.graph.tools.geo import DIRECTIONS
+
+# Deterministic fast path for the state updater and datetime extractor. Messages that only state
+# their constraints plainly ("party of 8", "within 3 miles", "at 7pm", "vegetarian") are parsed
+# with regexes and a small lexicon. The LLM is skipped when every detected field is high-confidence
+# and nothing in the message is left unaccounted for, since anything the parser doesn't recognize
+# might be a preference only the LLM would pick up.
+
+PREFERENCE_FAST_PATH_ENABLED = os.environ.get("PREFERENCE_FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFERENCE_FAST_PATH_MIN_CONFIDENCE = float(os.environ.get("PREFERENCE_FAST_PATH_MIN_CONFIDENCE", 0.8))
+
+# Fields of StateUpdaterOutputFormat that hold a PreferenceWeight, rather than a raw value
+PREFERENCE_WEIGHT_FIELDS = {
+    name for name, field in StateUpdaterOutputFormat.model_fields.items() if field.annotation is PreferenceWeight
+}
+
+# Times the datetime extractor assumes for a meal (see DATETIME_EXTRACTOR_SYSTEM_PROMPT)
+MEAL_HOURS = {"breakfast": 9, "lunch": 12, "dinner": 18, "supper": 18, "tonight": 18}
+
+METERS_PER_UNIT = {"mile": 1609.3, "mi": 1609.3, "kilometer": 1000.0, "km": 1000.0, "meter": 1.0, "m": 1.0}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20,
+}
+NUMBER = r"(\d+(?:\.\d+)?|" + "|".join(NUMBER_WORDS) + r")"
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+CUISINES = {
+    "american": "American", "italian": "Italian", "mexican": "Mexican", "chinese": "Chinese",
+    "japanese": "Japanese", "thai": "Thai", "indian": "Indian", "asian": "Asian", "french": "French",
+    "korean": "Korean", "vietnamese": "Vietnamese", "mediterranean": "Mediterranean", "greek": "Greek",
+    "spanish": "Spanish", "middle eastern": "Middle Eastern", "tex-mex": "Tex-Mex", "cajun": "Cajun",
+    "bbq": "BBQ", "barbecue": "BBQ", "sushi": "Sushi", "pizza": "Pizza", "burgers?": "Burgers",
+    "seafood": "Seafood", "steak": "Steak", "ramen": "Ramen", "tacos?": "Tacos", "pho": "Pho",
+}
+
+# Lowercase, like the restrictions and scoring check for them
+DIETARY_REQUESTS = {
+    "vegetarian": "vegetarian", "vegan": "vegan", "gluten[- ]free": "gluten-free", "halal": "halal",
+    "kosher": "kosher", "dairy[- ]free": "dairy-free", "lactose[- ]free": "dairy-free",
+    "nut[- ]free": "nut-free", "pescatarian": "pescatarian", "keto": "keto",
+}
+
+# Longer phrases first, so "kids menu" isn't taken as family friendly
+BOOLEAN_PREFERENCES = [
+    (r"(?:kids'?|children'?s|childrens) menu", "wants_childrens_menu"),
+    (r"(?:family|kid|child)[- ]friendly|with (?:my |the )?(?:kids|children)", "wants_family_friendly"),
+    (r"free parking", "wants_free_parking"),
+    (r"outdoor seating|outside seating|outdoor dining|patio|(?:eat|sit) outside", "wants_outdoor_seating"),
+    (r"live music|live band", "wants_live_music"),
+    (r"desserts?", "wants_dessert"),
+    (r"beers?|brewery", "wants_beer"),
+    (r"wine", "wants_wine"),
+    (r"brunch", "wants_brunch"),
+    (r"cocktails?", "wants_cocktails"),
+    (r"coffee", "wants_coffee"),
+]
+
+# The heuristic the state updater is given for weights, by what the user said in the same clause
+WEIGHT_QUALIFIERS = [
+    (1.0, r"\b(?:need|needs|must|have to|has to|require|required|requires)\b"),
+    (0.3, r"\b(?:nice|bonus|ideally|if possible|would be great|plus)\b"),
+    (0.8, r"\b(?:love|really want|strongly|definitely|really)\b"),
+    (0.5, r"\b(?:want|would like|'d like|prefer|preferably|looking for)\b"),
+]
+NEGATION = re.compile(r"\b(?:no|not|don't|dont|do not|without|never|isn't|aren't|doesn't|won't|avoid|skip)\b")
+CLAUSE_BOUNDARY = re.compile(r"[.,;!?]|\bbut\b")
+
+# Words that don't carry a preference by themselves
+FILLER_WORDS = set("""
+a about after along also am an and any anything anywhere are around as at be before best bit bonus
+but by can could definitely do during dish dishes eat eating else find food foods for from get go going good
+grab great has have having he her here hi hungry i i'd i'll i'm id ideally if im in is it it's its
+just like looking love lovely me meal menu must my myself near nearby need needs nice of on options
+or our out place places please plus points possible prefer preferably really require required
+restaurant restaurants selection serves serving she some somewhere something spot spots strongly
+that the their them there they thing this to up us want wanting wants was we we'd we'll we're what
+where which who with would you your
+""".split())
+
+
+class ParsedField(NamedTuple):
+    """A value the parser found, with how sure it is (0 to 1), and the weight for PreferenceWeight fields"""
+    value: Any
+    confidence: float
+    weight: Optional[float] = None
+
+class ParsedPreferences(NamedTuple):
+    fields: Dict[str, ParsedField]
+    # When the user wants to eat, if they said
+    dt: Optional[ParsedField]
+    # Words the parser couldn't account for
+    unparsed_words: Tuple[str, ...]
+
+    def is_confident(self, min_confidence: float = PREFERENCE_FAST_PATH_MIN_CONFIDENCE) -> bool:
+        """Whether the parse can stand in for the LLM's"""
+        detected = list(self.fields.values()) + ([self.dt] if self.dt else [])
+        return not self.unparsed_words and all(field.confidence >= min_confidence for field in detected)
+
+    def state_updater_output(self) -> StateUpdaterOutputFormat:
+        values = {}
+        for name, field in self.fields.items():
+            if name in PREFERENCE_WEIGHT_FIELDS:
+                default_weight = StateUpdaterOutputFormat.model_fields[name].default.weight
+                values[name] = PreferenceWeight(value=field.value, weight=field.weight if field.weight is not None else default_weight)
+            else:
+                values[name] = field.value
+        return StateUpdaterOutputFormat(when_to_eat_specified=self.dt is not None, **values)
+
+    def datetime_extract(self) -> Optional[DateTimeExtract]:
+        return DateTimeExtract(dt=self.dt.value) if self.dt else None
+
+
+def _number(text: str) -> float:
+    return NUMBER_WORDS[text] if text in NUMBER_WORDS else float(text)
+
+def _price_level(dollars: float) -> str:
+    # The price level mapping in STATE_UPDATER_SYSTEM_PROMPT
+    if dollars <= 10:
+        return "PRICE_LEVEL_INEXPENSIVE"
+    if dollars <= 30:
+        return "PRICE_LEVEL_MODERATE"
+    if dollars <= 60:
+        return "PRICE_LEVEL_EXPENSIVE"
+    return "PRICE_LEVEL_VERY_EXPENSIVE"
+
+class _Scanner:
+    """Matches patterns against the message, blanking out what each match used up"""
+    def __init__(self, text: str):
+        self.text = text
+        self.remaining = text
+
+    def scan(self, pattern: str) -> List[re.Match]:
+        matches = list(re.finditer(r"(?<![\w-])(?:" + pattern + r")(?![\w-])", self.remaining))
+        for match in matches:
+            start, end = match.span()
+            self.remaining = self.remaining[:start] + " " * (end - start) + self.remaining[end:]
+        return matches
+
+    def _clause_start(self, position: int) -> int:
+        boundaries = [m.end() for m in CLAUSE_BOUNDARY.finditer(self.text, 0, position)]
+        return boundaries[-1] if boundaries else 0
+
+    def weight(self, match: re.Match) -> Optional[float]:
+        """The weight the qualifiers in the match's clause imply"""
+        start = self._clause_start(match.start())
+        end = CLAUSE_BOUNDARY.search(self.text, match.end())
+        clause = self.text[start:end.start() if end else len(self.text)]
+        for weight, pattern in WEIGHT_QUALIFIERS:
+            if re.search(pattern, clause):
+                return weight
+        return None
+
+    def negated(self, match: re.Match) -> bool:
+        """Whether a negation comes before the match in its clause (and isn't part of another match)"""
+        return NEGATION.search(self.remaining[self._clause_start(match.start()):match.start()]) is not None
+
+
+def parse_preferences(message: str, now: datetime | None = None) -> ParsedPreferences:
+    """Parse the preferences (StateUpdaterOutputFormat fields) and time to eat stated in the message"""
+    now = now or datetime.now()
+    scanner = _Scanner(message.lower().replace("’", "'"))
+    fields: Dict[str, ParsedField] = {}
+
+    def found(name: str, value: Any, confidence: float, match: re.Match, weighted: bool = False):
+        if scanner.negated(match):
+            # e.g. "no outdoor seating needed": leave it to the LLM
+            confidence = min(confidence, 0.3)
+        if name in fields and fields[name].value != value:
+            # Said two different things
+            confidence = min(confidence, 0.3)
+        fields[name] = ParsedField(value, confidence, scanner.weight(match) if weighted else None)
+
+    # Length of stay, before distances and times take the numbers. "within 20 minutes" or
+    # "10 minutes away" is a travel time, which the state updater handles differently, and
+    # "in 2 hours" or "2 hours from now" is when to eat
+    for m in scanner.scan(r"(?:within|under|less than|in) " + NUMBER + r" ?(?:minutes?|mins?|hours?|hrs?)|" + NUMBER + r" ?(?:minutes?|mins?) (?:away|drive|walk|ride)|" + NUMBER + r" ?(?:minutes?|mins?|hours?|hrs?) from now"):
+        found("length_of_stay", None, 0.0, m)
+    for m in scanner.scan(r"(?:an |one )?hour and a half|half an hour|half hour"):
+        found("length_of_stay", 30 if m.group(0).startswith("half") else 90, 0.95, m)
+    for m in scanner.scan(r"(?:for |stay )?(?:about |around )?" + NUMBER + r" ?(hours?|hrs?|minutes?|mins?)"):
+        minutes = _number(m.group(1)) * (60 if m.group(2).startswith("h") else 1)
+        found("length_of_stay", int(minutes), 0.9 if m.group(0).startswith(("for", "stay")) else 0.8, m)
+
+    # Distance
+    for m in scanner.scan(r"(?:within|under|less than|no more than|not more than|at most|up to|max(?:imum)?(?: of)?) (?:about |around )?" + NUMBER + r" ?(miles?|mi|kilometers?|km|meters?|m|blocks?)(?: away| of (?:me|here|us))?"):
+        unit = m.group(2).rstrip("s")
+        if unit == "block":
+            found("desired_max_distance_meters", None, 0.0, m)
+        else:
+            found("desired_max_distance_meters", round(_number(m.group(1)) * METERS_PER_UNIT[unit], 1), 0.95, m)
+
+    # Price
+    for m in scanner.scan(r"(?:under|less than|below|at most|no more than|max(?:imum)?|up to|around|about) \$ ?(\d+)(?: (?:per|a|each) (?:person|head))?"):
+        found("preferred_price_level", _price_level(float(m.group(1))), 0.9, m)
+    for m in scanner.scan(r"\$ ?(\d+) ?(?:-|to) ?\$? ?(\d+)(?: (?:per|a|each) (?:person|head))?"):
+        found("preferred_price_level", _price_level((float(m.group(1)) + float(m.group(2))) / 2), 0.9, m)
+    for m in scanner.scan(r"cheap|cheaper|inexpensive|budget"):
+        found("preferred_price_level", "PRICE_LEVEL_INEXPENSIVE", 0.85, m)
+    for m in scanner.scan(r"affordable|pricey|expensive|fancy|upscale|high[- ]end|fine dining"):
+        found("preferred_price_level", None, 0.0, m)
+
+    # Rating and number of ratings
+    for m in scanner.scan(r"(?:at least |above |over |minimum )?(\d(?:\.\d)?) ?\+? ?stars?|rated (?:at least |above |over )?(\d(?:\.\d)?)(?: stars?)?(?: or (?:more|higher|better|above))?"):
+        rating = float(m.group(1) or m.group(2))
+        # desired_star_rating is an int
+        found("desired_star_rating", int(rating), 0.9 if rating.is_integer() and rating <= 5 else 0.0, m)
+    for m in scanner.scan(r"(?:at least|over|more than|minimum of) (\d[\d,]*) (?:ratings|reviews)"):
+        found("desired_minimum_num_ratings", int(m.group(1).replace(",", "")), 0.9, m, weighted=True)
+
+    # Party size
+    for m in scanner.scan(r"(?:party|group|table|reservation) (?:of|for) " + NUMBER + r"(?: people| persons| guests)?|" + NUMBER + r" (?:people|persons|guests|adults|of us)"):
+        found("party_size", int(_number(m.group(1) or m.group(2))), 0.95, m)
+    for m in scanner.scan(r"with " + NUMBER + r" (?:other )?(?:friends|others|people|coworkers|colleagues|family members)"):
+        found("party_size", int(_number(m.group(1))) + 1, 0.85, m)
+    for m in scanner.scan(r"with (?:my|a) (?:friend|wife|husband|partner|girlfriend|boyfriend|date|mom|dad|coworker)"):
+        found("party_size", 2, 0.8, m)
+    for m in scanner.scan(r"by myself|alone|just me|solo"):
+        found("party_size", 1, 0.9, m)
+
+    # Direction, relative to the user
+    direction = "|".join(sorted(DIRECTIONS, key=len, reverse=True))
+    for m in scanner.scan(r"(" + direction + r") (?:of|from) (?:me|here|us|where i am)|(?:to the|head|go|going) (" + direction + r")"):
+        found("preferred_direction", DIRECTIONS[m.group(1) or m.group(2)], 0.9, m)
+
+    # Lexicon preferences. The boolean ones come first, since "brunch" is also a meal
+    for pattern, name in BOOLEAN_PREFERENCES:
+        for m in scanner.scan(pattern):
+            found(name, True, 0.9, m, weighted=True)
+    dietary = [(DIETARY_REQUESTS[p], m) for p in DIETARY_REQUESTS for m in scanner.scan(p)]
+    if dietary:
+        found("dietary_requests", sorted({value for value, _ in dietary}), 0.95, dietary[0][1], weighted=True)
+    cuisines = [(CUISINES[p], m) for p in CUISINES for m in scanner.scan(p)]
+    if cuisines:
+        found("desired_cuisines", sorted({value for value, _ in cuisines}), 0.9, cuisines[0][1], weighted=True)
+
+    dt = _parse_when(scanner, now)
+
+    unparsed_words = tuple(word for word in re.findall(r"[a-z0-9$]+(?:'[a-z]+)?", scanner.remaining) if word not in FILLER_WORDS)
+    return ParsedPreferences(fields, dt, unparsed_words)
+
+def _parse_when(scanner: _Scanner, now: datetime) -> Optional[ParsedField]:
+    """When the user wants to eat, with the datetime extractor's assumptions for whatever they left out"""
+    day, hour, minute = None, None, 0
+    confidence = 0.95
+
+    # Day
+    if scanner.scan(r"today|tonight"):
+        day = now.date()
+    for m in scanner.scan(r"tomorrow|the day after tomorrow"):
+        day = now.date() + timedelta(days=2 if m.group(0).startswith("the day after") else 1)
+    for m in scanner.scan(r"(this |on |next |coming )?(" + "|".join(WEEKDAYS) + r")"):
+        days_ahead = (WEEKDAYS.index(m.group(2)) - now.weekday()) % 7
+        day = now.date() + timedelta(days=days_ahead)
+        if m.group(1) == "next ":
+            # "next Friday" could be this week's or next week's
+            confidence = min(confidence, 0.5)
+
+    # Meal
+    meals = [m.group(0) for m in scanner.scan(r"breakfast|lunch(?: ?time)?|dinner(?: ?time)?|supper")]
+    meal_hours = {MEAL_HOURS[meal.replace("time", "").strip()] for meal in meals}
+    if "tonight" in scanner.text:
+        meal_hours.add(MEAL_HOURS["tonight"])
+    if len(meal_hours) > 1:
+        confidence = min(confidence, 0.5)
+
+    # Time of day
+    times = scanner.scan(r"(?:at |around |by |about )?(\d{1,2})(?::(\d{2}))? ?(am|pm|a\.m\.|p\.m\.)|(?:at |around |by |about )(\d{1,2})(?::(\d{2}))?|noon|midday")
+    if len(times) > 1:
+        confidence = min(confidence, 0.5)
+    for m in times:
+        if m.group(0) in ("noon", "midday"):
+            hour, minute = 12, 0
+            continue
+        if m.group(1):
+            hour, minute = int(m.group(1)) % 12, int(m.group(2) or 0)
+            if m.group(3).startswith("p"):
+                hour += 12
+        else:
+            hour, minute = int(m.group(4)), int(m.group(5) or 0)
+            if hour < 12:
+                # No am/pm: go by the meal, or guess the evening for 1 to 6
+                if meal_hours == {MEAL_HOURS["breakfast"]}:
+                    pass
+                elif meal_hours or 1 <= hour <= 6:
+                    hour += 12
+                else:
+                    confidence = min(confidence, 0.6)
+        if hour > 23 or minute > 59:
+            return ParsedField(None, 0.0)
+
+    if day is None and hour is None and not meal_hours:
+        return None
+    if hour is None:
+        if meal_hours:
+            hour = min(meal_hours)
+        else:
+            # Just a day: the datetime extractor deduces the meal from the food
+            hour = MEAL_HOURS["dinner"]
+            confidence = min(confidence, 0.5)
+    day = day or now.date()
+    return ParsedField(datetime(day.year, day.month, day.day, hour, minute), confidence)
@@ -11,6 +11,13 @@ YOUR ANSWER: Spicy Vegetarian Food in Sydney, Australia
 
 USER REQUEST: I am at central park in NY. I am with my dog, and I am getting hungry for an afternoon snack. Im feeling pizza, a pizza place I havent been to before. I dont want to walk very far away from where I currently am.
 YOUR ANSWER: pizza near Central Park
+
+If the user would be happy with more than one kind of food, give one query for each kind, on separate lines (at most 3), and nothing else. For example:
+
+USER REQUEST: My girlfriend and I want dinner tonight in downtown Austin, we are thinking sushi or Thai.
+YOUR ANSWER:
+Sushi in downtown Austin
+Thai food in downtown Austin
 """
 
 TEAM_SUPERVISOR_SYSTEM_PROMPT = """
@@ -18,6 +25,7 @@ You are one of the core assistants amongst a team of other assistants tasked wit
 
 You have access to a tool which can perform a text search, using Google's Places API. To use this tool, you must pass in the api_query you receive from another agent, which is {api_query}. This tool will do everything you need to get back a prioritized list of places according to the user's preferences, which you will use to communicate back to the user.
 The places that fit the user's preferences will be stored, where you can access particular location later, based on place name.
+If the user asks to see more places from the last search, use the show_more_places tool, which gives back the next best places without searching Google Maps again. Only search again if they want something different.
 
 Make the tone of your responses towards the user friendly and helpful. Suggest that you are happy to help them get more information on particular places or show additional places that you've found from the tool call.
 
@@ -41,6 +49,8 @@ in the user's message:
 - Want -> 0.5
 - Nice to have -> 0.3
 
+If the user has sent more than one message, a later message overrides what an earlier one said about the same preference.
+
 Here are the keys of the JSON, or user preferences to look for, and how youll need to format the information to extract the value for each. 
 Fill out each one, if you see it in the message, otherwise, you can use the default values.
 - `when_to_eat_specified`: Format this as a boolean, representing whether the user has specified when they would like to eat.
@@ -103,4 +113,14 @@ An example output, thus, would be:
     },
     ...
 }
-"""
\ No newline at end of file
+"""
+# The state updater's instructions, plus the datetime extractor's and maps query formulator's, for
+# extracting everything in one call (the current date and time is given in a separate system message)
+COMBINED_EXTRACTOR_SYSTEM_PROMPT = STATE_UPDATER_SYSTEM_PROMPT + """
+In the same JSON, also fill out these two keys:
+- `dt`: Format this as a datetime (e.g. "2024-09-24T19:00:00"), representing when the user would like to eat, based on the current date and time given to you. Only fill this in if `when_to_eat_specified` is true. If they dont specify specifics, assume breakfast at 9:00 AM, lunch at 12:00 PM, and dinner at 6:00 PM. If they are very general and just specify a day, deduce time (breakfast, lunch, or dinner) based on food preference.
+- `maps_query`: Format this as a string, which is a simple search query for Google maps (about 2 to 6 words) that can give back a relatively wide pool of places that may be of interest to the user. Leave out details such as direction of travel, party size, cost, and desired ratings.
+    - example value: "Spicy Vegetarian Food in Sydney, Australia"
+    If the user would be happy with more than one kind of food, give one query for each kind, on separate lines (at most 3).
+    - example value: "Sushi in downtown Austin\nThai food in downtown Austin"
+"""
@@ -1 +1,5 @@
-from .places_search import google_maps_text_search_and_filter, check_if_user_stay_fits_open_hours, calculate_place_score, filter_places
+from .places_search import google_maps_text_search_and_filter, show_more_places, calculate_place_score, filter_places, split_valid_places, merge_prefetched_places
+from .opening_hours import check_if_user_stay_fits_open_hours
+from .restrictions import compile_restriction_plan
+from .invalid_reasons import InvalidReason, format_invalid_reasons
+from .scoring import PlaceFeatures, encode_preferences, score_places, rank_places, top_k_indices, first_page_ranking, next_ranked_page, extend_ranking
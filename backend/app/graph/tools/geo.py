@@ -0,0 +1,108 @@
+import math
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+# Helpers for the locationBias/locationRestriction shapes the Places API uses (see get_location_bias)
+
+EARTH_RADIUS_METERS = 6_371_008.8
+METERS_PER_DEGREE_LATITUDE = 111_320.0
+
+def haversine_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two coordinates, in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+def distances_meters(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Vectorized haversine_meters, from one coordinate to many"""
+    phi1 = math.radians(latitude)
+    phi2 = np.radians(latitudes)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(longitudes - longitude)
+    a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+def offset_point(latitude: float, longitude: float, north_meters: float, east_meters: float) -> Tuple[float, float]:
+    """The coordinate north_meters north and east_meters east of a point (equirectangular, fine at search distances)"""
+    d_lat = north_meters / METERS_PER_DEGREE_LATITUDE
+    d_lon = east_meters / (METERS_PER_DEGREE_LATITUDE * max(math.cos(math.radians(latitude)), 0.01))
+    return latitude + d_lat, longitude + d_lon
+
+# Unit (north, east) vectors of the 8 compass directions
+COMPASS_DIRECTIONS = {
+    "N": (1, 0), "NE": (1, 1), "E": (0, 1), "SE": (-1, 1),
+    "S": (-1, 0), "SW": (-1, -1), "W": (0, -1), "NW": (1, -1),
+}
+
+# Abbreviation of each compass direction's name
+DIRECTIONS = {
+    "north": "N", "south": "S", "east": "E", "west": "W",
+    "northeast": "NE", "northwest": "NW", "southeast": "SE", "southwest": "SW",
+}
+
+def direction_rectangle(latitude: float, longitude: float, direction: str, distance_meters: float) -> Dict[str, Any]:
+    """The rectangle shape covering the area in a compass direction from a point, up to distance_meters away:
+    - N/E/S/W: a square reaching distance_meters that way, centered on the point across the other axis
+    - NE/SE/SW/NW: a square with the point at one corner, and the opposite corner distance_meters away"""
+    north, east = COMPASS_DIRECTIONS[direction.upper()]
+    if north and east:
+        side = distance_meters / math.sqrt(2)
+        corner = offset_point(latitude, longitude, north * side, east * side)
+        lats, lons = (latitude, corner[0]), (longitude, corner[1])
+    else:
+        # Opposite corners: half the distance to one side of the point, and the distance ahead plus
+        # half of it to the other side (the sideways axis is (east, north))
+        half = distance_meters / 2
+        near = offset_point(latitude, longitude, -east * half, -north * half)
+        far = offset_point(latitude, longitude, north * distance_meters + east * half, east * distance_meters + north * half)
+        lats, lons = (near[0], far[0]), (near[1], far[1])
+    return {
+        'rectangle': {
+            'low': {'latitude': min(lats), 'longitude': min(lons)},
+            'high': {'latitude': max(lats), 'longitude': max(lons)},
+        }
+    }
+
+def shape_bounding_box(shape: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a circle or rectangle shape"""
+    if 'circle' in shape:
+        center = shape['circle']['center']
+        radius = float(shape['circle']['radius'])
+        d_lat = radius / METERS_PER_DEGREE_LATITUDE
+        d_lon = radius / (METERS_PER_DEGREE_LATITUDE * max(math.cos(math.radians(center['latitude'])), 0.01))
+        return (center['latitude'] - d_lat, center['longitude'] - d_lon, center['latitude'] + d_lat, center['longitude'] + d_lon)
+    low = shape['rectangle']['low']
+    high = shape['rectangle']['high']
+    return (low['latitude'], low['longitude'], high['latitude'], high['longitude'])
+
+def point_in_shape(latitude: float, longitude: float, shape: Dict[str, Any]) -> bool:
+    if 'circle' in shape:
+        center = shape['circle']['center']
+        return haversine_meters(center['latitude'], center['longitude'], latitude, longitude) <= float(shape['circle']['radius'])
+    min_lat, min_lon, max_lat, max_lon = shape_bounding_box(shape)
+    return min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon
+
+def bounding_rectangle(shape: Dict[str, Any]) -> Dict[str, Any]:
+    """The rectangle shape around a circle or rectangle shape"""
+    min_lat, min_lon, max_lat, max_lon = shape_bounding_box(shape)
+    return {
+        'rectangle': {
+            'low': {'latitude': min_lat, 'longitude': min_lon},
+            'high': {'latitude': max_lat, 'longitude': max_lon},
+        }
+    }
+
+def shape_contains(outer: Dict[str, Any], inner: Dict[str, Any]) -> bool:
+    """Whether the `outer` shape fully contains the `inner` shape"""
+    if 'circle' in outer and 'circle' in inner:
+        outer_center = outer['circle']['center']
+        inner_center = inner['circle']['center']
+        center_distance = haversine_meters(outer_center['latitude'], outer_center['longitude'], inner_center['latitude'], inner_center['longitude'])
+        return center_distance + float(inner['circle']['radius']) <= float(outer['circle']['radius'])
+    # Otherwise, check the corners of the inner shape's bounding box (conservative for an inner circle)
+    min_lat, min_lon, max_lat, max_lon = shape_bounding_box(inner)
+    corners = [(min_lat, min_lon), (min_lat, max_lon), (max_lat, min_lon), (max_lat, max_lon)]
+    return all(point_in_shape(lat, lon, outer) for lat, lon in corners)
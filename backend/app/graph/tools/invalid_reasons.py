@@ -0,0 +1,39 @@
+from typing import Any, Iterable, NamedTuple
+
+class InvalidReason(NamedTuple):
+    """Why a place failed one of the user's restrictions. Stored as a short code (plus the value
+    the message needs, if any), and only turned into text by format_invalid_reasons when shown."""
+    code: str
+    detail: Any = None
+
+INVALID_REASON_MESSAGES = {
+    "no_large_groups": "This place has indicates they do not accomodate large groups (6 or more).\n",
+    "too_few_ratings": "This place has less than your desired {detail} ratings.\n",
+    "not_vegan": "This place does not serve vegan food.\n",
+    "not_vegetarian": "This place does not serve vegetarian food.\n",
+    "not_family_friendly": "This place has not indicated itself as family friendly.\n",
+    "no_childrens_menu": "This place does not have a childrens menu.\n",
+    "no_free_parking": "This place does not have a free parking option.\n",
+    "no_outdoor_seating": "This place does not have outdoor seating.\n",
+    "no_live_music": "This place does not have live music.\n",
+    "no_dessert": "This place does not have dessert.\n",
+    "no_beer": "This place does not have beer.\n",
+    "no_wine": "This place does not have wine.\n",
+    "no_brunch": "This place does not have brunch.\n",
+    "no_cocktails": "This place does not have cocktails.\n",
+    "no_coffee": "This place does not have coffee.\n",
+    # Opening hours
+    "no_hours_info": "No opening hours information available for this place.",
+    "closed_on_day": "This place is closed on the day you want to visit.",
+    "closes_before_stay_ends": "This place will close at {detail} before you finish your stay. Consider shortening your visit or coming earlier.",
+    "closed_at_time": "This place will be closed when you want to visit. The opening hours for this day are: {detail}. Please adjust your visit time accordingly.",
+}
+
+def format_invalid_reason(reason: InvalidReason) -> str:
+    code, detail = reason
+    return INVALID_REASON_MESSAGES[code].format(detail=detail)
+
+def format_invalid_reasons(reasons: Iterable[InvalidReason]) -> str:
+    """Human readable text for a place's invalid reasons (reasons may also come back from a
+    checkpoint as plain [code, detail] lists)"""
+    return "".join(format_invalid_reason(reason) for reason in reasons)
@@ -0,0 +1,127 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, time, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.schemas import Place
+from app.schemas.schema import MINUTES_PER_DAY, MINUTES_PER_WEEK
+from app.graph.tools.invalid_reasons import InvalidReason, format_invalid_reason
+
+NO_HOURS_INFO = InvalidReason("no_hours_info")
+CLOSED_ON_DAY = InvalidReason("closed_on_day")
+
+def get_datetime_for_place_hours(day: int, hour: int, minute: int) -> datetime:
+    """Get a datetime object for the start of the place's hours on a given day.
+    Note: In the Google API response, the day is 0 indexed from Sunday"""
+    # Adjust day to match Python's datetime (where Monday is 0)
+    adjusted_day = (day - 1) % 7
+
+    # Get the next occurrence of the specified day
+    today = datetime.now()
+    days_ahead = adjusted_day - today.weekday()
+    if days_ahead <= 0:
+        days_ahead += 7
+
+    next_day = today + timedelta(days=days_ahead)
+
+    # Combine the date with the time
+    dt = datetime.combine(next_day.date(), time(hour, minute))
+    return dt
+
+def format_minute_of_day(minute: int) -> str:
+    """Same as time.strftime('%I:%M %p'), for a minute of the day"""
+    minute = minute % MINUTES_PER_DAY
+    hour, minute = divmod(minute, 60)
+    return f"{(hour % 12) or 12:02d}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+def user_stay_in_week_minutes(user_stay: Tuple[datetime, int]) -> Tuple[int, float]:
+    """The user's weekday, and the minute of the week their stay starts at.
+    Note: like the place periods, this lines the weekday up with the day number in the Google API response"""
+    user_start, _ = user_stay
+    weekday = user_start.weekday()
+    start_minute = (
+        weekday * MINUTES_PER_DAY
+        + user_start.hour * 60
+        + user_start.minute
+        + user_start.second / 60
+        + user_start.microsecond / 60_000_000
+    )
+    return weekday, start_minute
+
+def _day_range(opens: Sequence[int], weekday: int) -> Tuple[int, int]:
+    """Index range of the intervals that open on this weekday"""
+    day_start = weekday * MINUTES_PER_DAY
+    return bisect_left(opens, day_start), bisect_left(opens, day_start + MINUTES_PER_DAY)
+
+def check_open_hours(place: Place, user_stay: Tuple[datetime, int]) -> Optional[InvalidReason]:
+    """Check the user's stay against the place's opening hours, returning None if it fits,
+    otherwise the reason it does not. Only periods that open on the user's day (or the next day)
+    are considered, and the stay has to start inside one of them and end before it closes."""
+    hours = place.regular_opening_hours
+    if not hours or not hours.periods:
+        return NO_HOURS_INFO
+
+    opens, closes = hours.week_opens, hours.week_closes
+    weekday, start_minute = user_stay_in_week_minutes(user_stay)
+    today_lo, today_hi = _day_range(opens, weekday)
+    tomorrow_lo, tomorrow_hi = _day_range(opens, (weekday + 1) % 7)
+    if today_lo == today_hi and tomorrow_lo == tomorrow_hi:
+        return CLOSED_ON_DAY
+
+    # The last period that opened at or before the start of the stay, today
+    i = bisect_right(opens, start_minute, today_lo, today_hi) - 1
+    if i >= today_lo and start_minute < closes[i]:
+        if start_minute + user_stay[1] <= closes[i]:
+            return None
+        return InvalidReason("closes_before_stay_ends", format_minute_of_day(closes[i]))
+
+    # If we've reached this point, the user's stay doesn't fit any period
+    day_indices = list(range(today_lo, today_hi)) + list(range(tomorrow_lo, tomorrow_hi))
+    opening_hours_str = ', '.join(sorted(set(f"{format_minute_of_day(opens[i])} - {format_minute_of_day(closes[i])}" for i in day_indices)))
+    return InvalidReason("closed_at_time", opening_hours_str)
+
+def check_if_user_stay_fits_open_hours(place: Place, user_stay: Tuple[datetime, int]) -> Tuple[bool, str]:
+    reason = check_open_hours(place, user_stay)
+    if reason is None:
+        return True, ""
+    return False, format_invalid_reason(reason)
+
+
+class OpeningHoursBatch:
+    """The opening hours of a whole candidate set, flattened into parallel arrays
+    (place index, open minute, close minute), so a user's stay can be checked against every
+    place with a few array operations."""
+    def __init__(self, places: Sequence[Place]):
+        self.places = list(places)
+        place_index, opens, closes = [], [], []
+        for i, place in enumerate(self.places):
+            hours = place.regular_opening_hours
+            if hours and hours.periods:
+                place_index.extend([i] * len(hours.week_opens))
+                opens.extend(hours.week_opens)
+                closes.extend(hours.week_closes)
+        self.place_index = np.array(place_index, dtype=np.int64)
+        self.opens = np.array(opens, dtype=np.float64)
+        self.closes = np.array(closes, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def fits(self, user_stay: Tuple[datetime, int]) -> np.ndarray:
+        """Boolean array: whether the user's stay fits each place's opening hours"""
+        weekday, start_minute = user_stay_in_week_minutes(user_stay)
+        day_start = weekday * MINUTES_PER_DAY
+        containing = (
+            (self.opens >= day_start)
+            & (self.opens <= start_minute)
+            & (start_minute < self.closes)
+            & (start_minute + user_stay[1] <= self.closes)
+        )
+        return np.bincount(self.place_index[containing], minlength=len(self.places)) > 0
+
+    def check(self, user_stay: Tuple[datetime, int]) -> List[Optional[InvalidReason]]:
+        """Same as check_open_hours for every place (the reason, with its message details, is only
+        worked out for places that don't fit)"""
+        fits = self.fits(user_stay)
+        return [None if fit else check_open_hours(place, user_stay) for place, fit in zip(self.places, fits)]
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.schemas import Place
+from app.graph.tools.geo import shape_bounding_box, point_in_shape, shape_contains
+from app.graph.tools.places_cache import normalize_search_request, make_cache_key, PLACES_CACHE_FRESH_TTL_SECONDS
+
+import logging
+
+# Where parsed places are kept between turns (and restarts)
+PLACE_STORE_PATH = os.environ.get("PLACE_STORE_PATH", "places.db")
+# A previous search only counts as covering an area if it is this recent (no older than what the search
+# cache serves without revalidating, see search_first_page)...
+PLACE_STORE_COVERAGE_MAX_AGE_SECONDS = float(os.environ.get("PLACE_STORE_COVERAGE_MAX_AGE_SECONDS", PLACES_CACHE_FRESH_TTL_SECONDS))
+# ...and still has this many places inside the requested area
+PLACE_STORE_COVERAGE_MIN_PLACES = int(os.environ.get("PLACE_STORE_COVERAGE_MIN_PLACES", 5))
+# Places and searches older than this are pruned in the background (0 turns pruning off). As long as
+# checkpoints are kept, since a conversation's places are loaded back from the store
+PLACE_STORE_MAX_AGE_SECONDS = float(os.environ.get("PLACE_STORE_MAX_AGE_SECONDS", 30 * 24 * 60 * 60))
+PLACE_STORE_PRUNE_INTERVAL_SECONDS = float(os.environ.get("PLACE_STORE_PRUNE_INTERVAL_SECONDS", 60 * 60))
+
+LOCATION_SHAPE_KEYS = ('locationBias', 'locationRestriction')
+
+def _search_shape(body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    for shape_key in LOCATION_SHAPE_KEYS:
+        if body.get(shape_key):
+            return body[shape_key]
+    return None
+
+def _requested_fields(field_mask: str) -> Set[str]:
+    """The top-level place fields (API names) a field mask asks for, for searchText ("places.rating")
+    and Place Details ("rating") masks alike"""
+    fields = {f.strip().removeprefix("places.").split(".")[0] for f in field_mask.split(",")}
+    if "*" in fields:
+        return {field.alias or name for name, field in Place.model_fields.items()}
+    return fields
+
+def _search_query_key(body: Dict[str, Any], field_mask: str) -> str:
+    """Key for everything about a search except where it was made"""
+    normalized_body = normalize_search_request(body)
+    for shape_key in LOCATION_SHAPE_KEYS:
+        normalized_body.pop(shape_key, None)
+    return make_cache_key(normalized_body, field_mask)
+
+
+class PlaceStore:
+    """Local store of every Place we have parsed, keyed by Place.name (the Places API id).
+    Locations are indexed with an SQLite R*Tree, so "places within R meters of (lat, lon)" and
+    rectangle queries are answered without calling Google.
+    Each search we make is also recorded (query, area searched, when, and which places came back),
+    which lets the tool skip the upstream call when an earlier, recent search already covers the
+    requested area."""
+    def __init__(self, path: str = PLACE_STORE_PATH):
+        self.path = path
+        # The async code calls the store from worker threads (asyncio.to_thread), which share the connection,
+        # so each write holds the lock for its transaction
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS places (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                types TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                place TEXT NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS places_location_index USING rtree(
+                id, min_lat, max_lat, min_lon, max_lon
+            );
+            CREATE TABLE IF NOT EXISTS searches (
+                id INTEGER PRIMARY KEY,
+                query_key TEXT NOT NULL,
+                shape TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                place_names TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_searches_query_key ON searches (query_key, fetched_at);
+        """)
+        # Reads go through their own connection, so (with WAL) they don't wait on a write transaction.
+        # An in-memory database can't be opened twice, so it reads through the one connection
+        if path == ":memory:":
+            self._read_lock, self._read_conn = self._lock, self._conn
+        else:
+            self._read_lock = threading.Lock()
+            self._read_conn = sqlite3.connect(path, check_same_thread=False)
+            self._read_conn.execute("PRAGMA query_only=ON")
+
+    def _read(self, sql: str, params: Iterable[Any]) -> List[Tuple[Any, ...]]:
+        with self._read_lock:
+            return self._read_conn.execute(sql, list(params)).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._read_conn is not self._conn:
+                self._read_conn.close()
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+    def upsert_places(self, places: Iterable[Place], fetched_at: Optional[float] = None, field_mask: Optional[str] = None) -> None:
+        """Store places. A place that is already stored keeps the fields the response didn't ask for, so a
+        lean search result doesn't drop the details fetched for it earlier (see merge_place_details).
+        The fields field_mask asked for are all replaced, since Google leaves out the ones that are false
+        or empty (without a field mask, only the fields the places came with are)."""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        places = list(places)
+        requested = _requested_fields(field_mask) if field_mask is not None else set()
+        with self._lock, self._conn:
+            stored = self._stored_place_fields([place.name for place in places])
+            for place in places:
+                lat, lon = place.location.latitude, place.location.longitude
+                # Only the fields the place came with (a lean search result's reviews are unset, not empty)
+                new_fields = place.model_dump(mode="json", by_alias=True, exclude_none=True, exclude_unset=True)
+                kept_fields = {k: v for k, v in stored.get(place.name, {}).items() if k not in requested}
+                fields = {**kept_fields, **new_fields}
+                row = self._conn.execute(
+                    "INSERT INTO places (name, latitude, longitude, types, fetched_at, place) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET latitude = excluded.latitude, longitude = excluded.longitude, "
+                    "types = excluded.types, fetched_at = excluded.fetched_at, place = excluded.place "
+                    "RETURNING id",
+                    (place.name, lat, lon, json.dumps(place.types), fetched_at, json.dumps(fields)),
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO places_location_index (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+                    (row[0], lat, lat, lon, lon),
+                )
+
+    def _stored_place_fields(self, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not names:
+            return {}
+        placeholders = ','.join('?' * len(names))
+        rows = self._conn.execute(f"SELECT name, place FROM places WHERE name IN ({placeholders})", names).fetchall()
+        return {name: json.loads(place) for name, place in rows}
+
+    def get_places(self, names: Iterable[str]) -> List[Place]:
+        """Get stored places by name, in the order given (unknown names are skipped)"""
+        names = list(names)
+        if not names:
+            return []
+        placeholders = ','.join('?' * len(names))
+        rows = self._read(f"SELECT name, place FROM places WHERE name IN ({placeholders})", names)
+        by_name = {name: place for name, place in rows}
+        return [Place.model_validate_json(by_name[n]) for n in names if n in by_name]
+
+    async def aget_places(self, names: Iterable[str]) -> List[Place]:
+        """get_places, in a worker thread (for the async code, so the event loop isn't blocked on SQLite)"""
+        return await asyncio.to_thread(self.get_places, list(names))
+
+    def query_places(self, shape: Dict[str, Any], types: Optional[Iterable[str]] = None, max_age_seconds: Optional[float] = None) -> List[Place]:
+        """Places inside a circle or rectangle shape (same format as get_location_bias), optionally
+        only those with at least one of the given types, and fetched within max_age_seconds"""
+        min_lat, min_lon, max_lat, max_lon = shape_bounding_box(shape)
+        sql = (
+            "SELECT p.latitude, p.longitude, p.types, p.place FROM places_location_index i JOIN places p ON p.id = i.id "
+            "WHERE i.max_lat >= ? AND i.min_lat <= ? AND i.max_lon >= ? AND i.min_lon <= ?"
+        )
+        params: List[Any] = [min_lat, max_lat, min_lon, max_lon]
+        if max_age_seconds is not None:
+            sql += " AND p.fetched_at >= ?"
+            params.append(time.time() - max_age_seconds)
+
+        wanted_types = set(types) if types else None
+        places = []
+        rows = self._read(sql, params)
+        for lat, lon, place_types, place_json in rows:
+            # The R*Tree narrows things down to the bounding box (its boxes are rounded outwards to 32 bit floats),
+            # then the exact shape test on the stored coordinates weeds out the rest
+            if not point_in_shape(lat, lon, shape):
+                continue
+            if wanted_types is not None and wanted_types.isdisjoint(json.loads(place_types)):
+                continue
+            places.append(Place.model_validate_json(place_json))
+        return places
+
+    def record_search(self, body: Dict[str, Any], field_mask: str, places: List[Place], fetched_at: Optional[float] = None) -> None:
+        """Store the places from a searchText response, and remember the area the search covered"""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.upsert_places(places, fetched_at, field_mask)
+        shape = _search_shape(body)
+        if shape is None:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO searches (query_key, shape, fetched_at, place_names) VALUES (?, ?, ?, ?)",
+                (_search_query_key(body, field_mask), json.dumps(shape), fetched_at, json.dumps([p.name for p in places])),
+            )
+
+    def find_covered_places(
+        self,
+        body: Dict[str, Any],
+        field_mask: str,
+        max_age_seconds: float = PLACE_STORE_COVERAGE_MAX_AGE_SECONDS,
+        min_places: int = PLACE_STORE_COVERAGE_MIN_PLACES,
+    ) -> Optional[List[Place]]:
+        """If a recent search for the same query covered the requested area, return its places that
+        fall inside the requested area (in the order Google returned them). Otherwise, None."""
+        shape = _search_shape(body)
+        if shape is None:
+            return None
+        rows = self._read(
+            "SELECT shape, place_names FROM searches WHERE query_key = ? AND fetched_at >= ? ORDER BY fetched_at DESC",
+            (_search_query_key(body, field_mask), time.time() - max_age_seconds),
+        )
+        for stored_shape, place_names in rows:
+            if not shape_contains(json.loads(stored_shape), shape):
+                continue
+            places = [
+                p for p in self.get_places(json.loads(place_names))
+                if point_in_shape(p.location.latitude, p.location.longitude, shape)
+            ]
+            if len(places) >= min_places:
+                return places
+        return None
+
+    def prune(self, max_age_seconds: float) -> None:
+        """Drop places and searches older than max_age_seconds"""
+        cutoff = time.time() - max_age_seconds
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM places_location_index WHERE id IN (SELECT id FROM places WHERE fetched_at < ?)", (cutoff,))
+            self._conn.execute("DELETE FROM places WHERE fetched_at < ?", (cutoff,))
+            self._conn.execute("DELETE FROM searches WHERE fetched_at < ?", (cutoff,))
+
+
+_shared_store: Optional[PlaceStore] = None
+_maintenance_task: Optional[asyncio.Task] = None
+
+def get_place_store() -> PlaceStore:
+    """Get the worker's shared PlaceStore, creating it on first use."""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = PlaceStore()
+    return _shared_store
+
+async def _maintenance_loop(interval_seconds: float, max_age_seconds: float) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(get_place_store().prune, max_age_seconds)
+        except Exception as e:
+            logging.warning(f"Place store pruning failed: {e}")
+
+def start_place_store_maintenance(
+    interval_seconds: float = PLACE_STORE_PRUNE_INTERVAL_SECONDS, max_age_seconds: float = PLACE_STORE_MAX_AGE_SECONDS
+) -> None:
+    """Prune the shared store's old places and searches every interval_seconds, until it is closed"""
+    global _maintenance_task
+    if _maintenance_task is None and max_age_seconds > 0:
+        _maintenance_task = asyncio.create_task(_maintenance_loop(interval_seconds, max_age_seconds))
+
+def close_place_store() -> None:
+    global _shared_store, _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+    _maintenance_task = None
+    if _shared_store is not None:
+        _shared_store.close()
+    _shared_store = None
@@ -0,0 +1,306 @@
+import asyncio
+import copy
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import logging
+
+from app.graph.tools.geo import METERS_PER_DEGREE_LATITUDE
+
+# How long a cached search is served as-is, and for how much longer after that it is served
+# stale (while a background refresh runs) before it is treated as a miss
+PLACES_CACHE_FRESH_TTL_SECONDS = float(os.environ.get("PLACES_CACHE_FRESH_TTL_SECONDS", 15 * 60))
+PLACES_CACHE_STALE_TTL_SECONDS = float(os.environ.get("PLACES_CACHE_STALE_TTL_SECONDS", 6 * 60 * 60))
+PLACES_CACHE_MAX_ENTRIES = int(os.environ.get("PLACES_CACHE_MAX_ENTRIES", 1024))
+# If set, searches are also persisted to this SQLite file, so they survive restarts and are shared across workers
+PLACES_CACHE_SQLITE_PATH = os.environ.get("PLACES_CACHE_SQLITE_PATH")
+PLACES_CACHE_SQLITE_MAX_ENTRIES = int(os.environ.get("PLACES_CACHE_SQLITE_MAX_ENTRIES", 100_000))
+# The SQLite tier is trimmed back to its max entries once it holds this fraction more than that,
+# and an entry's last use is only written again once it is this old
+PLACES_CACHE_SQLITE_EVICT_SLACK = float(os.environ.get("PLACES_CACHE_SQLITE_EVICT_SLACK", 0.1))
+PLACES_CACHE_SQLITE_TOUCH_INTERVAL_SECONDS = float(os.environ.get("PLACES_CACHE_SQLITE_TOUCH_INTERVAL_SECONDS", 60))
+
+# Grid that circle centers are snapped to, and step that radii are rounded up to.
+# Users within a few blocks of each other searching for the same thing share a cache entry.
+LOCATION_GRID_METERS = 250.0
+RADIUS_STEP_METERS = 500.0
+
+SearchFetcher = Callable[[Dict[str, Any], str], Awaitable[Dict[str, Any]]]
+
+def _snap_point(latitude: float, longitude: float, grid_meters: float = LOCATION_GRID_METERS) -> Dict[str, float]:
+    lat_step = grid_meters / METERS_PER_DEGREE_LATITUDE
+    snapped_lat = round(latitude / lat_step) * lat_step
+    # Degrees of longitude shrink towards the poles, so widen the step to keep cells roughly square
+    lon_step = lat_step / max(math.cos(math.radians(snapped_lat)), 0.01)
+    snapped_lon = round(longitude / lon_step) * lon_step
+    return {'latitude': round(snapped_lat, 6), 'longitude': round(snapped_lon, 6)}
+
+def _snap_location_shape(shape: Dict[str, Any]) -> Dict[str, Any]:
+    """Snap a locationBias/locationRestriction shape (circle or rectangle) onto the grid"""
+    snapped = {}
+    if 'circle' in shape:
+        circle = shape['circle']
+        center = circle['center']
+        snapped['circle'] = {
+            'center': _snap_point(center['latitude'], center['longitude']),
+            # Round the radius up, so the snapped search never covers less than what was asked for
+            'radius': math.ceil(float(circle.get('radius', 0.0)) / RADIUS_STEP_METERS) * RADIUS_STEP_METERS,
+        }
+    if 'rectangle' in shape:
+        low = shape['rectangle']['low']
+        high = shape['rectangle']['high']
+        snapped['rectangle'] = {
+            'low': _snap_point(low['latitude'], low['longitude']),
+            'high': _snap_point(high['latitude'], high['longitude']),
+        }
+    return snapped
+
+def normalize_search_request(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a places:searchText request body, so equivalent searches produce the same body.
+    The normalized body is also what gets sent to Google, so a cached response always matches its key."""
+    normalized = copy.deepcopy(body)
+    if 'textQuery' in normalized:
+        normalized['textQuery'] = ' '.join(str(normalized['textQuery']).lower().split())
+    for shape_key in ('locationBias', 'locationRestriction'):
+        if normalized.get(shape_key):
+            normalized[shape_key] = _snap_location_shape(normalized[shape_key])
+    if isinstance(normalized.get('priceLevels'), list):
+        normalized['priceLevels'] = sorted(normalized['priceLevels'])
+    if 'minRating' in normalized:
+        # The API only accepts ratings in 0.5 increments (rounding up)
+        normalized['minRating'] = math.ceil(float(normalized['minRating']) * 2) / 2
+    return normalized
+
+def make_cache_key(normalized_body: Dict[str, Any], field_mask: str) -> str:
+    payload = json.dumps({'body': normalized_body, 'fieldMask': field_mask}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryCacheTier:
+    """In-process LRU tier. Entries are (stored_at, response) tuples."""
+    def __init__(self, max_entries: int = PLACES_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, stored_at: float, response: Dict[str, Any]) -> None:
+        self._entries[key] = (stored_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class SqliteCacheTier:
+    """On-disk tier, backed by a single SQLite table. Reads refresh `last_used_at` (at most once per
+    touch_interval_seconds) so eviction (oldest used first) behaves like an LRU. Eviction runs in one
+    batch once there are evict_slack more entries than max_entries, not on every write.
+    Its calls are blocking, so PlacesSearchCache makes them from a worker thread."""
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = PLACES_CACHE_SQLITE_MAX_ENTRIES,
+        evict_slack: float = PLACES_CACHE_SQLITE_EVICT_SLACK,
+        touch_interval_seconds: float = PLACES_CACHE_SQLITE_TOUCH_INTERVAL_SECONDS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval_seconds = touch_interval_seconds
+        self._evict_above = max_entries + max(1, int(max_entries * evict_slack))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS places_search_cache ("
+            "key TEXT PRIMARY KEY, stored_at REAL NOT NULL, last_used_at REAL NOT NULL, response TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_places_search_cache_last_used ON places_search_cache (last_used_at)")
+        # Counted once here, then kept up to date on each new key (other workers' writes are caught at eviction)
+        self._count = self._conn.execute("SELECT COUNT(*) FROM places_search_cache").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT stored_at, last_used_at, response FROM places_search_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] >= self.touch_interval_seconds:
+                self._conn.execute("UPDATE places_search_cache SET last_used_at = ? WHERE key = ?", (now, key))
+        return row[0], json.loads(row[2])
+
+    def set(self, key: str, stored_at: float, response: Dict[str, Any]) -> None:
+        with self._lock:
+            existed = self._conn.execute("SELECT 1 FROM places_search_cache WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO places_search_cache (key, stored_at, last_used_at, response) VALUES (?, ?, ?, ?)",
+                (key, stored_at, time.time(), json.dumps(response)),
+            )
+            if not existed:
+                self._count += 1
+            if self._count > self._evict_above:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Recounted, since other workers may share the file
+        self._count = self._conn.execute("SELECT COUNT(*) FROM places_search_cache").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess > 0:
+            deleted = self._conn.execute(
+                "DELETE FROM places_search_cache WHERE key IN ("
+                "SELECT key FROM places_search_cache ORDER BY last_used_at, rowid LIMIT ?)",
+                (excess,),
+            ).rowcount
+            self._count -= deleted
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PlacesSearchCache:
+    """Cache in front of places:searchText, with an in-memory LRU tier and an optional SQLite tier.
+    - Fresh entries (younger than fresh_ttl) are returned without touching the network
+    - Stale entries (younger than fresh_ttl + stale_ttl) are returned right away, and a single
+      background task refreshes them
+    - Anything older is a miss. Concurrent misses for the same key share one upstream request
+    """
+    def __init__(
+        self,
+        memory_tier: Optional[MemoryCacheTier] = None,
+        sqlite_tier: Optional[SqliteCacheTier] = None,
+        fresh_ttl_seconds: float = PLACES_CACHE_FRESH_TTL_SECONDS,
+        stale_ttl_seconds: float = PLACES_CACHE_STALE_TTL_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.memory_tier = memory_tier if memory_tier is not None else MemoryCacheTier()
+        self.sqlite_tier = sqlite_tier
+        self.fresh_ttl_seconds = fresh_ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self.clock = clock
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # Keep references to background refreshes, so they are not garbage collected mid-flight
+        self._background_tasks = set()
+
+    async def _lookup(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        entry = self.memory_tier.get(key)
+        if entry is None and self.sqlite_tier is not None:
+            # The SQLite tier blocks, so it's read from a worker thread
+            entry = await asyncio.to_thread(self.sqlite_tier.get, key)
+            if entry is not None:
+                # Promote to the memory tier
+                self.memory_tier.set(key, *entry)
+        return entry
+
+    async def _store(self, key: str, response: Dict[str, Any]) -> None:
+        stored_at = self.clock()
+        self.memory_tier.set(key, stored_at, response)
+        if self.sqlite_tier is not None:
+            await asyncio.to_thread(self.sqlite_tier.set, key, stored_at, response)
+
+    async def _fetch_and_store(self, key: str, body: Dict[str, Any], field_mask: str, fetch: SearchFetcher) -> Dict[str, Any]:
+        """Fetch from upstream, making sure only one request per key is in flight"""
+        if key in self._in_flight:
+            return await asyncio.shield(self._in_flight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await fetch(body, field_mask)
+            await self._store(key, response)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, in case no one else was waiting on this key
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _refresh(self, key: str, body: Dict[str, Any], field_mask: str, fetch: SearchFetcher) -> None:
+        try:
+            await self._fetch_and_store(key, body, field_mask, fetch)
+            self.stats['refreshes'] += 1
+        except Exception as e:
+            self.stats['refresh_errors'] += 1
+            logging.warning(f"Background refresh of cached Places search failed: {e}")
+
+    def _schedule_refresh(self, key: str, body: Dict[str, Any], field_mask: str, fetch: SearchFetcher) -> None:
+        if key in self._in_flight:
+            return
+        task = asyncio.create_task(self._refresh(key, body, field_mask, fetch))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def get_or_fetch(self, body: Dict[str, Any], field_mask: str, fetch: SearchFetcher) -> Dict[str, Any]:
+        """Return the searchText response for this request body, from cache if possible.
+        `fetch` is called with the normalized body and the field mask on a miss (e.g. PlacesClient.search_text)."""
+        normalized_body = normalize_search_request(body)
+        key = make_cache_key(normalized_body, field_mask)
+
+        entry = await self._lookup(key)
+        if entry is not None:
+            stored_at, response = entry
+            age = self.clock() - stored_at
+            if age < self.fresh_ttl_seconds:
+                self.stats['hits'] += 1
+                return response
+            if age < self.fresh_ttl_seconds + self.stale_ttl_seconds:
+                self.stats['stale_hits'] += 1
+                self._schedule_refresh(key, normalized_body, field_mask, fetch)
+                return response
+
+        self.stats['misses'] += 1
+        return await self._fetch_and_store(key, normalized_body, field_mask, fetch)
+
+    async def wait_for_refreshes(self) -> None:
+        """Wait for any background refreshes to finish (used in tests and on shutdown)"""
+        if self._background_tasks:
+            await asyncio.gather(*list(self._background_tasks), return_exceptions=True)
+
+    def close(self) -> None:
+        if self.sqlite_tier is not None:
+            self.sqlite_tier.close()
+
+
+_shared_cache: Optional[PlacesSearchCache] = None
+
+def get_places_cache() -> PlacesSearchCache:
+    """Get the worker's shared Places search cache, creating it on first use."""
+    global _shared_cache
+    if _shared_cache is None:
+        sqlite_tier = SqliteCacheTier(PLACES_CACHE_SQLITE_PATH) if PLACES_CACHE_SQLITE_PATH else None
+        _shared_cache = PlacesSearchCache(sqlite_tier=sqlite_tier)
+    return _shared_cache
+
+async def close_places_cache() -> None:
+    """Let in-flight refreshes finish and close the SQLite tier (called from the app's lifespan on shutdown)."""
+    global _shared_cache
+    if _shared_cache is not None:
+        await _shared_cache.wait_for_refreshes()
+        _shared_cache.close()
+    _shared_cache = None
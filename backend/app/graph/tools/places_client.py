@@ -0,0 +1,165 @@
+import asyncio
+import importlib.util
+import os
+import random
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.graph.tools.places_ingest import loads
+
+import logging
+
+PLACES_API_BASE_URL = os.environ.get("PLACES_API_BASE_URL", "https://places.googleapis.com/v1")
+
+# Status codes worth retrying. Anything else (400, 403, ...) means the request itself is bad
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2]); fall back to HTTP/1.1 keep-alive without it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+class PlacesAPIError(Exception):
+    """Raised when the Places API keeps failing (or returns a non-retryable error) for a request."""
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class PlacesClient:
+    """Async client for Google's Places API (New). One instance holds a keep-alive connection pool
+    that is shared by every conversation on the worker, so searches for different threads can be
+    in flight at the same time without paying for a new TLS handshake each time.
+    Every call has an overall deadline, and 429/5xx responses are retried a bounded number of times
+    with jittered exponential backoff."""
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = PLACES_API_BASE_URL,
+        deadline_seconds: float = 10.0,
+        max_retries: int = 3,
+        backoff_base_seconds: float = 0.25,
+        backoff_max_seconds: float = 4.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE and transport is None,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            # Per-attempt timeouts; the overall deadline is enforced in _request
+            timeout=httpx.Timeout(deadline_seconds, connect=min(deadline_seconds, 3.0)),
+            transport=transport,
+        )
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client.is_closed
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _headers(self, field_mask: str) -> Dict[str, str]:
+        return {
+            'Content-Type': 'application/json',
+            # Read the key lazily, so the environment can be loaded after this module is imported
+            'X-Goog-Api-Key': self.api_key or os.environ['GOOGLE_MAPS_API_KEY'],
+            'X-Goog-FieldMask': field_mask,
+        }
+
+    def _backoff_seconds(self, attempt: int, retry_after: Optional[str]) -> float:
+        """Full jitter backoff (random value between 0 and the exponential cap), unless the
+        server told us how long to wait."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max_seconds)
+            except ValueError:
+                pass
+        cap = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def _request(self, method: str, path: str, body: Optional[Dict[str, Any]], field_mask: str, deadline_seconds: Optional[float]) -> Dict[str, Any]:
+        deadline_seconds = deadline_seconds or self.deadline_seconds
+        deadline = time.monotonic() + deadline_seconds
+        url = f"{self.base_url}/{path}"
+        headers = self._headers(field_mask)
+
+        last_error = ""
+        last_status = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                response = await asyncio.wait_for(
+                    self._client.request(method, url, headers=headers, json=body),
+                    timeout=remaining,
+                )
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                last_error = f"{type(e).__name__}: {e}"
+                last_status = None
+                retry_after = None
+            else:
+                if response.status_code < 400:
+                    return loads(response.content)
+                last_status = response.status_code
+                last_error = response.text[:500]
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise PlacesAPIError(f"Places API returned {response.status_code}: {last_error}", response.status_code)
+                retry_after = response.headers.get("Retry-After")
+
+            if attempt == self.max_retries:
+                break
+            backoff = self._backoff_seconds(attempt, retry_after)
+            if time.monotonic() + backoff >= deadline:
+                break
+            logging.debug(f"Places API attempt {attempt + 1} failed ({last_status}), retrying in {backoff:.2f}s")
+            await asyncio.sleep(backoff)
+
+        raise PlacesAPIError(f"Places API request to {path} failed after retries or deadline of {deadline_seconds}s: {last_error}", last_status)
+
+    async def search_text(self, body: Dict[str, Any], field_mask: str, deadline_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """POST places:searchText and return the decoded JSON response."""
+        return await self._request("POST", "places:searchText", body, field_mask, deadline_seconds)
+
+    async def get_place_details(self, name: str, field_mask: str, deadline_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """GET a single place by its resource name ("places/<id>", i.e. Place.name) and return the decoded
+        JSON response. Note: Place Details field masks are not prefixed with "places."."""
+        return await self._request("GET", name, None, field_mask, deadline_seconds)
+
+
+# ~~~~~~ Shared (per worker) client ~~~~~~
+# Connection pools are bound to an event loop, so there is one client per loop (e.g. a script calling
+# asyncio.run more than once), dropped along with its loop
+_shared_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, PlacesClient]" = weakref.WeakKeyDictionary()
+
+def get_places_client() -> PlacesClient:
+    """Get the shared PlacesClient of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _shared_clients[loop] = PlacesClient()
+    return client
+
+async def close_places_client() -> None:
+    """Close the shared clients (called from the app's lifespan on shutdown). A client is closed on its
+    own loop; one whose loop is no longer running can't be, and is just dropped."""
+    loop = asyncio.get_running_loop()
+    clients = list(_shared_clients.items())
+    _shared_clients.clear()
+    for client_loop, client in clients:
+        if client.is_closed:
+            continue
+        if client_loop is loop:
+            await client.aclose()
+        elif client_loop.is_running():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.aclose(), client_loop))
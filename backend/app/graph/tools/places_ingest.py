@@ -0,0 +1,63 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from app.schemas import Place
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library decoder is used without it
+    orjson = None
+
+class PlacesSearchResponse(BaseModel):
+    """The body of a Places API text search response."""
+    places: List[Place] = Field(default_factory=list)
+    next_page_token: Optional[str] = Field(alias="nextPageToken", default=None)
+
+# Built once, building a TypeAdapter is much more expensive than using one
+PLACE_LIST_ADAPTER = TypeAdapter(List[Place])
+
+def loads(payload: Union[bytes, str]) -> Any:
+    """Decode JSON, with orjson when it's installed"""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def _without_reviews(places: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Shallow copies, so the caller's dicts (e.g. a cached response) are left alone
+    return [{k: v for k, v in p.items() if k != "reviews"} for p in places]
+
+def _attach_raw_reviews(places: List[Place], raw_places: List[Dict[str, Any]]) -> List[Place]:
+    for place, raw in zip(places, raw_places):
+        place.set_raw_reviews(raw.get("reviews", []))
+    return places
+
+def parse_places(json_response: Dict[str, Any], lazy_reviews: bool = False) -> List[Place]:
+    """Validate the places in a decoded text search response, without modifying it.
+    With lazy_reviews, the reviews are kept as they came and only validated by Place.load_reviews()."""
+    raw_places = json_response.get('places', [])
+    if not lazy_reviews:
+        return PLACE_LIST_ADAPTER.validate_python(raw_places)
+    return _attach_raw_reviews(PLACE_LIST_ADAPTER.validate_python(_without_reviews(raw_places)), raw_places)
+
+def parse_places_json(payload: Union[bytes, str], lazy_reviews: bool = False) -> List[Place]:
+    """Validate the places in a raw text search response body. Without lazy_reviews, the JSON is
+    validated straight into Place objects (no intermediate dicts)."""
+    if not lazy_reviews:
+        return PlacesSearchResponse.model_validate_json(payload).places
+    return parse_places(loads(payload), lazy_reviews=True)
+
+def dedupe_places(places: Iterable[Place]) -> List[Place]:
+    """The places without repeats (same Place.name), each where it first appeared"""
+    seen = set()
+    unique = []
+    for place in places:
+        if place.name not in seen:
+            seen.add(place.name)
+            unique.append(place)
+    return unique
+
+def merge_place_details(place: Place, details: Dict[str, Any]) -> Place:
+    """A copy of the place with the fields of a Place Details response (API field names) filled in"""
+    return Place.model_validate({**place.model_dump(by_alias=True, exclude_none=True), **details})
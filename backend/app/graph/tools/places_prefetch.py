@@ -0,0 +1,146 @@
+import asyncio
+import math
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.schemas import Place
+from app.graph.tools.places_ingest import parse_places, dedupe_places
+
+import logging
+
+# How many places a search may collect in total, following nextPageToken (Google stops at 60),
+# and how many are asked for per page (pageSize, at most 20)
+PLACES_MAX_CANDIDATES = int(os.environ.get("PLACES_MAX_CANDIDATES", 60))
+PLACES_SEARCH_PAGE_SIZE = min(int(os.environ.get("PLACES_SEARCH_PAGE_SIZE", 20)), 20)
+# Prefetched pages nobody asked for are dropped after this long (page tokens expire anyway)
+PLACES_PREFETCH_TTL_SECONDS = float(os.environ.get("PLACES_PREFETCH_TTL_SECONDS", 15 * 60))
+
+PageFetcher = Callable[[Dict[str, Any], str], Awaitable[Dict[str, Any]]]
+PagesFetchedCallback = Callable[[List[Place]], Awaitable[None]]
+# One search's pages to follow: its request body, the token for its next page, and what to call with
+# its places once they are all in
+PageChain = Tuple[Dict[str, Any], str, Optional[PagesFetchedCallback]]
+
+class PagePrefetcher:
+    """Fetches the pages after the first one of a text search in the background, so the first page can
+    be ranked and shown right away. Each search's pages are kept under a key (stored with the search in
+    the agent state) until they are taken and merged into the thread's places, or expire."""
+    def __init__(self, ttl_seconds: float = PLACES_PREFETCH_TTL_SECONDS, clock: Callable[[], float] = time.time):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.stats = {'started': 0, 'pages': 0, 'places': 0, 'errors': 0, 'expired': 0}
+        self._tasks: Dict[str, Tuple[float, asyncio.Task]] = {}
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def _fetch_chain(
+        self,
+        body: Dict[str, Any],
+        field_mask: str,
+        page_token: str,
+        max_places: int,
+        fetch: PageFetcher,
+        on_pages_fetched: Optional[PagesFetchedCallback],
+    ) -> List[Place]:
+        places = []
+        while page_token and len(places) < max_places:
+            try:
+                response = await fetch({**body, 'pageToken': page_token}, field_mask)
+                page = parse_places(response)
+            except Exception as e:
+                # Keep whatever pages we got
+                self.stats['errors'] += 1
+                logging.warning(f"Failed to prefetch the next page of a Places search: {e}")
+                break
+            places.extend(page[:max_places - len(places)])
+            page_token = response.get('nextPageToken')
+            self.stats['pages'] += 1
+        self.stats['places'] += len(places)
+        if on_pages_fetched is not None and places:
+            await on_pages_fetched(places)
+        return places
+
+    def _prune(self) -> None:
+        cutoff = self.clock() - self.ttl_seconds
+        for key in [key for key, (started_at, _) in self._tasks.items() if started_at < cutoff]:
+            _, task = self._tasks.pop(key)
+            task.cancel()
+            self.stats['expired'] += 1
+
+    async def _fetch_chains(self, chains: List[PageChain], field_mask: str, max_places: int, fetch: PageFetcher) -> List[Place]:
+        # Each search gets an even share of the places, and they are all followed at the same time
+        max_places_per_chain = math.ceil(max_places / len(chains))
+        results = await asyncio.gather(*(
+            self._fetch_chain(body, field_mask, page_token, max_places_per_chain, fetch, on_pages_fetched)
+            for body, page_token, on_pages_fetched in chains
+        ))
+        return dedupe_places(place for places in results for place in places)[:max_places]
+
+    def start_many(self, chains: List[PageChain], field_mask: str, max_places: int, fetch: PageFetcher) -> str:
+        """Start following the pages of several searches at once (e.g. one per cuisine), up to max_places
+        more places between them, and return the key to take them all with (without repeats)"""
+        self._prune()
+        key = uuid.uuid4().hex
+        task = asyncio.create_task(self._fetch_chains(chains, field_mask, max_places, fetch))
+        self._tasks[key] = (self.clock(), task)
+        self.stats['started'] += 1
+        return key
+
+    def start(
+        self,
+        body: Dict[str, Any],
+        field_mask: str,
+        page_token: str,
+        max_places: int,
+        fetch: PageFetcher,
+        on_pages_fetched: Optional[PagesFetchedCallback] = None,
+    ) -> str:
+        """Start fetching up to max_places more places from the pages after page_token, and return
+        the key to take them with. on_pages_fetched is awaited with the places once they are all in."""
+        return self.start_many([(body, page_token, on_pages_fetched)], field_mask, max_places, fetch)
+
+    def is_pending(self, key: Optional[str]) -> bool:
+        return key in self._tasks
+
+    def take(self, key: Optional[str]) -> Optional[List[Place]]:
+        """The prefetched places, if they are all in (they can only be taken once). None if they are
+        still being fetched, or there are none for this key."""
+        entry = self._tasks.get(key)
+        if entry is None or not entry[1].done():
+            return None
+        del self._tasks[key]
+        return entry[1].result()
+
+    async def wait(self, key: Optional[str]) -> Optional[List[Place]]:
+        """Like take, but waits for the pages that are still being fetched"""
+        entry = self._tasks.get(key)
+        if entry is None:
+            return None
+        places = await asyncio.shield(entry[1])
+        self._tasks.pop(key, None)
+        return places
+
+    def cancel_all(self) -> None:
+        for _, task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+
+_shared_prefetcher: Optional[PagePrefetcher] = None
+
+def get_page_prefetcher() -> PagePrefetcher:
+    """Get the worker's shared PagePrefetcher, creating it on first use."""
+    global _shared_prefetcher
+    if _shared_prefetcher is None:
+        _shared_prefetcher = PagePrefetcher()
+    return _shared_prefetcher
+
+def close_page_prefetcher() -> None:
+    """Cancel any pages still being fetched (called from the app's lifespan on shutdown)."""
+    global _shared_prefetcher
+    if _shared_prefetcher is not None:
+        _shared_prefetcher.cancel_all()
+    _shared_prefetcher = None
@@ -1,72 +1,53 @@
-from datetime import datetime, time, timedelta
-from typing import Annotated, List, Tuple, Dict, Any
+from typing import Annotated, Awaitable, Callable, List, Tuple, Dict, Any
+import asyncio
 import math
 import os
-import requests
+
+import numpy as np
 
 from langchain.tools import tool
 from langgraph.prebuilt import InjectedState
 
-from app.schemas import Place, PreferenceWeight, UserPreferences, AgentState
+from app.schemas import Place, PlaceRef, PlaceRanking, SearchContext, UserPreferences, AgentState
+from app.schemas.schema import ParkingOptions
+from app.graph.tools.places_client import get_places_client
+from app.graph.tools.places_cache import get_places_cache, normalize_search_request
+from app.graph.tools.places_prefetch import get_page_prefetcher, PLACES_MAX_CANDIDATES, PLACES_SEARCH_PAGE_SIZE
+from app.graph.tools.place_store import get_place_store, PLACE_STORE_COVERAGE_MAX_AGE_SECONDS
+from app.graph.tools.places_ingest import parse_places, merge_place_details, dedupe_places
+from app.graph.tools.invalid_reasons import InvalidReason
+from app.graph.tools.opening_hours import check_if_user_stay_fits_open_hours
+from app.graph.tools.restrictions import compile_restriction_plan
+from app.graph.tools.rerank import can_rerank, load_candidates, normalized_queries, rerank_candidates
+from app.graph.tools.scoring import PlaceFeatures, encode_preferences, score_places, rank_places, distance_scores, first_page_ranking, next_ranked_page, extend_ranking
+from app.graph.tools.geo import COMPASS_DIRECTIONS, DIRECTIONS, direction_rectangle, bounding_rectangle, distances_meters
 
 import logging
 
 GOOGLE_FIELD_MASK = "places.name,places.types,places.nationalPhoneNumber,places.formattedAddress,places.location,places.rating,places.googleMapsUri,places.websiteUri,places.regularOpeningHours,places.priceLevel,places.userRatingCount,places.displayName,places.primaryTypeDisplayName,places.reviews,places.dineIn,places.servesLunch,places.servesDinner,places.outdoorSeating,places.liveMusic,places.servesDessert,places.servesBeer,places.servesWine,places.servesBrunch,places.servesCocktails,places.servesCoffee,places.servesVegetarianFood,places.goodForChildren,places.menuForChildren,places.goodForGroups,places.parkingOptions"
 
-def get_datetime_for_place_hours(day: int, hour: int, minute: int) -> datetime:
-    """Get a datetime object for the start of the place's hours on a given day.
-    Note: In the Google API response, the day is 0 indexed from Sunday"""
-    # Adjust day to match Python's datetime (where Monday is 0)
-    adjusted_day = (day - 1) % 7
-
-    # Get the next occurrence of the specified day
-    today = datetime.now()
-    days_ahead = adjusted_day - today.weekday()
-    if days_ahead <= 0:
-        days_ahead += 7
-    
-    next_day = today + timedelta(days=days_ahead)
-
-    # Combine the date with the time
-    dt = datetime.combine(next_day.date(), time(hour, minute))
-    return dt
-
-def check_if_user_stay_fits_open_hours(place: Place, user_stay: Tuple[datetime, int]) -> Tuple[bool, str]:
-    user_start, duration = user_stay
-    user_end = user_start + timedelta(minutes=duration)
-    
-    if not place.regular_opening_hours or not place.regular_opening_hours.periods:
-        return False, "No opening hours information available for this place."
-
-    # Get periods for the user's start day and the next day
-    day_periods = [period for period in place.regular_opening_hours.periods 
-                   if period.open.day in [user_start.weekday(), (user_start.weekday() + 1) % 7]]
-    
-    if not day_periods:
-        return False, "This place is closed on the day you want to visit."
-
-    def get_datetime(date, time_info):
-        dt = datetime.combine(date, datetime.min.time().replace(hour=time_info.hour, minute=time_info.minute))
-        if time_info.day != date.weekday():
-            dt += timedelta(days=1)
-        return dt
-
-    for period in day_periods:
-        open_time = get_datetime(user_start.date(), period.open)
-        close_time = get_datetime(user_start.date(), period.close)
-        
-        if close_time < open_time:  # Handle case where closing time is after midnight
-            close_time += timedelta(days=1)
-
-        if open_time <= user_start < close_time:
-            if user_end <= close_time:
-                return True, ""
-            else:
-                return False, f"This place will close at {close_time.strftime('%I:%M %p')} before you finish your stay. Consider shortening your visit or coming earlier."
-
-    # If we've reached this point, the user's stay doesn't fit any period
-    opening_hours_str = ', '.join(sorted(set([f"{get_datetime(user_start.date(), p.open).strftime('%I:%M %p')} - {get_datetime(user_start.date(), p.close).strftime('%I:%M %p')}" for p in day_periods])))
-    return False, f"This place will be closed when you want to visit. The opening hours for this day are: {opening_hours_str}. Please adjust your visit time accordingly."
+# Two-phase fetching: the text search only asks for what filtering and scoring need (GOOGLE_LEAN_FIELD_MASK),
+# then the detail fields are fetched for the top ranked places alone (the ones we actually show). Off by default
+PLACES_TWO_PHASE_FETCH = os.environ.get("PLACES_TWO_PHASE_FETCH", "false").lower() in ("1", "true", "yes")
+PLACES_DETAILS_TOP_N = int(os.environ.get("PLACES_DETAILS_TOP_N", 5))
+PLACES_DETAILS_MAX_CONCURRENCY = int(os.environ.get("PLACES_DETAILS_MAX_CONCURRENCY", 5))
+GOOGLE_DETAILS_FIELDS = ["reviews", "websiteUri", "nationalPhoneNumber"]
+GOOGLE_LEAN_FIELD_MASK = ",".join(f for f in GOOGLE_FIELD_MASK.split(",") if f.removeprefix("places.") not in GOOGLE_DETAILS_FIELDS)
+# Place Details masks are not prefixed with "places."
+GOOGLE_DETAILS_FIELD_MASK = ",".join(GOOGLE_DETAILS_FIELDS)
+# Added to the text search mask, so Google sends back the token for the next page of results
+GOOGLE_NEXT_PAGE_TOKEN_FIELD = "nextPageToken"
+
+# How many places are shown at a time (the first page of a search, then each "show more")
+PLACES_PAGE_SIZE = int(os.environ.get("PLACES_PAGE_SIZE", 5))
+# With PLACES_LOCATION_RESTRICTION, Google only returns places inside the user's search area (locationRestriction,
+# which text search only takes as a rectangle), instead of just preferring them (locationBias)
+PLACES_LOCATION_RESTRICTION = os.environ.get("PLACES_LOCATION_RESTRICTION", "false").lower() in ("1", "true", "yes")
+# Weight of the distance term in a place's score (closer is better), if the user shared their location
+DISTANCE_SCORE_WEIGHT = float(os.environ.get("DISTANCE_SCORE_WEIGHT", 0.5))
+
+# How many text searches one request can fan out to (e.g. "sushi or Thai" is one search for each)
+PLACES_MAX_QUERIES = int(os.environ.get("PLACES_MAX_QUERIES", 3))
 
 def calculate_rating_score(place_rating_count: int, user_preference_rating_count: int, weight_of_user_preference_rating_count: float) -> float:
     """ This function gives us a score for the discrepancy between the user's desired number of
@@ -121,13 +102,10 @@ def calculate_place_score(place: Place, user_preferences: UserPreferences) -> fl
                 if place.menu_for_children:
                     score += pref_weight['weight']
             case "wants_free_parking":
-                parking_dict = {
-                    attr: getattr(place.parking_options, attr)
-                    for attr in place.parking_options.model_fields
-                }
                 num_free_options = 0
                 # More free options -> higher score
-                for k in parking_dict.keys():
+                # (fields are read off the class, so places without parkingOptions don't raise)
+                for k in ParkingOptions.model_fields.keys():
                     if k.startswith("free"):
                         num_free_options += 1
                 parking_score = 0.25 + (0.25 * num_free_options)
@@ -158,10 +136,10 @@ def calculate_place_score(place: Place, user_preferences: UserPreferences) -> fl
                 if place.serves_coffee:
                     score += pref_weight['weight']
 
-    # TODO: Add distances (between coordinates) later?
+    # The distance from the user is scored separately (see score_candidates), since it needs their location
     return score
 
-def filter_places(places: List[Place], user_preferences: UserPreferences) -> Tuple[List[Place], List[Tuple[Place, str]]]:
+def filter_places(places: List[Place], user_preferences: UserPreferences) -> Tuple[List[Place], List[Tuple[Place, Tuple[InvalidReason, ...]]]]:
     """ 
     Given a list of places and a state containing 0 or more user preferences,
     filter and sort them to best satisfy the user's preferences.
@@ -191,104 +169,28 @@ def filter_places(places: List[Place], user_preferences: UserPreferences) -> Tup
 
     #logging.debug(f"DEBUG: user_preferences: {user_preferences}")
 
-    # First, filter. Grab the preferences with weights of 1.0, which contain non-default (truthy) values
-    preferences_with_weight_one = {
-        attr: getattr(user_preferences, attr)
-        for attr in user_preferences.model_fields
-        if isinstance(getattr(user_preferences, attr), PreferenceWeight)
-        and getattr(user_preferences, attr).weight == 1.0
-        and getattr(user_preferences, attr).value
-    }
-    
-    def check_place_against_restrictions(place: Place) -> Tuple[bool, str]:
-        invalid_reason = ""
-        for pref, pref_weight in preferences_with_weight_one.items():
-            match pref:
-                # For party size, check for goodForGroups (parties of 6+)
-                case "party_size" if pref_weight.value >= 6:
-                    if not place.good_for_groups:
-                        invalid_reason += f"This place has indicates they do not accomodate large groups (6 or more).\n"
-                # For minimum number of ratings, check if the place has enough ratings
-                case "desired_minimum_num_ratings":
-                    if place.user_rating_count < pref_weight.value:
-                        invalid_reason += f"This place has less than your desired {pref_weight.value} ratings.\n"
-                # Can only check with servesVegetarianFood and if "vegan" is in primary_type_display_name_text
-                case "dietary_requests" if "vegetarian" in pref_weight.value or "vegan" in pref_weight.value:
-                    if "vegan" in pref_weight.value:
-                        if "vegan" not in place.primary_type_display_name_text.lower():
-                            invalid_reason += f"This place does not serve vegan food.\n"
-                    if "vegetarian" in pref_weight.value:
-                        if not place.serves_vegetarian_food:
-                            invalid_reason += f"This place does not serve vegetarian food.\n"
-                case "wants_family_friendly":
-                    if not place.good_for_children:
-                        invalid_reason += f"This place has not indicated itself as family friendly.\n"
-                case "wants_childrens_menu":
-                    if not place.menu_for_children:
-                        invalid_reason += f"This place does not have a childrens menu.\n"
-                # For parking, make sure there is at least 1 parking option that is free, if they need free parking (which is default)
-                case "wants_free_parking":
-                    parking_dict = {
-                        attr: getattr(place.parking_options, attr)
-                        for attr in place.parking_options.model_fields
-                    }
-                    has_free_option = any(parking_dict.values())
-                    if not has_free_option:
-                        invalid_reason += f"This place does not have a free parking option.\n"                
-                case "wants_outdoor_seating":
-                    if not place.outdoor_seating:
-                        invalid_reason += f"This place does not have outdoor seating.\n"
-                case "wants_live_music":
-                    if not place.live_music:
-                        invalid_reason += f"This place does not have live music.\n"
-                case "wants_dessert":
-                    if not place.serves_dessert:
-                        invalid_reason += f"This place does not have dessert.\n"
-                case "wants_beer":
-                    if not place.serves_beer:
-                        invalid_reason += f"This place does not have beer.\n"
-                case "wants_wine":
-                    if not place.serves_wine:
-                        invalid_reason += f"This place does not have wine.\n"
-                case "wants_brunch":
-                    if not place.serves_brunch:
-                        invalid_reason += f"This place does not have brunch.\n"
-                case "wants_cocktails":
-                    if not place.serves_cocktails:
-                        invalid_reason += f"This place does not have cocktails.\n"
-                case "wants_coffee":
-                    if not place.serves_coffee:
-                        invalid_reason += f"This place does not have coffee.\n"
+    valid_places, invalid_places = split_valid_places(places, user_preferences)
         
-        # For desired time and stay duration, check if the place is open at the desired timeframe
-        user_desired_time_and_stay_duration = user_preferences.desired_time_and_stay_duration
-        found_valid_period, suggestion_msg = check_if_user_stay_fits_open_hours(place, user_desired_time_and_stay_duration)
-        if not found_valid_period:
-            invalid_reason += suggestion_msg
-
-        if invalid_reason == "":
-            return (True, "")
-        else:
-            return (False, invalid_reason)
-    
+    # Rank the valid places, scoring them all at once (same scores as calculate_place_score)
+    ranked_places = rank_places(valid_places, user_preferences)
+
+    return ranked_places, invalid_places
+
+def split_valid_places(places: List[Place], user_preferences: UserPreferences) -> Tuple[List[Place], List[Tuple[Place, Tuple[InvalidReason, ...]]]]:
+    """The filtering half of filter_places: the places that meet the user's restrictions (in their
+    original order), and the ones that don't with why"""
+    # The restrictions are compiled once, then each place is checked against them,
+    # stopping at the first one it fails
+    restriction_plan = compile_restriction_plan(user_preferences)
+
     valid_places = [] # list of Places
-    invalid_places = [] # list of tuples of [Place, str]
-    for place in places:
-        is_valid_place, invalid_reason = check_place_against_restrictions(place)
-        if is_valid_place:
+    invalid_places = [] # list of tuples of [Place, tuple of InvalidReasons]
+    for place, invalid_reasons in zip(places, restriction_plan.check_all(places)):
+        if not invalid_reasons:
             valid_places.append(place)
         else:
-            invalid_places.append((place, invalid_reason))
-        
-    # Filter and rank places
-    ranked_places = sorted(
-        [(place, calculate_place_score(place, user_preferences)) for place in valid_places],
-        key=lambda x: x[1],
-        reverse=True
-    )
-    ranked_places = [place for place, _ in ranked_places]
-
-    return ranked_places, invalid_places
+            invalid_places.append((place, invalid_reasons))
+    return valid_places, invalid_places
 
 def get_location_bias(user_coords: Tuple[float, float], preferred_direction: str, desired_max_distance_meters: float) -> Dict[str, Any]:
     """Get the locationBias parameter for the Google Maps places API.
@@ -319,9 +221,12 @@ def get_location_bias(user_coords: Tuple[float, float], preferred_direction: str
     }
     """
     location_bias = {}
-    if preferred_direction != 'any':
-        # TODO: Implement logic for preferred direction
-        pass
+    # The LLM may give the direction's name ("north", "North East") rather than its abbreviation
+    direction = preferred_direction.lower().replace(" ", "").replace("-", "")
+    direction = DIRECTIONS.get(direction, direction.upper())
+    if direction in COMPASS_DIRECTIONS:
+        # A box in that direction from the user (see direction_rectangle)
+        location_bias = direction_rectangle(user_coords[0], user_coords[1], direction, desired_max_distance_meters)
     else:
         location_bias['circle'] = {
             'center': {
@@ -332,6 +237,36 @@ def get_location_bias(user_coords: Tuple[float, float], preferred_direction: str
         }
     return location_bias
 
+def get_location_restriction(user_coords: Tuple[float, float], preferred_direction: str, desired_max_distance_meters: float) -> Dict[str, Any]:
+    """Get the locationRestriction parameter for the Google Maps places API. Text search only takes a rectangle
+    here, so without a preferred direction, it's the box around the circle get_location_bias would give
+    (the places in its corners are dropped by filter_by_distance)."""
+    return bounding_rectangle(get_location_bias(user_coords, preferred_direction, desired_max_distance_meters))
+
+def filter_by_distance(places: List[Place], user_coords: Tuple[float, float], max_distance_meters: float) -> Tuple[List[Place], np.ndarray]:
+    """The places within max_distance_meters of the user, and their distances. Google returns places outside
+    a locationBias (and the corners of a locationRestriction), which aren't worth checking or scoring."""
+    features = PlaceFeatures(places)
+    distances = distances_meters(user_coords[0], user_coords[1], features.latitude, features.longitude)
+    in_range = distances <= max_distance_meters
+    return [place for place, keep in zip(places, in_range) if keep], distances[in_range]
+
+def valid_distances(places: List[Place], distances: np.ndarray, valid_places: List[Place]) -> np.ndarray:
+    """The distances of the valid places, out of those of all the places (split_valid_places keeps their order)"""
+    valid_names = {p.name for p in valid_places}
+    return distances[np.array([p.name in valid_names for p in places], dtype=bool)]
+
+def score_candidates(places: List[Place], search_context: SearchContext, distances: np.ndarray | None = None) -> np.ndarray:
+    """Scores for places (score_places) with the search's preferences, plus how close they are to the user if
+    they shared their location (distances are computed here if they weren't already)"""
+    features = PlaceFeatures(places)
+    scores = score_places(features, encode_preferences(search_context.user_preferences))
+    if search_context.user_coordinates is not None and search_context.max_distance_meters:
+        if distances is None:
+            distances = distances_meters(*search_context.user_coordinates, features.latitude, features.longitude)
+        scores = scores + distance_scores(distances, search_context.max_distance_meters, DISTANCE_SCORE_WEIGHT)
+    return scores
+
 def get_maps_text_search_parameters(state: Dict[str, Any]) -> Dict[str, Any]:
     """Process the current state and perform necessary computations,
     collecting the parameters to be passed into google_maps_text_search()"""
@@ -339,11 +274,18 @@ def get_maps_text_search_parameters(state: Dict[str, Any]) -> Dict[str, Any]:
 
     # If user allowed location sharing, then we have their coordinates
     if state['user_coordinates']:
-        api_optional_parameters['locationBias'] = get_location_bias(
-            state['user_coordinates'], 
-            state['preferred_direction'], 
-            state['desired_max_distance_meters']
-        )
+        if PLACES_LOCATION_RESTRICTION:
+            api_optional_parameters['locationRestriction'] = get_location_restriction(
+                state['user_coordinates'],
+                state['preferred_direction'],
+                state['desired_max_distance_meters']
+            )
+        else:
+            api_optional_parameters['locationBias'] = get_location_bias(
+                state['user_coordinates'], 
+                state['preferred_direction'], 
+                state['desired_max_distance_meters']
+            )
 
     # If user has a preferred price level, add that
     if state['preferred_price_level'] != "PRICE_LEVEL_UNSPECIFIED":
@@ -357,36 +299,251 @@ def get_maps_text_search_parameters(state: Dict[str, Any]) -> Dict[str, Any]:
 
 def get_places_from_json(json_response: Dict[str, Any]) -> List[Place]:
     #logging.debug(f"DEBUG: json_response: {json_response}")
-    places = json_response['places']
-    places_objects = []
-    for p in places:
-        places_objects.append(Place.model_validate(p))
-    return places_objects
+    # A search with no results has no 'places' key at all
+    return parse_places(json_response)
+
+async def fetch_place_details(places: List[Place], top_n: int = PLACES_DETAILS_TOP_N, max_concurrency: int = PLACES_DETAILS_MAX_CONCURRENCY) -> List[Place]:
+    """Second phase of a two-phase search: fill in the GOOGLE_DETAILS_FIELDS of the first top_n places,
+    with at most max_concurrency Place Details requests in flight (responses go through the same cache
+    as searches). A place whose details can't be fetched is kept as it was."""
+    client, cache = get_places_client(), get_places_cache()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def get_details(body: Dict[str, Any], field_mask: str) -> Dict[str, Any]:
+        return await client.get_place_details(body['name'], field_mask)
+
+    async def with_details(place: Place) -> Place:
+        async with semaphore:
+            try:
+                details = await cache.get_or_fetch({'name': place.name}, GOOGLE_DETAILS_FIELD_MASK, get_details)
+            except Exception as e:
+                logging.warning(f"Failed to get details for {place.name}: {e}")
+                return place
+        return merge_place_details(place, details)
+
+    detailed = await asyncio.gather(*(with_details(p) for p in places[:top_n]))
+    return list(detailed) + places[top_n:]
+
+async def rerank_last_search(state: Dict[str, Any], optional_parameters: Dict[str, Any], queries: List[str]) -> Tuple[List[Place], List[Tuple[Place, Tuple[InvalidReason, ...]]], List[str]] | None:
+    """If only preferences that don't change the search itself changed since the last search, its places
+    re-filtered for the new preferences (see app/graph/tools/rerank.py), and the names of all of them.
+    Any of its later pages that were prefetched since are included (the ones in range, as when they're
+    merged into its ranking). None if a new search is needed."""
+    last_search = state.get("last_search")
+    user_preferences = state["user_preferences"]
+    if not can_rerank(last_search, optional_parameters, user_preferences, queries):
+        return None
+    known = set(last_search.place_names)
+    more_places = [p for p in get_page_prefetcher().take(last_search.prefetch_key) or [] if p.name not in known]
+    if more_places and last_search.user_coordinates is not None:
+        more_places, _ = filter_by_distance(more_places, last_search.user_coordinates, last_search.max_distance_meters)
+    place_names = last_search.place_names + [p.name for p in more_places]
+    places = await get_place_store().aget_places(place_names)
+    candidates = load_candidates(place_names, state.get("valid_places") or {}, state.get("invalid_places") or {}, places)
+    if candidates is None:
+        return None
+    valid_places, invalid_places = rerank_candidates(candidates, last_search.user_preferences, user_preferences)
+    return valid_places, invalid_places, place_names
+
+def search_queries(api_query: str, user_preferences: UserPreferences, has_location: bool) -> List[str]:
+    """The text searches to run for the user's request: one per line of api_query (the query formulator gives one
+    per kind of food), plus one per desired cuisine that none of them mention, if the search has a location
+    to go with it. At most PLACES_MAX_QUERIES, without repeats."""
+    queries = []
+    for query in api_query.splitlines():
+        query = query.strip()
+        if query and query.lower() not in (q.lower() for q in queries):
+            queries.append(query)
+    if has_location:
+        cuisines = [c for c in user_preferences.desired_cuisines.value or [] if c and c.lower() != "any"]
+        if len(cuisines) > 1:
+            for cuisine in cuisines:
+                if not any(cuisine.lower() in q.lower() for q in queries):
+                    queries.append(f"{cuisine} food")
+    return queries[:PLACES_MAX_QUERIES] or [api_query]
+
+async def search_first_page(api_parameters: Dict[str, Any], field_mask: str) -> Tuple[List[Place], str | None]:
+    """One text search's places, and the token for its next page (if Google has one)"""
+    # If a recent search for this query already covered the area, use the places we stored from it. Only
+    # if it's no older than a fresh cache entry, so the cache's revalidation of older ones isn't bypassed
+    place_store = get_place_store()
+    places_cache = get_places_cache()
+    max_age_seconds = min(PLACE_STORE_COVERAGE_MAX_AGE_SECONDS, places_cache.fresh_ttl_seconds)
+    # The place store is SQLite, so its calls run in a worker thread, off the event loop
+    places = await asyncio.to_thread(place_store.find_covered_places, api_parameters, field_mask, max_age_seconds=max_age_seconds)
+    if places is not None:
+        return places, None
+    # Perform API request to get the places with the user's desired preferences
+    # (awaited on the shared client, so other conversations keep running while we wait on Google).
+    # Repeat searches near the same spot are served from the cache instead
+    json_response = await places_cache.get_or_fetch(api_parameters, field_mask, get_places_client().search_text)
+    places = get_places_from_json(json_response)
+    await asyncio.to_thread(place_store.record_search, api_parameters, field_mask, places)
+    return places, json_response.get(GOOGLE_NEXT_PAGE_TOKEN_FIELD)
+
+def start_page_prefetch(searches: List[Tuple[Dict[str, Any], str, List[Place]]], field_mask: str, num_places: int) -> str:
+    """Start fetching the later pages of searches, given as (api_parameters, next page token, first page),
+    in the background (up to PLACES_MAX_CANDIDATES places in all, with the num_places we have), and return
+    the key to take them with"""
+    place_store = get_place_store()
+
+    def record_all_pages(api_parameters: Dict[str, Any], first_page: List[Place]) -> Callable[[List[Place]], Awaitable[None]]:
+        # Recorded as one search, so a later search that this one covers gets every page
+        return lambda more_places: asyncio.to_thread(place_store.record_search, api_parameters, field_mask, first_page + more_places)
+
+    return get_page_prefetcher().start_many(
+        [
+            (normalize_search_request(api_parameters), page_token, record_all_pages(api_parameters, first_page))
+            for api_parameters, page_token, first_page in searches
+        ],
+        field_mask,
+        PLACES_MAX_CANDIDATES - num_places,
+        get_places_client().search_text,
+    )
+
+def merge_prefetched_places(
+    more_places: List[Place], ranking: PlaceRanking, last_search: SearchContext
+) -> Tuple[List[PlaceRef], List[PlaceRef], PlaceRanking, SearchContext]:
+    """Filter and score a search's later pages with the preferences it was made with, and add them to its
+    ranking and places. Returns the refs of the new valid and invalid places, and the updated ranking and search."""
+    known = set(last_search.place_names)
+    more_places = [p for p in more_places if p.name not in known]
+    distances = None
+    if last_search.user_coordinates is not None:
+        more_places, distances = filter_by_distance(more_places, last_search.user_coordinates, last_search.max_distance_meters)
+    valid_places, invalid_places = split_valid_places(more_places, last_search.user_preferences)
+    if distances is not None:
+        distances = valid_distances(more_places, distances, valid_places)
+    scores = score_candidates(valid_places, last_search, distances)
+    ranking = extend_ranking(ranking, [p.name for p in valid_places], scores)
+    last_search = last_search.model_copy(update={
+        "place_names": last_search.place_names + [p.name for p in more_places],
+        "prefetch_key": None,
+    })
+    valid_refs = [PlaceRef.from_place(p) for p in valid_places]
+    invalid_refs = [PlaceRef.from_place(p, reasons) for p, reasons in invalid_places]
+    return valid_refs, invalid_refs, ranking, last_search
+
+async def take_prefetched_places(
+    ranking: PlaceRanking, last_search: SearchContext | None, page_size: int = PLACES_PAGE_SIZE
+) -> Tuple[List[PlaceRef], List[PlaceRef], PlaceRanking, SearchContext] | None:
+    """The last search's later pages merged into its ranking (see merge_prefetched_places), if they're in.
+    They are only waited for if the ranking doesn't have a full page left without them. None if there
+    are none (yet)."""
+    if last_search is None or last_search.prefetch_key is None:
+        return None
+    prefetcher = get_page_prefetcher()
+    if ranking.remaining < page_size:
+        more_places = await prefetcher.wait(last_search.prefetch_key)
+    else:
+        more_places = prefetcher.take(last_search.prefetch_key)
+    if more_places is None:
+        return None
+    return merge_prefetched_places(more_places, ranking, last_search)
 
 @tool(response_format="content_and_artifact")
-def google_maps_text_search_and_filter(api_query: str, state: Annotated[dict, InjectedState]) -> Tuple[List[Place], List[Tuple[Place, str]]]:
-    """A tool which can perform a text search, using Google's Places API"""
+async def google_maps_text_search_and_filter(api_query: str, state: Annotated[dict, InjectedState]) -> Tuple[List[PlaceRef], List[PlaceRef], PlaceRanking | None, SearchContext | None]:
+    """A tool which can perform a text search, using Google's Places API. The api_query can hold several
+    queries, one per line (e.g. one per kind of food), which are searched at the same time. If only the
+    user's preferences changed since the last search (not the cuisines or location), its places are
+    re-ranked instead."""
     
     # Collect the parameters for the API request
     optional_parameters = get_maps_text_search_parameters(state)
     api_parameters = {
         'textQuery': api_query,
+        'pageSize': min(PLACES_SEARCH_PAGE_SIZE, PLACES_MAX_CANDIDATES),
         **optional_parameters
     }
 
-    # Perform API request to get the places with the user's desired preferences
-    url = 'https://places.googleapis.com/v1/places:searchText'
-    headers = {
-        'Content-Type': 'application/json',
-        'X-Goog-Api-Key': os.environ['GOOGLE_MAPS_API_KEY'],
-        'X-Goog-FieldMask': GOOGLE_FIELD_MASK
-    }
-
-    response = requests.post(url, headers=headers, json=api_parameters)
-    places = get_places_from_json(response.json())
-
     try:
-        valid_places, invalid_places = filter_places(places, state["user_preferences"])
-        return f"Obtained {len(valid_places)} places and {len(invalid_places)} invalid places!", (valid_places, invalid_places)
+        field_mask = GOOGLE_LEAN_FIELD_MASK if PLACES_TWO_PHASE_FETCH else GOOGLE_FIELD_MASK
+        field_mask = f"{field_mask},{GOOGLE_NEXT_PAGE_TOKEN_FIELD}"
+        place_store = get_place_store()
+        prefetch_key = None
+        distances = None
+        user_coordinates = state['user_coordinates']
+        queries = search_queries(api_query, state["user_preferences"], bool(user_coordinates))
+        reranked = await rerank_last_search(state, optional_parameters, queries)
+        if reranked is not None:
+            valid_places, invalid_places, place_names = reranked
+            # Its later pages may still be on the way
+            if get_page_prefetcher().is_pending(state["last_search"].prefetch_key):
+                prefetch_key = state["last_search"].prefetch_key
+        else:
+            # Each query (e.g. one per cuisine) is searched at the same time, and their places are merged
+            # without repeats, then filtered together
+            searches = [{**api_parameters, 'textQuery': query} for query in queries]
+            first_pages = await asyncio.gather(*(search_first_page(search, field_mask) for search in searches))
+            places = dedupe_places(place for page, _ in first_pages for place in page)
+            # Only the first pages are waited for. The rest are fetched in the background, and merged
+            # into the search's places when the user asks for more (or refines their preferences)
+            more_pages = [(search, page_token, page) for search, (page, page_token) in zip(searches, first_pages) if page_token]
+            if more_pages and len(places) < PLACES_MAX_CANDIDATES:
+                prefetch_key = start_page_prefetch(more_pages, field_mask, len(places))
+            if user_coordinates:
+                # The distances are computed once, for dropping the places that are too far and for scoring
+                places, distances = filter_by_distance(places, user_coordinates, state['desired_max_distance_meters'])
+            valid_places, invalid_places = split_valid_places(places, state["user_preferences"])
+            if distances is not None:
+                distances = valid_distances(places, distances, valid_places)
+            place_names = [p.name for p in places]
+        search_context = SearchContext(
+            parameters=optional_parameters,
+            queries=normalized_queries(queries),
+            user_preferences=state["user_preferences"].model_copy(deep=True),
+            place_names=place_names,
+            user_coordinates=tuple(user_coordinates) if user_coordinates else None,
+            max_distance_meters=state['desired_max_distance_meters'] if user_coordinates else None,
+            prefetch_key=prefetch_key,
+        )
+
+        # Only the first page is ranked now (top-k selection). The ranking is kept in the state, so
+        # show_more_places can page through the rest without searching again
+        scores = score_candidates(valid_places, search_context, distances)
+        ranking = first_page_ranking([p.name for p in valid_places], scores, PLACES_PAGE_SIZE)
+        first_page = set(ranking.ranked)
+        valid_places = [valid_places[i] for i in ranking.ranked] + [p for i, p in enumerate(valid_places) if i not in first_page]
+        if PLACES_TWO_PHASE_FETCH and valid_places:
+            valid_places = await fetch_place_details(valid_places)
+            await asyncio.to_thread(place_store.upsert_places, valid_places[:PLACES_DETAILS_TOP_N])
+
+        # The artifact is kept in the message history (and every checkpoint), so it only references the
+        # places; all of them were written to the place store above
+        valid_refs = [PlaceRef.from_place(p) for p in valid_places]
+        invalid_refs = [PlaceRef.from_place(p, reasons) for p, reasons in invalid_places]
+        return f"Obtained {len(valid_places)} places and {len(invalid_places)} invalid places!", (valid_refs, invalid_refs, ranking, search_context)
     except Exception as e:
-        return f"Failed to get places: {str(e)}", ([], [])
\ No newline at end of file
+        return f"Failed to get places: {str(e)}", ([], [], None, None)
+
+@tool(response_format="content_and_artifact")
+async def show_more_places(state: Annotated[dict, InjectedState]) -> Tuple[List[str], PlaceRanking | None, Tuple[List[PlaceRef], List[PlaceRef], SearchContext] | None]:
+    """Show the user more places from the last search (the next best ranked ones they haven't seen yet),
+    without searching Google Maps again"""
+    ranking = state.get("place_ranking")
+    if ranking is None:
+        return "There are no more places from the last search to show.", ([], ranking, None)
+    # The search's later pages, if they were fetched in the background since
+    merged = None
+    prefetched = await take_prefetched_places(ranking, state.get("last_search"))
+    if prefetched is not None:
+        valid_refs, invalid_refs, ranking, last_search = prefetched
+        merged = (valid_refs, invalid_refs, last_search)
+    if ranking.remaining <= 0:
+        return "There are no more places from the last search to show.", ([], ranking, merged)
+    places, ranking = await next_page_of_places(ranking)
+    page = [p.name for p in places]
+    return f"Showing {len(page)} more places ({ranking.remaining} left).", (page, ranking, merged)
+
+
+async def next_page_of_places(ranking: PlaceRanking, page_size: int = PLACES_PAGE_SIZE) -> Tuple[List[Place], PlaceRanking]:
+    """The next page of a search's ranked places, from the place store (no new search), and the
+    ranking with them marked shown"""
+    page, ranking = next_ranked_page(ranking, page_size)
+    place_store = get_place_store()
+    places = await place_store.aget_places(page)
+    if PLACES_TWO_PHASE_FETCH and places:
+        # Only the first page's details were fetched with the search
+        places = await fetch_place_details(places, top_n=len(places))
+        await asyncio.to_thread(place_store.upsert_places, places)
+    return places, ranking
@@ -0,0 +1,103 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.schemas import Place, PlaceRef, SearchContext, UserPreferences
+from app.graph.tools.invalid_reasons import InvalidReason
+from app.graph.tools.restrictions import BOOLEAN_RESTRICTIONS, compile_restriction_plan
+
+# Re-ranking the last search's places when the user only refines their preferences
+# ("actually we need outdoor seating", "make it 8 people"), instead of searching Google Maps again.
+# The result (valid places, and invalid places with why) is the same as filtering them again.
+
+# The preference each invalid reason code comes from
+REASON_PREFERENCES = {
+    **{code: pref for pref, (_, code) in BOOLEAN_RESTRICTIONS.items()},
+    "no_large_groups": "party_size",
+    "too_few_ratings": "desired_minimum_num_ratings",
+    "not_vegan": "dietary_requests",
+    "not_vegetarian": "dietary_requests",
+    "no_free_parking": "wants_free_parking",
+    "no_hours_info": "desired_time_and_stay_duration",
+    "closed_on_day": "desired_time_and_stay_duration",
+    "closes_before_stay_ends": "desired_time_and_stay_duration",
+    "closed_at_time": "desired_time_and_stay_duration",
+}
+
+# The order a RestrictionPlan checks each preference's restrictions in (opening hours last),
+# since a place's invalid reason is the first restriction it fails
+RESTRICTION_ORDER = {pref: i for i, pref in enumerate(UserPreferences.model_fields)}
+RESTRICTION_ORDER["desired_time_and_stay_duration"] = len(RESTRICTION_ORDER)
+
+def restriction_order(reason: InvalidReason) -> int:
+    return RESTRICTION_ORDER.get(REASON_PREFERENCES.get(reason.code), len(RESTRICTION_ORDER))
+
+# A place, and why it's currently invalid (empty if valid, None if it was never checked)
+Candidate = Tuple[Place, Optional[Tuple[InvalidReason, ...]]]
+
+def changed_preferences(old: UserPreferences, new: UserPreferences) -> Set[str]:
+    return {pref for pref in UserPreferences.model_fields if getattr(old, pref) != getattr(new, pref)}
+
+def normalized_queries(queries: List[str]) -> List[str]:
+    """The text searches, compared without case or extra whitespace"""
+    return [" ".join(query.lower().split()) for query in queries]
+
+def can_rerank(last_search: Optional[SearchContext], parameters: Dict[str, Any], user_preferences: UserPreferences, queries: List[str]) -> bool:
+    """The last search's places can be re-ranked if the search would be the same: same text queries,
+    same optional parameters (location, price level, rating) and the same cuisines"""
+    return (
+        last_search is not None
+        and bool(last_search.place_names)
+        and last_search.queries == normalized_queries(queries)
+        and last_search.parameters == parameters
+        and last_search.user_preferences.desired_cuisines.value == user_preferences.desired_cuisines.value
+    )
+
+def load_candidates(place_names: List[str], valid_refs: Dict[str, PlaceRef], invalid_refs: Dict[str, PlaceRef], places: List[Place]) -> Optional[List[Candidate]]:
+    """The last search's places (loaded from the place store), each with why it's currently invalid,
+    in the order the search found them. None if any of them is missing from the store."""
+    by_name = {place.name: place for place in places}
+    candidates = []
+    for name in place_names:
+        if name not in by_name:
+            return None
+        if name in valid_refs:
+            candidates.append((by_name[name], ()))
+        elif name in invalid_refs:
+            candidates.append((by_name[name], tuple(InvalidReason(*reason) for reason in invalid_refs[name].invalid_reasons)))
+        else:
+            # e.g. from a later page of the search, fetched after it was filtered
+            candidates.append((by_name[name], None))
+    return candidates
+
+def rerank_candidates(candidates: List[Candidate], old_preferences: UserPreferences, new_preferences: UserPreferences) -> Tuple[List[Place], List[Tuple[Place, Tuple[InvalidReason, ...]]]]:
+    """Re-filter the last search's places for the new preferences, re-running only the restrictions
+    of the preferences that changed:
+    - a valid place passed every old restriction, so it's only checked against the changed ones
+    - an invalid place that failed an unchanged restriction still fails it, so it's only checked against
+      the changed ones too, and takes a changed restriction's reason if that one is checked first
+    - an invalid place that failed a changed restriction is checked against all of the new ones
+      (the rest were never run on it, since checks stop at the first failure), and restored if it passes
+    - a place that was never checked is checked against all of the new ones
+    Returns the valid places and the invalid places with why, both in the order given, the same as
+    split_valid_places would on the same places."""
+    changed = changed_preferences(old_preferences, new_preferences)
+    recheck = [
+        reasons is None or any(REASON_PREFERENCES.get(InvalidReason(*reason).code) in changed for reason in reasons)
+        for _, reasons in candidates
+    ]
+    changed_indices = [i for i in range(len(candidates)) if not recheck[i]] if changed else []
+    recheck_indices = [i for i in range(len(candidates)) if recheck[i]]
+    results = [reasons for _, reasons in candidates]
+    if changed_indices:
+        changed_plan = compile_restriction_plan(new_preferences, only=changed)
+        for i, reasons in zip(changed_indices, changed_plan.check_all([candidates[i][0] for i in changed_indices])):
+            old_reasons = results[i]
+            if not old_reasons or (reasons and restriction_order(reasons[0]) < restriction_order(InvalidReason(*old_reasons[0]))):
+                results[i] = reasons
+    if recheck_indices:
+        full_plan = compile_restriction_plan(new_preferences)
+        for i, reasons in zip(recheck_indices, full_plan.check_all([candidates[i][0] for i in recheck_indices])):
+            results[i] = reasons
+
+    valid_places = [place for (place, _), reasons in zip(candidates, results) if not reasons]
+    invalid_places = [(place, reasons) for (place, _), reasons in zip(candidates, results) if reasons]
+    return valid_places, invalid_places
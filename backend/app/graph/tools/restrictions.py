@@ -0,0 +1,130 @@
+from datetime import datetime
+from operator import attrgetter
+from typing import Callable, Collection, List, Optional, Sequence, Tuple
+
+from app.schemas import Place, PreferenceWeight, UserPreferences
+from app.schemas.schema import ParkingOptions
+from app.graph.tools.invalid_reasons import InvalidReason
+from app.graph.tools.opening_hours import check_open_hours, OpeningHoursBatch
+
+# A restriction takes a place and returns None if the place passes, otherwise why it failed
+Restriction = Callable[[Place], Optional[InvalidReason]]
+
+# Boolean preferences that, as restrictions, just need the matching Place attribute to be true
+BOOLEAN_RESTRICTIONS = {
+    "wants_family_friendly": ("good_for_children", "not_family_friendly"),
+    "wants_childrens_menu": ("menu_for_children", "no_childrens_menu"),
+    "wants_outdoor_seating": ("outdoor_seating", "no_outdoor_seating"),
+    "wants_live_music": ("live_music", "no_live_music"),
+    "wants_dessert": ("serves_dessert", "no_dessert"),
+    "wants_beer": ("serves_beer", "no_beer"),
+    "wants_wine": ("serves_wine", "no_wine"),
+    "wants_brunch": ("serves_brunch", "no_brunch"),
+    "wants_cocktails": ("serves_cocktails", "no_cocktails"),
+    "wants_coffee": ("serves_coffee", "no_coffee"),
+}
+
+PARKING_OPTION_FIELDS = tuple(ParkingOptions.model_fields)
+
+def _requires_attribute(attr: str, code: str) -> Restriction:
+    get_attr = attrgetter(attr)
+    reason = InvalidReason(code)
+    return lambda place: None if get_attr(place) else reason
+
+def _has_parking_option(place: Place) -> bool:
+    parking_options = place.parking_options
+    if parking_options is None:
+        return False
+    return any(getattr(parking_options, attr) for attr in PARKING_OPTION_FIELDS)
+
+def _compile_preference(pref: str, pref_weight: PreferenceWeight) -> List[Restriction]:
+    """The restriction(s) for a single preference the user needs (weight of 1.0)"""
+    value = pref_weight.value
+    if pref in BOOLEAN_RESTRICTIONS:
+        return [_requires_attribute(*BOOLEAN_RESTRICTIONS[pref])]
+    match pref:
+        # For party size, check for goodForGroups (parties of 6+)
+        case "party_size" if value >= 6:
+            return [_requires_attribute("good_for_groups", "no_large_groups")]
+        # For minimum number of ratings, check if the place has enough ratings
+        case "desired_minimum_num_ratings":
+            reason = InvalidReason("too_few_ratings", value)
+            return [lambda place: reason if place.user_rating_count < value else None]
+        # Can only check with servesVegetarianFood and if "vegan" is in primary_type_display_name_text
+        case "dietary_requests":
+            restrictions = []
+            if "vegan" in value:
+                not_vegan = InvalidReason("not_vegan")
+                restrictions.append(lambda place: None if "vegan" in place.primary_type_display_name_text.lower() else not_vegan)
+            if "vegetarian" in value:
+                restrictions.append(_requires_attribute("serves_vegetarian_food", "not_vegetarian"))
+            return restrictions
+        # For parking, make sure there is at least 1 parking option, if they need free parking (which is default)
+        case "wants_free_parking":
+            no_free_parking = InvalidReason("no_free_parking")
+            return [lambda place: None if _has_parking_option(place) else no_free_parking]
+    return []
+
+class RestrictionPlan:
+    """The user's restrictions, compiled once per UserPreferences into a flat list of checks.
+    Checks run in preference order, with the opening hours check (the most expensive) last."""
+    def __init__(self, restrictions: List[Restriction], user_stay: Optional[Tuple[datetime, int]] = None):
+        self.restrictions = restrictions
+        self.user_stay = user_stay
+
+    def __len__(self) -> int:
+        return len(self.restrictions) + (self.user_stay is not None)
+
+    def check(self, place: Place, early_exit: bool = True) -> Tuple[InvalidReason, ...]:
+        """Reasons the place fails the restrictions (empty if it passes). With early_exit, stop
+        at the first failed restriction"""
+        reasons = []
+        for restriction in self.restrictions:
+            reason = restriction(place)
+            if reason is not None:
+                if early_exit:
+                    return (reason,)
+                reasons.append(reason)
+        if self.user_stay is not None:
+            reason = check_open_hours(place, self.user_stay)
+            if reason is not None:
+                reasons.append(reason)
+        return tuple(reasons)
+
+    def check_all(self, places: Sequence[Place]) -> List[Tuple[InvalidReason, ...]]:
+        """Same as check (with early exit) for every place, but the opening hours of the places that
+        pass everything else are checked together in one batch"""
+        results = []
+        needs_hours_check = []
+        for place in places:
+            reason = None
+            for restriction in self.restrictions:
+                reason = restriction(place)
+                if reason is not None:
+                    break
+            if reason is None and self.user_stay is not None:
+                needs_hours_check.append(len(results))
+            results.append((reason,) if reason is not None else ())
+
+        if needs_hours_check:
+            hours_reasons = OpeningHoursBatch([places[i] for i in needs_hours_check]).check(self.user_stay)
+            for i, reason in zip(needs_hours_check, hours_reasons):
+                if reason is not None:
+                    results[i] = (reason,)
+        return results
+
+def compile_restriction_plan(user_preferences: UserPreferences, only: Optional[Collection[str]] = None) -> RestrictionPlan:
+    """A restriction is defined by a preference with a weight of 1.0 (the user needs this to be true),
+    which contains a non-default (truthy) value. The desired time and stay duration are always a restriction.
+    With only, just the restrictions of those preferences (e.g. the ones that changed)."""
+    restrictions = []
+    for pref in UserPreferences.model_fields:
+        if only is not None and pref not in only:
+            continue
+        pref_weight = getattr(user_preferences, pref)
+        if isinstance(pref_weight, PreferenceWeight) and pref_weight.weight == 1.0 and pref_weight.value:
+            restrictions.extend(_compile_preference(pref, pref_weight))
+
+    # For desired time and stay duration, check if the place is open at the desired timeframe
+    check_stay = only is None or "desired_time_and_stay_duration" in only
+    return RestrictionPlan(restrictions, user_preferences.desired_time_and_stay_duration if check_stay else None)
@@ -0,0 +1,165 @@
+from operator import attrgetter
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.schemas import Place, PlaceRanking, UserPreferences
+from app.schemas.schema import ParkingOptions
+
+# Preferences that add their weight to a place's score when the matching Place attribute is true
+# (in UserPreferences field order)
+BOOLEAN_SCORE_COLUMNS = {
+    "wants_family_friendly": "good_for_children",
+    "wants_childrens_menu": "menu_for_children",
+    "wants_outdoor_seating": "outdoor_seating",
+    "wants_live_music": "live_music",
+    "wants_dessert": "serves_dessert",
+    "wants_beer": "serves_beer",
+    "wants_wine": "serves_wine",
+    "wants_brunch": "serves_brunch",
+    "wants_cocktails": "serves_cocktails",
+    "wants_coffee": "serves_coffee",
+}
+FEATURE_COLUMNS = list(BOOLEAN_SCORE_COLUMNS.values()) + ["serves_vegetarian_food"]
+FEATURE_INDEX = {attr: i for i, attr in enumerate(FEATURE_COLUMNS)}
+
+# Same constants as calculate_rating_score
+RATING_SHORTFALL_SCALE = 0.2
+RATING_MAX_EXCESS = 1000
+
+# Number of ParkingOptions fields that start with "free" (calculate_place_score counts fields, not values)
+NUM_FREE_PARKING_FIELDS = sum(1 for k in ParkingOptions.model_fields if k.startswith("free"))
+
+class PlaceFeatures:
+    """Columnar encoding of a list of places, built once and scored against any UserPreferences.
+    - `flags` is an (n, len(FEATURE_COLUMNS)) boolean matrix of the Place attributes scoring reads
+    - `user_rating_count` and `is_vegan_type` are per-place columns for the non-boolean terms
+    - `latitude` and `longitude` are for the distance from the user (see distance_scores)"""
+    def __init__(self, places: Sequence[Place]):
+        self.places = list(places)
+        get_flags = attrgetter(*FEATURE_COLUMNS)
+        self.flags = np.array([get_flags(p) for p in self.places], dtype=bool).reshape(len(self.places), len(FEATURE_COLUMNS))
+        self.user_rating_count = np.array([p.user_rating_count for p in self.places], dtype=np.float64)
+        self.is_vegan_type = np.array(["vegan" in p.primary_type_display_name_text.lower() for p in self.places], dtype=bool)
+        self.latitude = np.array([p.location.latitude for p in self.places], dtype=np.float64)
+        self.longitude = np.array([p.location.longitude for p in self.places], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+class PreferenceTerms:
+    """UserPreferences encoded once into the score terms they contribute, in the same order
+    calculate_place_score adds them. Each term is one of:
+    - ("rating", min_num_ratings, weight)
+    - ("dietary", needs_vegan, needs_vegetarian, weight)
+    - ("constant", amount)
+    - ("flag", feature column index, weight)"""
+    def __init__(self, terms: List[Tuple[Any, ...]]):
+        self.terms = terms
+
+def encode_preferences(user_preferences: UserPreferences) -> PreferenceTerms:
+    terms = []
+    for pref in UserPreferences.model_fields:
+        if pref in ('desired_time_and_stay_duration', 'party_size'):
+            continue
+        pref_weight = getattr(user_preferences, pref)
+        # Same check as calculate_place_score (note that 0 == False, but [] != False)
+        if pref_weight.value == False:
+            continue
+        value, weight = pref_weight.value, pref_weight.weight
+        if pref == "desired_minimum_num_ratings":
+            terms.append(("rating", value, weight))
+        elif pref == "dietary_requests":
+            terms.append(("dietary", "vegan" in value, "vegetarian" in value, weight))
+        elif pref == "wants_free_parking":
+            terms.append(("constant", 0.25 + (0.25 * NUM_FREE_PARKING_FIELDS) + weight))
+        elif pref in BOOLEAN_SCORE_COLUMNS:
+            terms.append(("flag", FEATURE_INDEX[BOOLEAN_SCORE_COLUMNS[pref]], weight))
+    return PreferenceTerms(terms)
+
+def rating_scores(user_rating_count: np.ndarray, user_preference_rating_count: float, weight: float) -> np.ndarray:
+    """Vectorized calculate_rating_score"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shortfall = (user_rating_count / user_preference_rating_count) * RATING_SHORTFALL_SCALE * weight
+    excess = np.maximum(user_rating_count - user_preference_rating_count, 0)
+    excess_score = np.minimum(1, np.log(excess + 1) / np.log(RATING_MAX_EXCESS + 1)) * weight
+    return np.where(user_rating_count < user_preference_rating_count, shortfall, excess_score)
+
+def score_places(features: PlaceFeatures, preference_terms: PreferenceTerms) -> np.ndarray:
+    """Scores for every place at once. Terms are accumulated in the same order as calculate_place_score,
+    so the floating point sums (and therefore ties in the ranking) come out the same."""
+    scores = np.zeros(len(features))
+    for term in preference_terms.terms:
+        kind = term[0]
+        if kind == "flag":
+            scores += features.flags[:, term[1]] * term[2]
+        elif kind == "rating":
+            scores += rating_scores(features.user_rating_count, term[1], term[2])
+        elif kind == "dietary":
+            _, needs_vegan, needs_vegetarian, weight = term
+            accommodates = np.ones(len(features), dtype=bool)
+            if needs_vegan:
+                accommodates &= features.is_vegan_type
+            if needs_vegetarian:
+                accommodates &= features.flags[:, FEATURE_INDEX["serves_vegetarian_food"]]
+            scores += accommodates * (1.0 * weight)
+        elif kind == "constant":
+            scores += term[1]
+    return scores
+
+def distance_scores(distances: np.ndarray, max_distance_meters: float, weight: float) -> np.ndarray:
+    """Score term for how close places are: the full weight at the user's location, down to 0 at
+    max_distance_meters (and beyond)"""
+    if max_distance_meters <= 0:
+        return np.zeros(len(distances))
+    return np.clip(1.0 - distances / max_distance_meters, 0.0, 1.0) * weight
+
+def top_k_indices(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """Indices of the k highest scores, highest first, with equal scores in their original order.
+    The same as the first k of a stable argsort, but only the k (plus any ties at the cutoff) are
+    sorted, after an O(n) partition. All of them if k is None."""
+    scores = np.asarray(scores, dtype=np.float64)
+    if k is None or k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    cutoff = np.partition(-scores, k - 1)[k - 1]
+    candidates = np.flatnonzero(-scores <= cutoff)
+    return candidates[np.argsort(-scores[candidates], kind='stable')][:k]
+
+def rank_places(places: Sequence[Place], user_preferences: UserPreferences, features: Optional[PlaceFeatures] = None, top_k: Optional[int] = None) -> List[Place]:
+    """Sort places by score, highest first. Places with equal scores keep their original
+    order (same as sorted(..., reverse=True)). With top_k, only the first top_k are returned"""
+    if not places:
+        return []
+    features = features if features is not None else PlaceFeatures(places)
+    scores = score_places(features, encode_preferences(user_preferences))
+    return [features.places[i] for i in top_k_indices(scores, top_k)]
+
+# ~~~~~~ Paging through a search's ranked places ~~~~~~
+def first_page_ranking(names: Sequence[str], scores: np.ndarray, page_size: int) -> PlaceRanking:
+    """Ranking for a search's valid places, with only the first page selected so far"""
+    return PlaceRanking(names=list(names), scores=[float(s) for s in scores], ranked=top_k_indices(scores, page_size).tolist())
+
+def next_ranked_page(ranking: PlaceRanking, page_size: int) -> Tuple[List[str], PlaceRanking]:
+    """The names of the next page_size places not shown yet, and the ranking with them marked shown.
+    The rest of the ranking is sorted once, the first time it's needed, so pages are O(page_size) after."""
+    if ranking.shown + page_size > len(ranking.ranked) and len(ranking.ranked) < len(ranking.names):
+        # The places shown so far keep their place, the rest are sorted after them
+        shown = ranking.ranked[:ranking.shown]
+        unshown = np.ones(len(ranking.names), dtype=bool)
+        unshown[shown] = False
+        rest = np.flatnonzero(unshown)
+        ordered_rest = rest[top_k_indices(np.array(ranking.scores)[rest])]
+        ranking = ranking.model_copy(update={"ranked": shown + ordered_rest.tolist()})
+    page = ranking.ranked[ranking.shown:ranking.shown + page_size]
+    return [ranking.names[i] for i in page], ranking.model_copy(update={"shown": ranking.shown + len(page)})
+
+def extend_ranking(ranking: PlaceRanking, names: Sequence[str], scores: np.ndarray) -> PlaceRanking:
+    """The ranking with more valid places added (e.g. from a search's later pages). The places shown
+    so far stay shown; the next pages are picked from the rest and the new ones together."""
+    return ranking.model_copy(update={
+        "names": ranking.names + list(names),
+        "scores": ranking.scores + [float(s) for s in scores],
+        "ranked": ranking.ranked[:ranking.shown],
+    })
@@ -3,19 +3,27 @@ import os
 from uuid import uuid4
 from typing import Dict, Any, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
 
 from langchain_core.messages import HumanMessage
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph.graph import CompiledGraph
 
 from app.schemas import ChatMessage, Feedback, UserInput, StreamInput
 #from app.routers import chat
 from app.graph.food_finder_agent import food_finder_agent, create_initial_state, DEFAULT_AGENT_STATE
-from app.schemas import ChatRequest, AgentState
+from app.graph.tools.places_client import close_places_client
+from app.graph.tools.places_cache import close_places_cache
+from app.graph.tools.place_store import start_place_store_maintenance, close_place_store
+from app.graph.tools.places_prefetch import close_page_prefetcher
+from app.services.checkpointer import open_checkpointer, checkpointer_metrics
+from app.services.llm_cache import get_llm_cache, close_llm_cache
+from app.graph.tools.places_search import next_page_of_places, take_prefetched_places
+from app.services.chat_stream import stream_agent_events, PLACE_EVENT_FIELDS
+from app.schemas import ChatRequest, ChatStreamRequest, AgentState
 
 import logging
 logging.basicConfig(filename='debug.log', level=logging.DEBUG)
@@ -28,12 +36,21 @@ ENVIRON = "dev"
 # TODO: fix this
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Construct agent with Sqlite chectkpointer
-    async with AsyncSqliteSaver.from_conn_string("checkpoints.db") as saver:
+    # Construct agent with the configured checkpointer (see app/services/checkpointer.py)
+    async with open_checkpointer() as saver:
         food_finder_agent.checkpointer = saver
         app.state.agent = food_finder_agent
+        app.state.checkpointer = saver
+        # Old places and searches are pruned in the background, like old checkpoints
+        start_place_store_maintenance()
         yield
-    # context manager will clean up the AsyncSqliteSaver on exit
+    # context manager commits pending checkpoint writes and closes the database on exit
+    # Close the shared Places API connection pool, search cache, place store and LLM result cache
+    close_page_prefetcher()
+    await close_places_cache()
+    await close_places_client()
+    close_place_store()
+    close_llm_cache()
 
 app = FastAPI(lifespan=lifespan)
 #app = FastAPI()
@@ -44,6 +61,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # So the frontend can keep using the thread /chat/invoke-with-history started
+    expose_headers=["X-Thread-Id"],
 )
 
 # TODO: Hook up chatbot-ui with UVICORN_SERVER_HOST:UVICORN_SERVER_PORT/chat/invoke
@@ -81,7 +100,7 @@ def _parse_input(user_input: UserInput, user_coordinates: Tuple[float, float] |
 # TODO: Add this back to routers
 # TODO: get the frontend to have persistent thread_id
 @app.post("/chat/invoke-with-history")
-async def invoke_with_history(chat_request: ChatRequest):
+async def invoke_with_history(chat_request: ChatRequest, response: Response):
     agent: CompiledGraph = app.state.agent
 
     user_location = chat_request.userLocation
@@ -90,19 +109,76 @@ async def invoke_with_history(chat_request: ChatRequest):
     last_user_message = chat_request.messages[-1].content
     user_input: UserInput = UserInput(message=last_user_message, thread_id=chat_request.thread_id)
     kwargs, run_id = _parse_input(user_input, user_location)
+    # A new thread's id, so the client can continue the conversation on it
+    response.headers["X-Thread-Id"] = kwargs["config"]["configurable"]["thread_id"]
 
     try:
         try:
-            response = await agent.ainvoke(**kwargs)
+            agent_response = await agent.ainvoke(**kwargs)
         except Exception as e:
             logging.error(f"Error invoking agent: {e}")
 
-        ai_last_message = response.get('messages')[-1].content
+        ai_last_message = agent_response.get('messages')[-1].content
         return ai_last_message
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def stream_chat(chat_request: ChatStreamRequest):
+    """Like /chat/invoke-with-history, but streams server-sent events as the agent runs (see
+    app/services/chat_stream.py), so the client can show progress before the answer is done"""
+    agent: CompiledGraph = app.state.agent
+
+    user_location = chat_request.userLocation
+    user_location = (user_location.latitude, user_location.longitude)
+
+    last_user_message = chat_request.messages[-1].content
+    user_input: UserInput = UserInput(message=last_user_message, thread_id=chat_request.thread_id)
+    kwargs, run_id = _parse_input(user_input, user_location)
+
+    return StreamingResponse(
+        stream_agent_events(agent, kwargs, chat_request.stream_tokens),
+        media_type="text/event-stream",
+        # Don't let proxies buffer the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/places/next")
+async def next_places(thread_id: str) -> Dict[str, Any]:
+    """The next page of the thread's last search, from its stored ranking (no new Places search)"""
+    agent: CompiledGraph = app.state.agent
+    config = RunnableConfig(configurable={"thread_id": thread_id})
+    state = await agent.aget_state(config)
+    ranking = state.values.get("place_ranking")
+    if ranking is None:
+        raise HTTPException(status_code=404, detail="No search results for this thread")
+
+    update = {}
+    # The search's later pages, if they were fetched in the background since
+    prefetched = await take_prefetched_places(ranking, state.values.get("last_search"))
+    if prefetched is not None:
+        valid_refs, invalid_refs, ranking, last_search = prefetched
+        update = {
+            "valid_places": {**state.values.get("valid_places", {}), **{ref.name: ref for ref in valid_refs}},
+            "invalid_places": {**state.values.get("invalid_places", {}), **{ref.name: ref for ref in invalid_refs}},
+            "last_search": last_search,
+        }
+    places, ranking = await next_page_of_places(ranking)
+    # Recorded as if the supervisor showed them, so the chat's "show more" carries on after this page
+    await agent.aupdate_state(config, {**update, "place_ranking": ranking}, as_node="team_supervisor_node")
+    return {"places": [place.model_dump(include=PLACE_EVENT_FIELDS, mode="json") for place in places], "remaining": ranking.remaining}
+
+@app.get("/metrics/checkpoints")
+async def get_checkpoint_metrics() -> Dict[str, Any]:
+    """Checkpoint database size and write latency"""
+    return await checkpointer_metrics(app.state.checkpointer)
+
+@app.get("/metrics/llm-cache")
+async def get_llm_cache_metrics() -> Dict[str, Any]:
+    """Hit/miss counters and size of the LLM result cache"""
+    cache = get_llm_cache()
+    return cache.metrics() if cache is not None else {"enabled": False}
 
 if __name__ == "__main__":  # pragma: no cover
     uvicorn.run(
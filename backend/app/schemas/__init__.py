@@ -1,3 +1,3 @@
-from .schema import UserInput, AgentResponse, ChatMessage, StreamInput, Feedback, Place, ChatRequest, RecommendedPlaceDetails, UserPreferences, AgentState, PreferenceWeight, Coordinates, CustomAIMessage, StateUpdaterOutputFormat, DateTimeExtract
+from .schema import UserInput, AgentResponse, ChatMessage, StreamInput, Feedback, Place, ChatRequest, ChatStreamRequest, RecommendedPlaceDetails, PlaceRef, PlaceRanking, SearchContext, UserPreferences, AgentState, PreferenceWeight, Coordinates, CustomAIMessage, StateUpdaterOutputFormat, DateTimeExtract, CombinedExtractionOutputFormat
 
-__all__ = ["UserInput", "AgentResponse", "ChatMessage", "StreamInput", "Feedback", "Place", "ChatRequest", "RecommendedPlaceDetails", "UserPreferences", "AgentState", "PreferenceWeight", "Coordinates", "CustomAIMessage", "StateUpdaterOutputFormat", "DateTimeExtract"]
+__all__ = ["UserInput", "AgentResponse", "ChatMessage", "StreamInput", "Feedback", "Place", "ChatRequest", "ChatStreamRequest", "RecommendedPlaceDetails", "PlaceRef", "PlaceRanking", "SearchContext", "UserPreferences", "AgentState", "PreferenceWeight", "Coordinates", "CustomAIMessage", "StateUpdaterOutputFormat", "DateTimeExtract", "CombinedExtractionOutputFormat"]
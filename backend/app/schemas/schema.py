@@ -1,6 +1,5 @@
 from typing import TypedDict, Dict, Any, List, Literal, Tuple, Annotated, Sequence, Optional
 from datetime import datetime
-import operator
 
 from langchain_core.messages import (
     BaseMessage,
@@ -11,7 +10,8 @@ from langchain_core.messages import (
     message_to_dict,
     messages_from_dict,
 )
-from pydantic import BaseModel, Field
+from langgraph.graph.message import add_messages
+from pydantic import AliasChoices, AliasPath, BaseModel, Field, PrivateAttr
 
 # ~~~~~~ Chat API models ~~~~~~
 class UserInput(BaseModel):
@@ -176,6 +176,13 @@ class ChatRequest(BaseModel):
     thread_id: str | None = Field(default=None)
     #customModelId: str = ""
 
+class ChatStreamRequest(ChatRequest):
+    """A request to the streaming chat route (/chat/stream)."""
+    stream_tokens: bool = Field(
+        description="Whether to stream the supervisor's tokens to the client.",
+        default=True,
+    )
+
 # ~~~~~~ Models for Google Places API and graph agents ~~~~~~
 class TimeInfo(BaseModel):
     """Information about a time, extracted from a places's information."""
@@ -188,11 +195,44 @@ class OpenClosePeriod(BaseModel):
     open: TimeInfo
     close: TimeInfo
 
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
 class RegularOpeningHours(BaseModel):
     """Regular opening hours for a place, which is a list of OpenClosePeriods
     throughout a typical week."""
     periods: List[OpenClosePeriod]
 
+    # The periods as (open, close) minute-of-week intervals sorted by open, computed once when
+    # the place is parsed (see app/graph/tools/opening_hours.py). A close that wraps past the end
+    # of the week is kept past MINUTES_PER_WEEK, so close is always after open.
+    _week_opens: Tuple[int, ...] = PrivateAttr(default=())
+    _week_closes: Tuple[int, ...] = PrivateAttr(default=())
+
+    def model_post_init(self, __context: Any) -> None:
+        intervals = []
+        for period in self.periods:
+            open_minute = period.open.hour * 60 + period.open.minute
+            close_minute = period.close.hour * 60 + period.close.minute
+            week_open = period.open.day * MINUTES_PER_DAY + open_minute
+            if period.close.day == period.open.day and close_minute < open_minute:
+                # Same day listed, but closes after midnight
+                length = close_minute - open_minute + MINUTES_PER_DAY
+            else:
+                length = (period.close.day * MINUTES_PER_DAY + close_minute - week_open) % MINUTES_PER_WEEK
+            intervals.append((week_open, week_open + length))
+        intervals.sort()
+        self._week_opens = tuple(o for o, _ in intervals)
+        self._week_closes = tuple(c for _, c in intervals)
+
+    @property
+    def week_opens(self) -> Tuple[int, ...]:
+        return self._week_opens
+
+    @property
+    def week_closes(self) -> Tuple[int, ...]:
+        return self._week_closes
+
 class ReviewText(BaseModel):
     """Text for a review (includes language indication)."""
     text: str
@@ -233,9 +273,17 @@ class Place(BaseModel):
     regular_opening_hours: RegularOpeningHours = Field(alias="regularOpeningHours")
     price_level: str = Field(alias="priceLevel", default="PRICE_LEVEL_UNSPECIFIED")
     user_rating_count: int = Field(alias="userRatingCount")
-    display_name_text: str = Field(alias="displayName.text")
-    primary_type_display_name_text: str = Field(alias="primaryTypeDisplayName.text")
-    reviews: List[Review]
+    # Read straight from the nested {"displayName": {"text": ...}} objects of the API response
+    # (or the flattened "displayName.text" key that by_alias dumps use)
+    display_name_text: str = Field(
+        validation_alias=AliasChoices(AliasPath("displayName", "text"), "displayName.text", "display_name_text"),
+        serialization_alias="displayName.text",
+    )
+    primary_type_display_name_text: str = Field(
+        validation_alias=AliasChoices(AliasPath("primaryTypeDisplayName", "text"), "primaryTypeDisplayName.text", "primary_type_display_name_text"),
+        serialization_alias="primaryTypeDisplayName.text",
+    )
+    reviews: List[Review] = Field(default_factory=list)
     dine_in: bool = Field(alias="dineIn", default=False)
     serves_lunch: bool = Field(alias="servesLunch", default=False)
     serves_dinner: bool = Field(alias="servesDinner", default=False)
@@ -259,15 +307,21 @@ class Place(BaseModel):
             for i, word in enumerate(string.split('_'))
         )
         populate_by_name = True
-    
-    @classmethod
-    def model_validate(cls, obj, *args, **kwargs):
-        if isinstance(obj, dict) and "displayName" in obj:
-            obj["displayName.text"] = obj["displayName"]["text"]
-        if isinstance(obj, dict) and "primaryTypeDisplayName" in obj:
-            obj["primaryTypeDisplayName.text"] = obj["primaryTypeDisplayName"]["text"]
-        return super().model_validate(obj, *args, **kwargs)
-    
+
+    # Reviews as they came from the API, when they were ingested lazily (see app/graph/tools/places_ingest.py)
+    _raw_reviews: Optional[List[Dict[str, Any]]] = PrivateAttr(default=None)
+
+    def set_raw_reviews(self, raw_reviews: List[Dict[str, Any]]) -> None:
+        """Keep the API's review dicts, to be validated on the first load_reviews() call"""
+        self._raw_reviews = raw_reviews
+
+    def load_reviews(self) -> List[Review]:
+        """The place's reviews, validating them first if they were ingested lazily"""
+        if self._raw_reviews is not None:
+            self.reviews = [Review.model_validate(r) for r in self._raw_reviews]
+            self._raw_reviews = None
+        return self.reviews
+
     def __str__(self):
         s = f"{self.display_name_text} - {self.primary_type_display_name_text}\n"
         s += f"Phone: {self.national_phone_number}\n"
@@ -329,15 +383,66 @@ class RecommendedPlaceDetails(BaseModel):
     # TODO: This would likely hold more information on certain places, after the user asks about them
     ...
 
+class PlaceRef(BaseModel):
+    """A compact reference to a Place, which is what the agent state (and so every checkpoint) holds.
+    The full Place lives in the shared place store (app/graph/tools/place_store.py), under the same name."""
+    name: str # Places API id (Place.name)
+    display_name_text: str
+    # Why the place was filtered out, as (code, detail) pairs (see app/graph/tools/invalid_reasons.py)
+    invalid_reasons: Tuple[Tuple[str, Any], ...] = ()
+
+    @classmethod
+    def from_place(cls, place: Place, invalid_reasons: Sequence[Tuple[str, Any]] = ()) -> "PlaceRef":
+        return cls(
+            name=place.name,
+            display_name_text=place.display_name_text,
+            invalid_reasons=tuple(tuple(reason) for reason in invalid_reasons),
+        )
+
+class PlaceRanking(BaseModel):
+    """The last search's valid places and their scores, kept in the agent state so the next pages
+    can be shown without searching again (see next_ranked_page in app/graph/tools/scoring.py)."""
+    names: List[str] # In search order
+    scores: List[float]
+    # Indices into names, highest score first. Only the pages selected so far, until the rest are needed
+    ranked: List[int] = Field(default_factory=list)
+    # How many of the ranked places have been shown
+    shown: int = 0
+
+    @property
+    def remaining(self) -> int:
+        return len(self.names) - self.shown
+
+class SearchContext(BaseModel):
+    """What the last search was made with: its text queries and optional API parameters (location, price level, rating),
+    the preferences its places were filtered and ranked by, and the places it found (in the order found).
+    If only preferences that don't change the search changed since, the places are re-ranked instead
+    (see app/graph/tools/rerank.py)."""
+    parameters: Dict[str, Any]
+    # Its text searches, normalized (see app/graph/tools/rerank.py)
+    queries: List[str] = []
+    user_preferences: UserPreferences
+    place_names: List[str] = []
+    # Where the user was, and how far they'd go, if they shared their location (places are scored by distance)
+    user_coordinates: Optional[Tuple[float, float]] = None
+    max_distance_meters: Optional[float] = None
+    # Key of the search's later pages, while they are fetched in the background (see app/graph/tools/places_prefetch.py)
+    prefetch_key: Optional[str] = None
+
 # Using TypedDict instead of pydantic BaseModel, as the latter doesnt work with InjectedState (in tool nodes)
 class AgentState(TypedDict, total=False):
     """The state for a given agent, passed around the graph and updated primarily after first user query."""
-    messages: Annotated[Sequence[BaseMessage], operator.add]
+    # Appended to, except that a message with the id of an existing one replaces it (the supervisor drops
+    # the artifacts of the tool messages it has read, so they aren't kept in every checkpoint)
+    messages: Annotated[Sequence[BaseMessage], add_messages]
     
     # If this is identified in users query, we go to datetime extractor node to extract datetime
     when_to_eat_specified: bool # default=False
     # We need this so we dont go to datetime extractor a second time
     datetime_extracted: bool # default=False
+    # What the datetime extractor found (it runs alongside the state updater, so before we know
+    # whether the user specified when to eat; see join_extractions_node)
+    extracted_datetime: Optional[datetime] # default=None
     # User preferences, which are also optional parameters to places API request
     '''
     Values for preferred_price_level (per person) can be:
@@ -374,11 +479,16 @@ class AgentState(TypedDict, total=False):
     
     user_preferences: UserPreferences
     
-    # Filtered places from the original text search (by team supervisor)
-    valid_places: Dict[str, Place]
+    # The last search's places that passed the filters (by team supervisor), keyed by Place.name. Replaced
+    # by each new search (later pages of the same search are added), so the state doesn't grow per search
+    valid_places: Dict[str, PlaceRef]
     
-    # Map of place name to reason why it was filtered out
-    invalid_places: Dict[str, Tuple[Place, str]]
+    # Same, for the places that were filtered out (PlaceRef.invalid_reasons says why)
+    invalid_places: Dict[str, PlaceRef]
+    # Ranking of the last search's valid places, and how many have been shown (for "show more")
+    place_ranking: Optional[PlaceRanking]  # default=None
+    # What the last search was made with, to tell whether a refined request needs a new one
+    last_search: Optional[SearchContext]  # default=None
     
     # End goal is for this to be true (user says yes to a recommended place) (future state - not used at the moment)
     found_place: bool  # default=False
@@ -420,4 +530,10 @@ class StateUpdaterOutputFormat(BaseModel):
 
 class DateTimeExtract(BaseModel):
     """The output format for the datetime extractor agent."""
-    dt: datetime
\ No newline at end of file
+    dt: datetime
+
+class CombinedExtractionOutputFormat(StateUpdaterOutputFormat):
+    """The output format for the combined extractor agent, which does the work of the state updater,
+    datetime extractor and maps query formulator in a single call."""
+    dt: Optional[datetime] = Field(default=None) # Only meaningful if when_to_eat_specified
+    maps_query: str
@@ -0,0 +1,111 @@
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.graph.graph import CompiledGraph
+
+from app.graph.food_finder_agent import NUM_RECS_TO_SHOW
+from app.graph.tools.place_store import get_place_store
+
+import logging
+
+# What the client is told each node is doing while it runs
+NODE_LABELS = {
+    "state_updater_node": "Extracting your preferences",
+    "datetime_extractor_node": "Working out when you want to eat",
+    "maps_query_formulator_node": "Writing the search query",
+    "combined_extractor_node": "Extracting your preferences",
+    "join_extractions_node": "Preferences extracted",
+    "google_maps_text_search_and_filter": "Searching Google Maps",
+    "team_supervisor_node": "Writing the answer",
+}
+
+# The Place fields sent for each ranked place
+PLACE_EVENT_FIELDS = {
+    "name", "display_name_text", "primary_type_display_name_text", "formatted_address", "national_phone_number",
+    "location", "rating", "user_rating_count", "price_level", "google_maps_uri", "website_uri",
+}
+
+async def place_summaries(names: List[str]) -> List[Dict[str, Any]]:
+    """The PLACE_EVENT_FIELDS of the named places, loaded from the place store"""
+    return [place.model_dump(include=PLACE_EVENT_FIELDS, mode="json") for place in await get_place_store().aget_places(names)]
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _node_end_details(node: str, output: Any) -> Dict[str, Any]:
+    """What each node found, for its node_end event"""
+    if not isinstance(output, dict):
+        return {}
+    details = {}
+    if "user_preferences" in output:
+        details["preferences"] = output["user_preferences"].model_dump(mode="json")
+    if output.get("extracted_datetime") is not None:
+        details["extracted_datetime"] = output["extracted_datetime"].isoformat()
+    if node in ("maps_query_formulator_node", "combined_extractor_node") and output.get("messages"):
+        details["maps_query"] = output["messages"][-1].content
+    return details
+
+async def _places_event(output: Any) -> Dict[str, Any] | None:
+    """The ranked places the search tool found (the top ones loaded from the place store)"""
+    messages = output.get("messages", []) if isinstance(output, dict) else []
+    tool_message = next((m for m in messages if isinstance(m, ToolMessage)), None)
+    if tool_message is None or not tool_message.artifact:
+        return None
+    if tool_message.name == "show_more_places":
+        # The next page of the last search
+        page, ranking = tool_message.artifact[:2]
+        return {"remaining": ranking.remaining if ranking else 0, "places": await place_summaries(page)}
+    valid_refs, invalid_refs = tool_message.artifact[:2]
+    return {
+        "valid_count": len(valid_refs),
+        "invalid_count": len(invalid_refs),
+        "places": await place_summaries([ref.name for ref in valid_refs[:NUM_RECS_TO_SHOW]]),
+    }
+
+async def sse_events_from_agent_event(event: Dict[str, Any], stream_tokens: bool = True) -> List[Tuple[str, Dict[str, Any]]]:
+    """Turn one astream_events (v2) event into the (event, data) pairs sent to the client"""
+    kind = event["event"]
+    node = event.get("metadata", {}).get("langgraph_node")
+
+    if kind == "on_chat_model_stream":
+        content = event["data"]["chunk"].content
+        if stream_tokens and node == "team_supervisor_node" and content:
+            return [("token", {"content": content})]
+        return []
+
+    # Only the graph's nodes, not the runnables inside them
+    if event["name"] not in NODE_LABELS or event["name"] != node:
+        return []
+    if kind == "on_chain_start":
+        return [("node_start", {"node": node, "label": NODE_LABELS[node]})]
+    if kind != "on_chain_end":
+        return []
+
+    output = event["data"].get("output")
+    events = [("node_end", {"node": node, **_node_end_details(node, output)})]
+    if node == "google_maps_text_search_and_filter":
+        places = await _places_event(output)
+        if places is not None:
+            events.append(("places", places))
+    elif node == "team_supervisor_node" and isinstance(output, dict):
+        last_message = output.get("messages", [None])[-1]
+        # A reply without a tool call is the answer for this turn
+        if isinstance(last_message, AIMessage) and not last_message.tool_calls:
+            events.append(("message", {"content": last_message.content}))
+    return events
+
+async def stream_agent_events(agent: CompiledGraph, kwargs: Dict[str, Any], stream_tokens: bool = True) -> AsyncIterator[str]:
+    """Run the agent, yielding server-sent events as it goes: node_start/node_end for each node,
+    token for the supervisor's tokens, places for the search results, message for the answer,
+    then done (or error)"""
+    thread_id = kwargs["config"]["configurable"]["thread_id"]
+    try:
+        async for event in agent.astream_events(kwargs["input"], kwargs["config"], version="v2"):
+            for name, data in await sse_events_from_agent_event(event, stream_tokens):
+                yield format_sse(name, data)
+    except Exception as e:
+        logging.error(f"Error streaming agent: {e}")
+        yield format_sse("error", {"detail": str(e)})
+        return
+    yield format_sse("done", {"thread_id": thread_id})
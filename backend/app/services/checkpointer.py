@@ -0,0 +1,293 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Sequence, Set
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+import logging
+
+# "sqlite" (default) or "memory" (nothing survives a restart, for tests and local experiments)
+CHECKPOINT_BACKEND = os.environ.get("CHECKPOINT_BACKEND", "sqlite")
+CHECKPOINT_DB_PATH = os.environ.get("CHECKPOINT_DB_PATH", "checkpoints.db")
+# Checkpoint writes made within this window share one commit. With synchronous=NORMAL in WAL mode
+# commits don't fsync, so this mostly saves the per-commit overhead; a crash can lose the last window
+CHECKPOINT_COMMIT_INTERVAL_SECONDS = float(os.environ.get("CHECKPOINT_COMMIT_INTERVAL_SECONDS", 0.05))
+# Retention, per thread: only the latest N checkpoints are kept, and none older than the max age
+# (0 turns either rule off)
+CHECKPOINT_KEEP_LAST = int(os.environ.get("CHECKPOINT_KEEP_LAST", 20))
+CHECKPOINT_MAX_AGE_SECONDS = float(os.environ.get("CHECKPOINT_MAX_AGE_SECONDS", 30 * 24 * 60 * 60))
+# How often pruning, incremental vacuuming and WAL truncation run in the background
+CHECKPOINT_MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get("CHECKPOINT_MAINTENANCE_INTERVAL_SECONDS", 300))
+# Pages freed per incremental vacuum step
+CHECKPOINT_VACUUM_PAGES = int(os.environ.get("CHECKPOINT_VACUUM_PAGES", 2000))
+
+SQLITE_PRAGMAS = (
+    # Only takes effect on a new database (before the tables are created), see _vacuum for existing ones
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    # Safe with WAL: a power loss (not an app crash) can lose the latest commits, never corrupt the database
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-32000",  # 32 MB
+    "PRAGMA mmap_size=268435456",  # 256 MB
+)
+
+# Same constant as in UUID v1/v6: 100ns intervals between 1582-10-15 and the unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+# Latency samples kept for the percentiles in the metrics
+_LATENCY_SAMPLES = 1000
+
+def checkpoint_id_at(timestamp: float) -> str:
+    """The smallest checkpoint id LangGraph can create at this unix time. Checkpoint ids are
+    uuid6 (time ordered), so every checkpoint created before this time has a smaller id."""
+    t = int(timestamp * 10_000_000) + _UUID_EPOCH_OFFSET
+    return str(uuid.UUID(int=((t >> 12) << 80) | (6 << 76) | ((t & 0xFFF) << 64)))
+
+def _percentiles_ms(samples: Sequence[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"p50": pick(0.50), "p95": pick(0.95), "max": ordered[-1] * 1000}
+
+class CheckpointMetrics:
+    """Counters and recent latencies of the checkpoint saver"""
+    def __init__(self):
+        self.counts = {"puts": 0, "put_writes": 0, "commits": 0, "pruned_checkpoints": 0, "vacuums": 0}
+        self.put_seconds: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.commit_seconds: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.last_maintenance_at: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        writes = self.counts["puts"] + self.counts["put_writes"]
+        return {
+            **self.counts,
+            "writes_per_commit": writes / self.counts["commits"] if self.counts["commits"] else 0.0,
+            "put_latency_ms": _percentiles_ms(self.put_seconds),
+            "commit_latency_ms": _percentiles_ms(self.commit_seconds),
+            "last_maintenance_at": self.last_maintenance_at,
+        }
+
+class _CoalescingConnection:
+    """Wraps the saver's aiosqlite connection, so that the commit after every put only schedules a
+    commit. Every write made before it runs is committed together. Everything else is passed through."""
+    def __init__(self, conn: aiosqlite.Connection, commit_interval_seconds: float, metrics: CheckpointMetrics):
+        self._conn = conn
+        self._commit_interval_seconds = commit_interval_seconds
+        self._metrics = metrics
+        self._pending_commit: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    async def commit(self) -> None:
+        if self._pending_commit is None or self._pending_commit.done():
+            self._pending_commit = asyncio.create_task(self._commit_later())
+
+    async def _commit_later(self) -> None:
+        await asyncio.sleep(self._commit_interval_seconds)
+        # Writes that come in from here on get a new commit
+        self._pending_commit = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Commit now"""
+        started = time.perf_counter()
+        await self._conn.commit()
+        self._metrics.commit_seconds.append(time.perf_counter() - started)
+        self._metrics.counts["commits"] += 1
+
+    async def aclose(self) -> None:
+        """Commit what's pending (call before closing the connection)"""
+        if self._pending_commit is not None and not self._pending_commit.done():
+            self._pending_commit.cancel()
+            self._pending_commit = None
+        await self.flush()
+
+class TunedAsyncSqliteSaver(AsyncSqliteSaver):
+    """AsyncSqliteSaver with tuned pragmas, coalesced commits (see _CoalescingConnection), per-thread
+    retention and a background maintenance task, and metrics (see metrics())."""
+    def __init__(
+        self,
+        conn: aiosqlite.Connection,
+        path: str = CHECKPOINT_DB_PATH,
+        commit_interval_seconds: float = CHECKPOINT_COMMIT_INTERVAL_SECONDS,
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+        max_age_seconds: float = CHECKPOINT_MAX_AGE_SECONDS,
+        maintenance_interval_seconds: float = CHECKPOINT_MAINTENANCE_INTERVAL_SECONDS,
+        **kwargs,
+    ):
+        self.metrics = CheckpointMetrics()
+        super().__init__(_CoalescingConnection(conn, commit_interval_seconds, self.metrics), **kwargs)
+        self.path = path
+        self.keep_last = keep_last
+        self.max_age_seconds = max_age_seconds
+        self.maintenance_interval_seconds = maintenance_interval_seconds
+        # Threads written to since the last maintenance run
+        self._dirty_threads: Set[str] = set()
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._pragmas_applied = False
+
+    async def setup(self) -> None:
+        if not self._pragmas_applied:
+            for pragma in SQLITE_PRAGMAS:
+                await self.conn.execute_fetchall(pragma)
+            self._pragmas_applied = True
+        await super().setup()
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        started = time.perf_counter()
+        result = await super().aput(config, checkpoint, metadata, new_versions)
+        self.metrics.put_seconds.append(time.perf_counter() - started)
+        self.metrics.counts["puts"] += 1
+        self._dirty_threads.add(str(config["configurable"]["thread_id"]))
+        return result
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, *args, **kwargs) -> None:
+        started = time.perf_counter()
+        await super().aput_writes(config, writes, task_id, *args, **kwargs)
+        self.metrics.put_seconds.append(time.perf_counter() - started)
+        self.metrics.counts["put_writes"] += 1
+
+    # ~~~~~~ Retention and maintenance ~~~~~~
+    def _retention_cutoff_id(self) -> str:
+        # With no max age, no id is older than the empty string
+        return checkpoint_id_at(time.time() - self.max_age_seconds) if self.max_age_seconds > 0 else ""
+
+    async def aprune_thread(self, thread_id: str) -> int:
+        """Delete the thread's checkpoints (and their pending writes) that are outside the retention
+        rules, returning how many checkpoints were deleted"""
+        keep_last = self.keep_last if self.keep_last > 0 else -1
+        async with self.lock:
+            async with self.conn.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, checkpoint_id, ROW_NUMBER() OVER (
+                            PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS newest_first
+                        FROM checkpoints WHERE thread_id = ?
+                    )
+                    WHERE (? > 0 AND newest_first > ?) OR checkpoint_id < ?
+                )
+                """,
+                (thread_id, keep_last, keep_last, self._retention_cutoff_id()),
+            ) as cursor:
+                deleted = cursor.rowcount
+            if deleted:
+                await self.conn.execute_fetchall(
+                    """
+                    DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (
+                        SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id
+                        AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id
+                    )
+                    """,
+                    (thread_id,),
+                )
+        self.metrics.counts["pruned_checkpoints"] += deleted
+        return deleted
+
+    async def _expired_threads(self) -> Set[str]:
+        """Threads that have checkpoints older than the max age (mostly abandoned conversations,
+        which are never written to, so they never become dirty)"""
+        if self.max_age_seconds <= 0:
+            return set()
+        async with self.conn.execute(
+            "SELECT DISTINCT thread_id FROM checkpoints WHERE checkpoint_id < ?", (self._retention_cutoff_id(),)
+        ) as cursor:
+            return {row[0] async for row in cursor}
+
+    async def _vacuum(self) -> None:
+        """Give the pages freed by pruning back to the file system, and truncate the WAL"""
+        async with self.conn.execute("PRAGMA auto_vacuum") as cursor:
+            auto_vacuum = (await cursor.fetchone())[0]
+        if auto_vacuum == 2:
+            # Frees a page per step, so it has to be read to the end
+            await self.conn.execute_fetchall(f"PRAGMA incremental_vacuum({CHECKPOINT_VACUUM_PAGES})")
+        else:
+            # A database created before auto_vacuum was set: one full VACUUM switches it over
+            await self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await self.conn.execute("VACUUM")
+        await self.conn.execute_fetchall("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.metrics.counts["vacuums"] += 1
+
+    async def run_maintenance(self) -> None:
+        """Prune the threads written to since the last run (and any with expired checkpoints), then vacuum"""
+        await self.setup()
+        threads = self._dirty_threads | await self._expired_threads()
+        self._dirty_threads = set()
+        deleted = 0
+        for thread_id in threads:
+            deleted += await self.aprune_thread(thread_id)
+        async with self.lock:
+            # VACUUM and a full WAL checkpoint can't run inside the open write transaction
+            await self.conn.flush()
+            if deleted:
+                await self._vacuum()
+        self.metrics.last_maintenance_at = time.time()
+
+    async def _maintenance_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.maintenance_interval_seconds)
+            try:
+                await self.run_maintenance()
+            except Exception as e:
+                logging.warning(f"Checkpoint maintenance failed: {e}")
+
+    def start_maintenance(self) -> None:
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def aclose(self) -> None:
+        """Stop the maintenance task and commit pending writes"""
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        async with self.lock:
+            await self.conn.aclose()
+
+    async def ametrics(self) -> Dict[str, Any]:
+        """Database size and write metrics"""
+        def size(path: str) -> int:
+            return os.path.getsize(path) if os.path.exists(path) else 0
+        return {
+            "backend": "sqlite",
+            "db_bytes": size(self.path),
+            "wal_bytes": size(self.path + "-wal"),
+            **self.metrics.snapshot(),
+        }
+
+@asynccontextmanager
+async def open_checkpointer(backend: str = CHECKPOINT_BACKEND, path: str = CHECKPOINT_DB_PATH, **kwargs) -> AsyncIterator[BaseCheckpointSaver]:
+    """Open the configured checkpoint saver for the app's lifetime (extra kwargs go to TunedAsyncSqliteSaver)"""
+    if backend == "memory":
+        yield MemorySaver()
+        return
+    if backend != "sqlite":
+        raise ValueError(f"Unknown checkpoint backend: {backend}")
+    async with aiosqlite.connect(path) as conn:
+        saver = TunedAsyncSqliteSaver(conn, path=path, **kwargs)
+        await saver.setup()
+        saver.start_maintenance()
+        try:
+            yield saver
+        finally:
+            await saver.aclose()
+
+async def checkpointer_metrics(saver: BaseCheckpointSaver) -> Dict[str, Any]:
+    if isinstance(saver, TunedAsyncSqliteSaver):
+        return await saver.ametrics()
+    return {"backend": "memory" if isinstance(saver, MemorySaver) else type(saver).__name__}
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+import logging
+
+# Results of the deterministic (temperature 0, structured output) nodes are cached. Never use this
+# for the supervisor, whose replies depend on the whole conversation and tool results
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Near duplicate tier: if an embedding model is set, a miss falls back to the most similar cached
+# input of the same node/model/prompt, if its cosine similarity is at least the threshold
+LLM_CACHE_EMBEDDING_MODEL = os.environ.get("LLM_CACHE_EMBEDDING_MODEL", "")
+LLM_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("LLM_CACHE_SIMILARITY_THRESHOLD", 0.97))
+
+T = TypeVar("T")
+Embedder = Callable[[str], Awaitable[Sequence[float]]]
+
+def normalize_llm_input(text: str) -> str:
+    """Case and whitespace don't change what the extraction nodes return"""
+    return ' '.join(text.lower().split())
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def make_llm_cache_key(node: str, model: str, system_prompt: str, input_text: str) -> str:
+    return hash_text(json.dumps([node, model, hash_text(system_prompt), normalize_llm_input(input_text)]))
+
+class LLMResultCache:
+    """SQLite cache of node results, keyed by (node, model, system prompt hash, normalized input).
+    Values are strings (the caller serializes them). Once the stored entries take more than max_bytes,
+    the least recently used ones are evicted. The SQLite calls block, so get_or_invoke makes them from
+    a worker thread."""
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        embedder: Optional[Embedder] = None,
+        similarity_threshold: float = LLM_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        # The worker threads share the connection (and the embedding matrices)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                value TEXT NOT NULL,
+                embedding BLOB,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS llm_cache_scope ON llm_cache (scope);
+            CREATE INDEX IF NOT EXISTS llm_cache_last_used_at ON llm_cache (last_used_at);
+        """)
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        # Embedding matrices per scope (node, model and prompt), loaded on first use
+        self._embeddings: Dict[str, Tuple[list, np.ndarray]] = {}
+        # Summed once here, then kept up to date by put and _evict
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    @staticmethod
+    def _scope(node: str, model: str, system_prompt: str) -> str:
+        return f"{node}:{model}:{hash_text(system_prompt)}"
+
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, node: str, model: str, system_prompt: str, input_text: str) -> Optional[str]:
+        """Exact match lookup"""
+        key = make_llm_cache_key(node, model, system_prompt, input_text)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def _scope_embeddings(self, scope: str) -> Tuple[list, np.ndarray]:
+        if scope not in self._embeddings:
+            keys, vectors = [], []
+            for key, blob in self._conn.execute("SELECT key, embedding FROM llm_cache WHERE scope = ? AND embedding IS NOT NULL", (scope,)):
+                keys.append(key)
+                vectors.append(np.frombuffer(blob, dtype=np.float32))
+            self._embeddings[scope] = (keys, np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32))
+        return self._embeddings[scope]
+
+    def get_similar(self, node: str, model: str, system_prompt: str, embedding: np.ndarray) -> Optional[str]:
+        """The value of the most similar cached input in the same scope (embeddings are unit length)"""
+        with self._lock:
+            keys, matrix = self._scope_embeddings(self._scope(node, model, system_prompt))
+            if not keys or matrix.shape[1] != embedding.shape[0]:
+                return None
+            similarities = matrix @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (keys[best],)).fetchone()
+        return row[0] if row else None
+
+    def put(self, node: str, model: str, system_prompt: str, input_text: str, value: str, embedding: Optional[np.ndarray] = None) -> None:
+        key = make_llm_cache_key(node, model, system_prompt, input_text)
+        scope = self._scope(node, model, system_prompt)
+        blob = embedding.astype(np.float32).tobytes() if embedding is not None else None
+        now = time.time()
+        size = len(key) + len(value.encode()) + len(blob or b"")
+        with self._lock:
+            with self._conn:
+                replaced = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, scope, value, embedding, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, scope, value, blob, size, now, now),
+                )
+            self._total_bytes += size - (replaced[0] if replaced else 0)
+            self.stats["writes"] += 1
+            if blob is not None and scope in self._embeddings:
+                keys, matrix = self._embeddings[scope]
+                if key not in keys and (matrix.size == 0 or matrix.shape[1] == len(embedding)):
+                    self._embeddings[scope] = (keys + [key], np.vstack([matrix, embedding.astype(np.float32)]) if matrix.size else embedding.astype(np.float32)[None, :])
+            self._evict()
+
+    def _evict(self) -> None:
+        excess = self._total_bytes - self.max_bytes
+        if excess <= 0:
+            return
+        # How many of the least recently used entries cover the excess (read lazily, only as far as needed)
+        count = 0
+        cursor = self._conn.execute("SELECT size FROM llm_cache ORDER BY last_used_at")
+        for (size,) in cursor:
+            if excess <= 0:
+                break
+            excess -= size
+            count += 1
+        cursor.close()
+        with self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used_at LIMIT ?) RETURNING size",
+                (count,),
+            ).fetchall()
+        self._total_bytes -= sum(size for (size,) in deleted)
+        self.stats["evictions"] += len(deleted)
+        # Rebuilt on the next similarity lookup
+        self._embeddings.clear()
+
+    async def _embed(self, input_text: str) -> Optional[np.ndarray]:
+        if self.embedder is None:
+            return None
+        try:
+            vector = np.asarray(await self.embedder(normalize_llm_input(input_text)), dtype=np.float32)
+        except Exception as e:
+            logging.warning(f"LLM cache embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    async def get_or_invoke(
+        self,
+        node: str,
+        model: str,
+        system_prompt: str,
+        input_text: str,
+        invoke: Callable[[], Awaitable[T]],
+        dump: Callable[[T], str],
+        load: Callable[[str], T],
+    ) -> T:
+        """Return the cached result for this node call, or invoke the model and cache what it returns"""
+        cached = await asyncio.to_thread(self.get, node, model, system_prompt, input_text)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return load(cached)
+        embedding = await self._embed(input_text)
+        if embedding is not None:
+            cached = await asyncio.to_thread(self.get_similar, node, model, system_prompt, embedding)
+            if cached is not None:
+                self.stats["similar_hits"] += 1
+                return load(cached)
+        self.stats["misses"] += 1
+        result = await invoke()
+        await asyncio.to_thread(self.put, node, model, system_prompt, input_text, dump(result), embedding)
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self), "bytes": self.total_bytes(), "max_bytes": self.max_bytes}
+
+
+def _default_embedder() -> Optional[Embedder]:
+    if not LLM_CACHE_EMBEDDING_MODEL:
+        return None
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=LLM_CACHE_EMBEDDING_MODEL).aembed_query
+
+# ~~~~~~ Shared (per worker) cache ~~~~~~
+_shared_cache: Optional[LLMResultCache] = None
+
+def get_llm_cache() -> Optional[LLMResultCache]:
+    """Get the worker's shared LLMResultCache, creating it on first use (None if it's disabled)."""
+    global _shared_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _shared_cache is None:
+        _shared_cache = LLMResultCache(embedder=_default_embedder())
+    return _shared_cache
+
+def close_llm_cache() -> None:
+    global _shared_cache
+    if _shared_cache is not None:
+        _shared_cache.close()
+    _shared_cache = None
+
+async def cached_node_call(
+    node: str,
+    model: str,
+    system_prompt: str,
+    input_text: str,
+    invoke: Callable[[], Awaitable[T]],
+    dump: Callable[[T], str],
+    load: Callable[[str], T],
+) -> T:
+    """get_or_invoke on the shared cache, or just invoke if caching is off"""
+    cache = get_llm_cache()
+    if cache is None:
+        return await invoke()
+    return await cache.get_or_invoke(node, model, system_prompt, input_text, invoke, dump, load)
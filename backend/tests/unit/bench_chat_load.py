@@ -0,0 +1,277 @@
+# Load test for /chat/invoke-with-history: replays multi-turn conversations (a new thread, then follow ups on
+# it) arriving at a target rate, and reports latency percentiles, throughput, error rate and the worker's CPU
+# and RSS over time. By default it starts its own worker, with the fake chat model (app/graph/chat_models.py)
+# and the Places API stand-in (places_standin.py), so runs are reproducible and need no API keys.
+# The saved report is JSON with sorted keys, so reports of two builds can be diffed (or --compare'd)
+# (run from tests/unit: python bench_chat_load.py [--rate 5] [--duration 60] [--output report.json] [--compare old.json])
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+UNIT_TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(os.path.dirname(UNIT_TESTS_DIR))
+
+# Where the test data (and so the stand-in's places) are
+LOCATIONS = {
+    "austin": {"latitude": 30.2672, "longitude": -97.7431},
+    "sydney": {"latitude": -33.8688, "longitude": 151.2093},
+}
+# (location, user turns). The first turn starts a thread, the rest continue it
+CONVERSATIONS = [
+    ("austin", ["Thai food for a party of 4, within 5 miles", "Show me more"]),
+    ("austin", ["Dinner tomorrow at 7pm, party of 2, within 3 miles", "Somewhere with outdoor seating", "Any others?"]),
+    ("sydney", ["Lunch tomorrow at noon, somewhere with coffee"]),
+    ("sydney", ["Italian or Japanese food for 6 people tonight", "Something cheaper", "Show me more"]),
+    ("austin", ["Brunch on Sunday at 11am with the kids", "We need free parking"]),
+    ("sydney", ["Vegetarian dinner at 6pm within 2 km"]),
+]
+# Seconds of CPU time per clock tick, for reading /proc/<pid>/stat
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def poisson_arrivals(rate: float, duration: float, rng: random.Random) -> List[float]:
+    """Start times (seconds from the start) of conversations arriving at `rate` per second on average"""
+    arrivals, t = [], 0.0
+    while rate > 0:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            break
+        arrivals.append(t)
+    return arrivals
+
+def latency_stats(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max/mean of latencies in seconds, in milliseconds"""
+    if not latencies:
+        return {}
+    ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50": round(p50, 1), "p95": round(p95, 1), "p99": round(p99, 1), "max": round(ms.max(), 1), "mean": round(ms.mean(), 1)}
+
+class ProcessSampler:
+    """Samples a process's CPU use (percent of one core) and RSS every interval, from /proc (Linux only)"""
+    def __init__(self, pid: int, interval_seconds: float = 1.0):
+        self.pid = pid
+        self.interval_seconds = interval_seconds
+        self.samples: List[Dict[str, float]] = []
+
+    def _read(self) -> Tuple[float, float]:
+        with open(f"/proc/{self.pid}/stat") as file:
+            # Fields after the command name (which can have spaces), utime and stime are the 12th and 13th
+            fields = file.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        with open(f"/proc/{self.pid}/status") as file:
+            rss_kib = next(int(line.split()[1]) for line in file if line.startswith("VmRSS:"))
+        return cpu_seconds, rss_kib / 1024
+
+    async def run(self, started: float) -> None:
+        last_cpu, _ = self._read()
+        last_time = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                cpu, rss_mib = self._read()
+            except (OSError, StopIteration):
+                return
+            now = time.perf_counter()
+            self.samples.append({"t": round(now - started, 2), "cpu_percent": round(100 * (cpu - last_cpu) / (now - last_time), 1), "rss_mib": round(rss_mib, 1)})
+            last_cpu, last_time = cpu, now
+
+async def run_conversation(client: httpx.AsyncClient, conversation: Tuple[str, List[str]], think_seconds: float, started: float, results: List[Dict[str, Any]]) -> None:
+    """Send a conversation's turns one after another on one thread, recording each request"""
+    location, turns = conversation
+    messages, thread_id = [], None
+    for i, turn in enumerate(turns):
+        messages.append({"role": "user", "content": turn})
+        request = {"userAllowedLocation": True, "userLocation": LOCATIONS[location], "messages": messages, "thread_id": thread_id}
+        start = time.perf_counter()
+        try:
+            response = await client.post("/chat/invoke-with-history", json=request)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            response, status = None, type(e).__name__
+        results.append({"start": start - started, "latency": time.perf_counter() - start, "kind": "new" if i == 0 else "continued", "status": status})
+        if status != 200:
+            return
+        thread_id = thread_id or response.headers.get("X-Thread-Id")
+        if thread_id is None:
+            return
+        messages.append({"role": "assistant", "content": response.json()})
+        if think_seconds and i < len(turns) - 1:
+            await asyncio.sleep(think_seconds)
+
+async def run_load(client: httpx.AsyncClient, rate: float, duration: float, think_seconds: float = 0.0, seed: int = 0, sampler: Optional[ProcessSampler] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, float]], float]:
+    """Start conversations (picked at random from CONVERSATIONS) at Poisson arrivals, and wait for all of them.
+    The requests, the worker samples, and how long it all took."""
+    rng = random.Random(seed)
+    arrivals = poisson_arrivals(rate, duration, rng)
+    conversations = [rng.choice(CONVERSATIONS) for _ in arrivals]
+    results: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    sampling = asyncio.create_task(sampler.run(started)) if sampler is not None else None
+
+    async def arrive(at: float, conversation: Tuple[str, List[str]]) -> None:
+        # Open loop: conversations start on schedule, however slow the earlier ones are
+        await asyncio.sleep(max(0.0, at - (time.perf_counter() - started)))
+        await run_conversation(client, conversation, think_seconds, started, results)
+
+    await asyncio.gather(*(arrive(at, c) for at, c in zip(arrivals, conversations)))
+    elapsed = time.perf_counter() - started
+    if sampling is not None:
+        sampling.cancel()
+    return sorted(results, key=lambda r: r["start"]), (sampler.samples if sampler is not None else []), elapsed
+
+def summarize(results: List[Dict[str, Any]], samples: List[Dict[str, float]], elapsed: float, config: Dict[str, Any], interval_seconds: float = 1.0) -> Dict[str, Any]:
+    """The report of a run: overall and per turn kind (new thread or continued) numbers, and a timeline of
+    completed requests, errors, p95 latency, CPU and RSS per interval"""
+    errors = [r for r in results if r["status"] != 200]
+    ok = [r["latency"] for r in results if r["status"] == 200]
+    summary = {
+        "requests": len(results),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_stats(ok),
+        "by_kind": {kind: latency_stats([r["latency"] for r in results if r["kind"] == kind and r["status"] == 200]) for kind in ("new", "continued")},
+        "error_statuses": dict(sorted(Counter(str(r["status"]) for r in errors).items())),
+    }
+    if samples:
+        summary["cpu_percent"] = {"mean": round(float(np.mean([s["cpu_percent"] for s in samples])), 1), "max": max(s["cpu_percent"] for s in samples)}
+        summary["rss_mib"] = {"start": samples[0]["rss_mib"], "max": max(s["rss_mib"] for s in samples), "end": samples[-1]["rss_mib"]}
+
+    timeline = []
+    for i in range(int(np.ceil(elapsed / interval_seconds))):
+        low, high = i * interval_seconds, (i + 1) * interval_seconds
+        done = [r for r in results if low <= r["start"] + r["latency"] < high]
+        point = {"t": round(high, 2), "completed": len(done), "errors": sum(1 for r in done if r["status"] != 200)}
+        point["p95_ms"] = latency_stats([r["latency"] for r in done if r["status"] == 200]).get("p95")
+        sample = next((s for s in samples if low < s["t"] <= high), None)
+        if sample is not None:
+            point.update(cpu_percent=sample["cpu_percent"], rss_mib=sample["rss_mib"])
+        timeline.append(point)
+    return {"config": config, "summary": summary, "timeline": timeline}
+
+def _flatten(values: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare_reports(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """One line per summary number of either report: old, new, and new / old"""
+    old_summary, new_summary = _flatten(old["summary"]), _flatten(new["summary"])
+    lines = []
+    for key in sorted(set(old_summary) | set(new_summary)):
+        before, after = old_summary.get(key), new_summary.get(key)
+        ratio = f"{after / before:6.2f}x" if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before else ""
+        lines.append(f"  {key:<28} {str(before):>10} -> {str(after):<10} {ratio}")
+    return lines
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout_seconds: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} wasn't up after {timeout_seconds}s")
+
+def start_stack(args: argparse.Namespace, workdir: str) -> Tuple[str, List[subprocess.Popen]]:
+    """Start the Places API stand-in and one app worker (with the fake chat model) using it. The worker runs in
+    workdir, so its databases start empty. The worker's URL and the processes (the worker last)."""
+    # (importing the app's geo helpers imports the graph, and so builds the chat model, in the stand-in too)
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR, "LLM_PROVIDER": "fake"}
+    standin = subprocess.Popen(
+        [sys.executable, "places_standin.py", "--port", str(args.places_port), "--synthetic", str(args.places_synthetic), "--latency", args.places_latency],
+        cwd=UNIT_TESTS_DIR, env=env,
+    )
+    worker_env = {
+        **env,
+        "FAKE_LLM_LATENCY_SECONDS": str(args.llm_latency),
+        "FAKE_LLM_TOKEN_SECONDS": str(args.llm_token_seconds),
+        "PLACES_API_BASE_URL": f"http://127.0.0.1:{args.places_port}/v1",
+        "GOOGLE_MAPS_API_KEY": "standin",
+    }
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=workdir, env=worker_env,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    wait_until_ready(f"http://127.0.0.1:{args.places_port}/standin/stats", standin)
+    wait_until_ready(f"{url}/metrics/llm-cache", worker)
+    return url, [standin, worker]
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=2.0, help="new conversations per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to start conversations for")
+    parser.add_argument("--think-seconds", type=float, default=0.5, help="pause between a conversation's turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="per request timeout")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between CPU/RSS samples")
+    parser.add_argument("--url", help="load an already running worker instead of starting one (and the stand-ins)")
+    parser.add_argument("--pid", type=int, help="with --url, the worker process to sample CPU and RSS of")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--places-port", type=int, default=8765)
+    parser.add_argument("--places-synthetic", type=int, default=2000, help="synthetic places the stand-in serves")
+    parser.add_argument("--places-latency", default="lognormal:0.15,0.4", help="the stand-in's latency (see places_standin.py)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake chat model seconds per call")
+    parser.add_argument("--llm-token-seconds", type=float, default=0.0, help="fake chat model seconds per token")
+    parser.add_argument("--output", help="where to save the report (JSON)")
+    parser.add_argument("--compare", help="an earlier report to compare this run with")
+    args = parser.parse_args()
+
+    processes = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            if args.url:
+                url, pid = args.url, args.pid
+            else:
+                url, processes = start_stack(args, workdir)
+                pid = processes[-1].pid
+            sampler = ProcessSampler(pid, args.sample_interval) if pid else None
+
+            async def run():
+                limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+                async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+                    return await run_load(client, args.rate, args.duration, args.think_seconds, args.seed, sampler)
+
+            print(f"Loading {url} with {args.rate} conversations/s for {args.duration}s")
+            results, samples, elapsed = asyncio.run(run())
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    report = summarize(results, samples, elapsed, config, args.sample_interval)
+    print(json.dumps(report["summary"], indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print(f"Report written to {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            print(f"Compared with {args.compare}:")
+            print("\n".join(compare_reports(json.load(file), report)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+# Compares the multi-call extraction path (state updater, datetime extractor and maps query formulator,
+# run in parallel like the graph does) with the single combined extraction call, on the queries in
+# test_state_updater_agents.py. Makes real model calls, so OPENAI_API_KEY has to be set
+# (run from tests/unit: python bench_extraction_modes.py)
+
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.graph.food_finder_agent import llm, get_formatted_datetime
+from app.graph.prompts import MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT, DATETIME_EXTRACTOR_SYSTEM_PROMPT, STATE_UPDATER_SYSTEM_PROMPT, COMBINED_EXTRACTOR_SYSTEM_PROMPT
+from app.schemas import StateUpdaterOutputFormat, DateTimeExtract, CombinedExtractionOutputFormat
+from test_state_updater_agents import test_queries, expected_times, ANCHOR_TIME
+
+# include_raw, for the token usage of each call
+state_updater = llm.with_structured_output(StateUpdaterOutputFormat, include_raw=True)
+datetime_extractor = llm.with_structured_output(DateTimeExtract, include_raw=True)
+combined_extractor = llm.with_structured_output(CombinedExtractionOutputFormat, include_raw=True)
+
+def tokens(*raw_messages):
+    return sum(m.usage_metadata["total_tokens"] for m in raw_messages if m.usage_metadata)
+
+async def multi_call(query: str):
+    date_message = DATETIME_EXTRACTOR_SYSTEM_PROMPT.format(curr_day_time_msg=get_formatted_datetime(ANCHOR_TIME), user_query=query)
+    preferences, extracted, formulated = await asyncio.gather(
+        state_updater.ainvoke([SystemMessage(content=STATE_UPDATER_SYSTEM_PROMPT), HumanMessage(content=query)]),
+        datetime_extractor.ainvoke(date_message),
+        llm.ainvoke([SystemMessage(content=MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT), HumanMessage(content=query)]),
+    )
+    return (
+        preferences["parsed"], extracted["parsed"].dt, formulated.content,
+        tokens(preferences["raw"], extracted["raw"], formulated),
+    )
+
+async def combined_call(query: str):
+    response = await combined_extractor.ainvoke([
+        SystemMessage(content=COMBINED_EXTRACTOR_SYSTEM_PROMPT),
+        SystemMessage(content=get_formatted_datetime(ANCHOR_TIME)),
+        HumanMessage(content=query),
+    ])
+    parsed = response["parsed"]
+    return parsed, parsed.dt, parsed.maps_query, tokens(response["raw"])
+
+def preference_fields(output):
+    return output.dict(include=set(StateUpdaterOutputFormat.model_fields))
+
+async def main():
+    results = {"multi": [], "combined": []}
+    for query in test_queries:
+        for mode, extract in (("multi", multi_call), ("combined", combined_call)):
+            started = time.perf_counter()
+            output = await extract(query)
+            results[mode].append((time.perf_counter() - started, *output))
+
+    for mode, rows in results.items():
+        latencies = sorted(row[0] for row in rows)
+        correct_times = sum(row[2] == expected for row, expected in zip(rows, expected_times))
+        print(f"{mode:<9} median {latencies[len(latencies) // 2] * 1000:7.0f} ms, "
+              f"{sum(row[4] for row in rows) / len(rows):6.0f} tokens/query, "
+              f"datetime correct {correct_times}/{len(rows)}")
+
+    # No labels for the preferences, so the combined call is measured against the multi-call path
+    agreeing_fields, total_fields = 0, 0
+    for (_, multi_prefs, _, multi_query, _), (_, combined_prefs, _, combined_query, _) in zip(results["multi"], results["combined"]):
+        multi_fields, combined_fields = preference_fields(multi_prefs), preference_fields(combined_prefs)
+        agreeing_fields += sum(multi_fields[k] == combined_fields[k] for k in multi_fields)
+        total_fields += len(multi_fields)
+        print(f"  maps query: {multi_query!r:<40} vs {combined_query!r}")
+    print(f"preference fields agreeing: {agreeing_fields}/{total_fields}")
+
+asyncio.run(main())
@@ -0,0 +1,35 @@
+# Compares the ways a Places text search response can be turned into Place objects
+# (run from tests/unit: python bench_places_ingest.py)
+
+import json
+import timeit
+
+from app.schemas import Place
+from app.graph.tools.places_ingest import loads, parse_places, parse_places_json
+
+TEST_FILE_PATHS = ["../test_data/test_1.txt", "../test_data/test_2.txt"]
+NUMBER = 200
+
+def per_place_model_validate(payload):
+    # The original path: stdlib decode, then one model_validate per place dict
+    return [Place.model_validate(p) for p in json.loads(payload)['places']]
+
+for test_file_path in TEST_FILE_PATHS:
+    with open(test_file_path, "rb") as file:
+        payload = file.read()
+    stored = [p.model_dump_json(by_alias=True, exclude_none=True) for p in parse_places_json(payload)]
+
+    cases = {
+        "json.loads + model_validate per place": lambda: per_place_model_validate(payload),
+        "fast loads + list TypeAdapter": lambda: parse_places(loads(payload)),
+        "model_validate_json (no dicts)": lambda: parse_places_json(payload),
+        "fast loads + lazy reviews": lambda: parse_places_json(payload, lazy_reviews=True),
+        # What the PlaceStore does with the places it kept
+        "model_validate_json per stored place": lambda: [Place.model_validate_json(p) for p in stored],
+    }
+    print(f"{test_file_path} ({len(payload) / 1024:.0f} KiB, {len(stored)} places)")
+    baseline = None
+    for label, case in cases.items():
+        seconds = min(timeit.repeat(case, number=NUMBER, repeat=5)) / NUMBER
+        baseline = baseline or seconds
+        print(f"  {label:<40} {seconds * 1000:8.3f} ms  ({baseline / seconds:4.1f}x)")
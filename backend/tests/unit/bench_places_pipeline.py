@@ -0,0 +1,132 @@
+# Benchmarks each stage of the places pipeline on synthetic places (see synthetic_places.py) at
+# 100, 10k and 1M places, reporting time and peak memory, and fails if a stage got slower (or bigger)
+# than its stored baseline by more than the threshold
+# (run from tests/unit: python bench_places_pipeline.py [--sizes 100,10000] [--update-baselines])
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from app.schemas import UserPreferences, PreferenceWeight
+from app.graph.tools import PlaceFeatures, encode_preferences, score_places
+from app.graph.tools import calculate_place_score, check_if_user_stay_fits_open_hours, filter_places
+from app.graph.tools.places_search import get_places_from_json
+
+from synthetic_places import synthetic_batches
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_places_pipeline_baselines.json")
+SIZES = [100, 10_000, 1_000_000]
+# Sizes above this are run in batches of it, so 1M places don't have to fit in memory at once
+# (times are summed over the batches, peak memory is the batch's)
+BATCH_SIZE = 20_000
+# A stage fails if it takes this many times its baseline (or more), and at least MIN_REGRESSION_SECONDS longer
+REGRESSION_THRESHOLD = float(os.environ.get("BENCH_REGRESSION_THRESHOLD", 1.5))
+MIN_REGRESSION_SECONDS = 0.002
+
+USER_PREFERENCES = UserPreferences(
+    wants_coffee=PreferenceWeight(value=True, weight=0.8),
+    wants_outdoor_seating=PreferenceWeight(value=True, weight=0.5),
+    desired_minimum_num_ratings=PreferenceWeight(value=500, weight=0.4),
+    party_size=PreferenceWeight(value=4, weight=1.0),
+    # A Wednesday evening
+    desired_time_and_stay_duration=(datetime(2024, 9, 25, 19, 0), 60),
+)
+
+# Each stage gets the decoded search response and the parsed places of a batch
+STAGES = {
+    "get_places_from_json": lambda response, places: get_places_from_json(response),
+    "filter_places": lambda response, places: filter_places(places, USER_PREFERENCES),
+    "calculate_place_score": lambda response, places: [calculate_place_score(p, USER_PREFERENCES) for p in places],
+    "score_places (vectorized)": lambda response, places: score_places(PlaceFeatures(places), encode_preferences(USER_PREFERENCES)),
+    "check_if_user_stay_fits_open_hours": lambda response, places: [
+        check_if_user_stay_fits_open_hours(p, USER_PREFERENCES.desired_time_and_stay_duration) for p in places
+    ],
+}
+
+def repeats_for(size: int) -> int:
+    # Small sizes are over in microseconds, so take the best of several runs
+    return max(1, min(20, 20_000 // size))
+
+def run_size(size: int) -> dict:
+    seconds = {stage: 0.0 for stage in STAGES}
+    peak_mib = {}
+    for batch in synthetic_batches(size, BATCH_SIZE):
+        response = {"places": batch}
+        places = get_places_from_json(response)
+        for stage, run in STAGES.items():
+            best = None
+            for _ in range(repeats_for(size)):
+                gc.collect()
+                start = time.perf_counter()
+                run(response, places)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            seconds[stage] += best
+            if stage not in peak_mib:
+                # Memory is traced in a separate run (tracing slows everything down), on the first batch
+                gc.collect()
+                tracemalloc.start()
+                run(response, places)
+                peak_mib[stage] = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+        del response, places, batch
+    return {stage: {"seconds": seconds[stage], "peak_mib": peak_mib[stage]} for stage in STAGES}
+
+def find_regressions(results: dict, baselines: dict, threshold: float) -> list:
+    regressions = []
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            baseline = baselines.get(size, {}).get(stage)
+            if baseline is None:
+                continue
+            slower = result["seconds"] - baseline["seconds"]
+            if result["seconds"] >= baseline["seconds"] * threshold and slower >= MIN_REGRESSION_SECONDS:
+                regressions.append(f"{stage} @ {size} places: {result['seconds'] * 1000:.1f} ms vs baseline {baseline['seconds'] * 1000:.1f} ms")
+            if result["peak_mib"] >= baseline["peak_mib"] * threshold and result["peak_mib"] - baseline["peak_mib"] >= 1:
+                regressions.append(f"{stage} @ {size} places: {result['peak_mib']:.1f} MiB peak vs baseline {baseline['peak_mib']:.1f} MiB")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES), help="comma separated numbers of places")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="slowdown factor that fails the run")
+    parser.add_argument("--update-baselines", action="store_true", help="store this run's results as the baselines")
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as file:
+            baselines = json.load(file)
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"{size:,} places")
+        results[str(size)] = run_size(size)
+        for stage, result in results[str(size)].items():
+            baseline = baselines.get(str(size), {}).get(stage)
+            vs_baseline = f"  ({result['seconds'] / baseline['seconds']:4.2f}x baseline)" if baseline else ""
+            print(f"  {stage:<36} {result['seconds'] * 1000:10.2f} ms  {result['peak_mib']:8.2f} MiB peak{vs_baseline}")
+
+    if args.update_baselines:
+        with open(BASELINES_PATH, "w") as file:
+            json.dump({**baselines, **results}, file, indent=2, sort_keys=True)
+        print(f"Baselines written to {BASELINES_PATH}")
+        return 0
+
+    regressions = find_regressions(results, baselines, args.threshold)
+    if regressions:
+        print("\n" + "!" * 80)
+        print(f"PERFORMANCE REGRESSION: {len(regressions)} stage(s) at least {args.threshold}x their baseline")
+        for regression in regressions:
+            print(f"  - {regression}")
+        print("!" * 80)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# A local stand-in for the Places API (New) text search and Place Details, so the search tool can be
+# load-tested without a GOOGLE_MAPS_API_KEY. Places come from tests/test_data plus any number of synthetic
+# ones (see synthetic_places.py). Searches honor X-Goog-FieldMask, locationBias, locationRestriction,
+# pageSize and pageToken, and every response can be delayed, failed (429/5xx) or sent slowly.
+# (run from tests/unit: python places_standin.py [--port 8765] [--synthetic 5000] [--latency lognormal:0.15,0.5],
+# then start the app with PLACES_API_BASE_URL=http://127.0.0.1:8765/v1 and any GOOGLE_MAPS_API_KEY)
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import uvicorn
+
+from app.graph.tools.geo import distances_meters, point_in_shape, shape_bounding_box
+
+from synthetic_places import FieldDistributions, load_test_places, synthetic_places
+
+# Google never returns more than 60 places for a text search, in pages of at most 20
+MAX_RESULTS = 60
+MAX_PAGE_SIZE = 20
+# Query words that say nothing about which places match
+STOP_WORDS = {"a", "an", "and", "the", "in", "near", "me", "around", "at", "of", "for", "with", "to", "food", "place", "places", "restaurant", "restaurants", "good", "best"}
+# Size of the pieces a slow body is sent in
+SLOW_BODY_CHUNK_BYTES = 4096
+
+class LatencyDistribution:
+    """How long the stand-in waits before answering, from a spec like:
+    - "none" (or "0")
+    - "fixed:SECONDS"
+    - "uniform:LOW,HIGH"
+    - "lognormal:MEDIAN,SIGMA" (a long right tail, like a real API under load)"""
+    def __init__(self, spec: str = "none"):
+        kind, _, args = spec.partition(":")
+        self.spec = spec
+        self.kind = kind.strip().lower()
+        self.args = [float(a) for a in args.split(",") if a.strip()]
+        expected = {"none": 0, "0": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.args) != expected[self.kind]:
+            raise ValueError(f"Bad latency spec {spec!r} (none, fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA)")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(self.args[0], self.args[1])
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        return 0.0
+
+class FaultConfig:
+    """What can go wrong with a response. Rates are the chance per request (429s are rolled first);
+    a slow body is sent in pieces spread over slow_body_seconds."""
+    def __init__(
+        self,
+        latency: str = os.environ.get("PLACES_STANDIN_LATENCY", "none"),
+        rate_limit_rate: float = float(os.environ.get("PLACES_STANDIN_429_RATE", 0.0)),
+        server_error_rate: float = float(os.environ.get("PLACES_STANDIN_5XX_RATE", 0.0)),
+        slow_body_rate: float = float(os.environ.get("PLACES_STANDIN_SLOW_BODY_RATE", 0.0)),
+        slow_body_seconds: float = float(os.environ.get("PLACES_STANDIN_SLOW_BODY_SECONDS", 2.0)),
+        retry_after_seconds: Optional[float] = None,
+        seed: int = 0,
+    ):
+        self.latency = LatencyDistribution(latency)
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.slow_body_rate = slow_body_rate
+        self.slow_body_seconds = slow_body_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self.rng = random.Random(seed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency.spec,
+            "rate_limit_rate": self.rate_limit_rate,
+            "server_error_rate": self.server_error_rate,
+            "slow_body_rate": self.slow_body_rate,
+            "slow_body_seconds": self.slow_body_seconds,
+            "retry_after_seconds": self.retry_after_seconds,
+        }
+
+def google_error(code: int, status: str, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    # Same shape as Google's error bodies
+    return JSONResponse({"error": {"code": code, "message": message, "status": status}}, status_code=code, headers=headers)
+
+def apply_field_mask(place: Dict[str, Any], fields: Optional[set]) -> Dict[str, Any]:
+    """The place with only the top level fields in the mask (all of them for None, i.e. "*")"""
+    if fields is None:
+        return place
+    return {k: v for k, v in place.items() if k in fields}
+
+def parse_field_mask(field_mask: str, prefix: str = "") -> Tuple[Optional[set], bool]:
+    """The top level place fields a mask asks for (None for all) and whether it asks for nextPageToken.
+    Search masks name place fields as "places.<field>", Place Details masks just "<field>"."""
+    fields, wants_token = set(), False
+    for entry in (e.strip() for e in field_mask.split(",")):
+        if entry in ("*", f"{prefix}*"):
+            return None, True
+        if entry == "nextPageToken":
+            wants_token = True
+        elif entry.startswith(prefix):
+            fields.add(entry[len(prefix):].split(".")[0])
+    return fields, wants_token
+
+class PlacesCorpus:
+    """The places the stand-in searches, with their coordinates and searchable text held as columns"""
+    def __init__(self, places: List[Dict[str, Any]]):
+        self.places = places
+        self.by_name = {p["name"]: p for p in places}
+        self.latitude = np.array([p["location"]["latitude"] for p in places], dtype=np.float64)
+        self.longitude = np.array([p["location"]["longitude"] for p in places], dtype=np.float64)
+        self.text = [
+            " ".join([p.get("displayName", {}).get("text", ""), p.get("primaryTypeDisplayName", {}).get("text", ""), *p.get("types", [])]).lower().replace("_", " ")
+            for p in places
+        ]
+
+    @classmethod
+    def load(cls, num_synthetic: int = 0, seed: int = 0) -> "PlacesCorpus":
+        samples = load_test_places()
+        return cls(samples + synthetic_places(num_synthetic, seed, distributions=FieldDistributions(samples)))
+
+    def search(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The (at most MAX_RESULTS) places for a text search, best first: places whose name or types have a
+        word of the query (all of them if none do), inside any locationRestriction, those inside the
+        locationBias first, then the nearest to its center"""
+        words = [w for w in re.findall(r"[a-z]+", body.get("textQuery", "").lower()) if w not in STOP_WORDS]
+        matches = np.array([any(w in text for w in words) for text in self.text], dtype=bool)
+        if not matches.any():
+            matches[:] = True
+        indices = np.flatnonzero(matches)
+
+        restriction = body.get("locationRestriction")
+        if restriction:
+            min_lat, min_lon, max_lat, max_lon = shape_bounding_box(restriction)
+            lat, lon = self.latitude[indices], self.longitude[indices]
+            indices = indices[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+
+        bias = body.get("locationBias") or restriction
+        if bias and len(indices):
+            min_lat, min_lon, max_lat, max_lon = shape_bounding_box(bias)
+            center = ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+            distances = distances_meters(center[0], center[1], self.latitude[indices], self.longitude[indices])
+            outside = np.array([not point_in_shape(self.latitude[i], self.longitude[i], bias) for i in indices], dtype=bool)
+            indices = indices[np.lexsort((distances, outside))]
+        return [self.places[i] for i in indices[:MAX_RESULTS]]
+
+def search_key(body: Dict[str, Any]) -> str:
+    # A page token only goes with the search it came from (like Google, which rejects it otherwise)
+    search = {k: v for k, v in body.items() if k not in ("pageToken", "pageSize")}
+    return hashlib.sha1(json.dumps(search, sort_keys=True).encode()).hexdigest()[:16]
+
+def encode_page_token(body: Dict[str, Any], offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"key": search_key(body), "offset": offset}).encode()).decode()
+
+def decode_page_token(body: Dict[str, Any], token: str) -> Optional[int]:
+    """The offset a page token starts at, or None if it isn't one of this search's"""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(decoded, dict) or decoded.get("key") != search_key(body):
+        return None
+    return decoded.get("offset")
+
+def create_app(corpus: PlacesCorpus, faults: Optional[FaultConfig] = None) -> FastAPI:
+    app = FastAPI()
+    app.state.corpus = corpus
+    app.state.faults = faults or FaultConfig()
+    app.state.stats = Counter()
+
+    async def respond(endpoint: str, payload: Dict[str, Any]) -> Response:
+        faults = app.state.faults
+        delay = faults.latency.sample(faults.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        roll = faults.rng.random()
+        if roll < faults.rate_limit_rate:
+            app.state.stats[f"{endpoint} 429"] += 1
+            headers = {"Retry-After": str(faults.retry_after_seconds)} if faults.retry_after_seconds is not None else None
+            return google_error(429, "RESOURCE_EXHAUSTED", "Quota exceeded (injected by the stand-in)", headers)
+        if roll < faults.rate_limit_rate + faults.server_error_rate:
+            code, status = faults.rng.choice([(500, "INTERNAL"), (503, "UNAVAILABLE")])
+            app.state.stats[f"{endpoint} {code}"] += 1
+            return google_error(code, status, "Server error (injected by the stand-in)")
+        app.state.stats[f"{endpoint} 200"] += 1
+        content = json.dumps(payload).encode()
+        if faults.rng.random() < faults.slow_body_rate:
+            app.state.stats[f"{endpoint} slow body"] += 1
+            return StreamingResponse(slow_body(content, faults.slow_body_seconds), media_type="application/json")
+        return Response(content, media_type="application/json")
+
+    def check_request(request: Request) -> Optional[Response]:
+        if not request.headers.get("X-Goog-Api-Key"):
+            return google_error(403, "PERMISSION_DENIED", "The request is missing a valid API key.")
+        if not request.headers.get("X-Goog-FieldMask"):
+            return google_error(400, "INVALID_ARGUMENT", "FieldMask is a required parameter.")
+        return None
+
+    @app.post("/v1/places:searchText")
+    async def search_text(request: Request) -> Response:
+        error = check_request(request)
+        if error is not None:
+            return error
+        body = await request.json()
+        if not body.get("textQuery"):
+            return google_error(400, "INVALID_ARGUMENT", "Empty text_query.")
+        offset = 0
+        if body.get("pageToken"):
+            offset = decode_page_token(body, body["pageToken"])
+            if offset is None:
+                return google_error(400, "INVALID_ARGUMENT", "Invalid page_token, or the request doesn't match the one it came from.")
+        page_size = max(1, min(MAX_PAGE_SIZE, int(body.get("pageSize") or MAX_PAGE_SIZE)))
+
+        fields, wants_token = parse_field_mask(request.headers["X-Goog-FieldMask"], "places.")
+        places = app.state.corpus.search(body)
+        page = places[offset:offset + page_size]
+        payload = {}
+        if page:
+            payload["places"] = [apply_field_mask(p, fields) for p in page]
+        if wants_token and offset + page_size < len(places):
+            payload["nextPageToken"] = encode_page_token(body, offset + page_size)
+        return await respond("searchText", payload)
+
+    @app.get("/v1/places/{place_id}")
+    async def place_details(place_id: str, request: Request) -> Response:
+        error = check_request(request)
+        if error is not None:
+            return error
+        place = app.state.corpus.by_name.get(f"places/{place_id}")
+        if place is None:
+            return google_error(404, "NOT_FOUND", f"Place 'places/{place_id}' not found.")
+        fields, _ = parse_field_mask(request.headers["X-Goog-FieldMask"])
+        return await respond("placeDetails", apply_field_mask(place, fields))
+
+    @app.get("/standin/stats")
+    async def get_stats() -> Dict[str, Any]:
+        return {"places": len(app.state.corpus.places), "faults": app.state.faults.to_dict(), "responses": dict(app.state.stats)}
+
+    @app.put("/standin/faults")
+    async def set_faults(request: Request) -> Response:
+        """Change what goes wrong while the stand-in is running (e.g. between load test phases)"""
+        try:
+            app.state.faults = FaultConfig(**await request.json())
+        except (TypeError, ValueError) as e:
+            return google_error(400, "INVALID_ARGUMENT", str(e))
+        return JSONResponse(app.state.faults.to_dict())
+
+    return app
+
+async def slow_body(content: bytes, seconds: float):
+    chunks = [content[i:i + SLOW_BODY_CHUNK_BYTES] for i in range(0, len(content), SLOW_BODY_CHUNK_BYTES)]
+    for chunk in chunks:
+        await asyncio.sleep(seconds / len(chunks))
+        yield chunk
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--synthetic", type=int, default=0, help="number of synthetic places to add to the test data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", default=os.environ.get("PLACES_STANDIN_LATENCY", "none"), help="none, fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--rate-limit-rate", type=float, default=float(os.environ.get("PLACES_STANDIN_429_RATE", 0.0)), help="chance of a 429")
+    parser.add_argument("--server-error-rate", type=float, default=float(os.environ.get("PLACES_STANDIN_5XX_RATE", 0.0)), help="chance of a 500/503")
+    parser.add_argument("--slow-body-rate", type=float, default=float(os.environ.get("PLACES_STANDIN_SLOW_BODY_RATE", 0.0)), help="chance of a slowly sent body")
+    parser.add_argument("--slow-body-seconds", type=float, default=float(os.environ.get("PLACES_STANDIN_SLOW_BODY_SECONDS", 2.0)))
+    args = parser.parse_args()
+
+    faults = FaultConfig(args.latency, args.rate_limit_rate, args.server_error_rate, args.slow_body_rate, args.slow_body_seconds, seed=args.seed)
+    app = create_app(PlacesCorpus.load(args.synthetic, args.seed), faults)
+    print(f"Places API stand-in with {len(app.state.corpus.places):,} places: set PLACES_API_BASE_URL=http://{args.host}:{args.port}/v1")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
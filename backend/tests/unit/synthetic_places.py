@@ -0,0 +1,92 @@
+# Synthetic Places API text search results, for benchmarking the places pipeline at scale
+# (see bench_places_pipeline.py). Each field is drawn from what the real responses in
+# tests/test_data have: how often it's there, how often a boolean is true, the spread of
+# ratings and rating counts, and whole opening hours / parking / type templates.
+
+import json
+import math
+import random
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Sequence
+
+TEST_FILE_PATHS = ["../test_data/test_1.txt", "../test_data/test_2.txt"]
+
+# Only the fields the search asks for with two-phase fetching (GOOGLE_LEAN_FIELD_MASK) are made. The detail
+# fields (reviews, websiteUri, nationalPhoneNumber) are only fetched for the places shown, so they're left out
+BOOLEAN_FIELDS = [
+    "dineIn", "servesLunch", "servesDinner", "outdoorSeating", "liveMusic", "servesDessert", "servesBeer",
+    "servesWine", "servesBrunch", "servesCocktails", "servesCoffee", "servesVegetarianFood", "goodForChildren",
+    "menuForChildren", "goodForGroups",
+]
+# Standard deviation of the scatter around each real place, in degrees (about 5 km)
+LOCATION_JITTER_DEGREES = 0.045
+
+def load_test_places(paths: Sequence[str] = TEST_FILE_PATHS) -> List[Dict[str, Any]]:
+    places = []
+    for path in paths:
+        with open(path, "r") as file:
+            places.extend(json.load(file)["places"])
+    return places
+
+class FieldDistributions:
+    """What the fields of real places look like, measured once from sample responses"""
+    def __init__(self, places: List[Dict[str, Any]]):
+        self.num_samples = len(places)
+        counts = Counter(key for place in places for key in place)
+        self.presence = {key: count / len(places) for key, count in counts.items()}
+        self.true_rate = {
+            field: sum(1 for p in places if p.get(field)) / max(1, sum(1 for p in places if field in p))
+            for field in BOOLEAN_FIELDS
+        }
+        self.ratings = [p["rating"] for p in places if "rating" in p]
+        log_counts = [math.log1p(p["userRatingCount"]) for p in places if "userRatingCount" in p]
+        self.log_count_mean = sum(log_counts) / len(log_counts)
+        self.log_count_std = math.sqrt(sum((c - self.log_count_mean) ** 2 for c in log_counts) / len(log_counts))
+        self.price_levels = [p["priceLevel"] for p in places if "priceLevel" in p]
+        # Fields that only make sense together are copied from one real place
+        self.kinds = [(p["types"], p["primaryTypeDisplayName"], p["displayName"]["text"]) for p in places]
+        self.opening_hours = [p["regularOpeningHours"] for p in places if "regularOpeningHours" in p]
+        self.parking_options = [p["parkingOptions"] for p in places if "parkingOptions" in p]
+        self.locations = [(p["location"]["latitude"], p["location"]["longitude"]) for p in places]
+        self.addresses = [p["formattedAddress"] for p in places if "formattedAddress" in p]
+
+    def place(self, rng: random.Random, index: int) -> Dict[str, Any]:
+        types, primary_type, display_name = rng.choice(self.kinds)
+        latitude, longitude = rng.choice(self.locations)
+        place = {
+            "name": f"places/synthetic{index:08d}",
+            "types": types,
+            "primaryTypeDisplayName": primary_type,
+            "displayName": {"text": f"{display_name} #{index}", "languageCode": "en"},
+            "location": {
+                "latitude": latitude + rng.gauss(0, LOCATION_JITTER_DEGREES),
+                "longitude": longitude + rng.gauss(0, LOCATION_JITTER_DEGREES),
+            },
+            "formattedAddress": rng.choice(self.addresses),
+            "googleMapsUri": f"https://maps.google.com/?cid={index}",
+            "rating": round(min(5.0, max(1.0, rng.choice(self.ratings) + rng.gauss(0, 0.1))), 1),
+            "userRatingCount": int(math.expm1(rng.gauss(self.log_count_mean, self.log_count_std))),
+        }
+        for field in BOOLEAN_FIELDS:
+            if rng.random() < self.presence.get(field, 0.0):
+                place[field] = rng.random() < self.true_rate[field]
+        if rng.random() < self.presence.get("priceLevel", 0.0):
+            place["priceLevel"] = rng.choice(self.price_levels)
+        if rng.random() < self.presence.get("regularOpeningHours", 0.0):
+            place["regularOpeningHours"] = rng.choice(self.opening_hours)
+        if rng.random() < self.presence.get("parkingOptions", 0.0):
+            place["parkingOptions"] = rng.choice(self.parking_options)
+        return place
+
+def synthetic_places(count: int, seed: int = 0, start: int = 0, distributions: FieldDistributions | None = None) -> List[Dict[str, Any]]:
+    """`count` synthetic places (as the dicts of a decoded text search response), the same for the same seed"""
+    distributions = distributions or FieldDistributions(load_test_places())
+    rng = random.Random(f"{seed}:{start}")
+    return [distributions.place(rng, start + i) for i in range(count)]
+
+def synthetic_batches(count: int, batch_size: int, seed: int = 0) -> Iterator[List[Dict[str, Any]]]:
+    """`count` synthetic places in batches of at most batch_size, for counts too big to hold at once
+    (each batch is seeded from the seed and where it starts, so a run is reproducible)"""
+    distributions = FieldDistributions(load_test_places())
+    for start in range(0, count, batch_size):
+        yield synthetic_places(min(batch_size, count - start), seed, start, distributions)
@@ -0,0 +1,83 @@
+import asyncio
+import importlib
+import random
+
+import httpx
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.main import app
+from app.schemas import StateUpdaterOutputFormat, DateTimeExtract
+from app.graph.chat_models import FakeFoodFinderChatModel
+from app.graph.food_finder_agent import food_finder_agent
+from app.graph.tools import google_maps_text_search_and_filter, show_more_places
+from app.graph.tools.places_client import PlacesClient
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_prefetch import PagePrefetcher
+from app.services import llm_cache
+
+from bench_chat_load import CONVERSATIONS, compare_reports, poisson_arrivals, run_load, summarize
+from places_standin import PlacesCorpus, create_app
+
+agent_module = importlib.import_module("app.graph.food_finder_agent")
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+def test_poisson_arrivals():
+    arrivals = poisson_arrivals(5.0, 200.0, random.Random(0))
+    assert arrivals == sorted(arrivals) and arrivals[-1] < 200.0
+    assert len(arrivals) / 200.0 == pytest.approx(5.0, rel=0.1)
+    assert poisson_arrivals(5.0, 10.0, random.Random(1)) == poisson_arrivals(5.0, 10.0, random.Random(1))
+
+def test_summary_and_compare():
+    results = [
+        {"start": 0.1, "latency": 0.2, "kind": "new", "status": 200},
+        {"start": 0.5, "latency": 0.4, "kind": "continued", "status": 200},
+        {"start": 1.2, "latency": 1.0, "kind": "new", "status": 500},
+    ]
+    samples = [{"t": 1.0, "cpu_percent": 50.0, "rss_mib": 100.0}, {"t": 2.0, "cpu_percent": 10.0, "rss_mib": 110.0}]
+    report = summarize(results, samples, 2.5, {"rate": 1.0})
+    summary = report["summary"]
+    assert summary["requests"] == 3 and summary["errors"] == 1 and summary["error_rate"] == pytest.approx(1 / 3, abs=1e-4)
+    assert summary["throughput_rps"] == 1.2
+    assert summary["by_kind"]["new"]["p50"] == 200.0
+    assert summary["error_statuses"] == {"500": 1}
+    assert summary["rss_mib"] == {"start": 100.0, "max": 110.0, "end": 110.0}
+    assert [point["completed"] for point in report["timeline"]] == [2, 0, 1]
+
+    slower = {**report, "summary": {**summary, "throughput_rps": 2.4}}
+    line = next(l for l in compare_reports(report, slower) if "throughput_rps" in l)
+    assert "2.00x" in line
+
+def test_load_run_in_process(tmp_path, monkeypatch):
+    # The app with the fake chat model, the Places API stand-in and an in-memory checkpointer
+    fake = FakeFoodFinderChatModel()
+    monkeypatch.setattr(agent_module, "llm", fake)
+    monkeypatch.setattr(agent_module, "team_supervisor", fake.bind_tools([google_maps_text_search_and_filter, show_more_places]))
+    monkeypatch.setattr(agent_module, "datetime_extractor", fake.with_structured_output(DateTimeExtract))
+    monkeypatch.setattr(agent_module, "state_updater", fake.with_structured_output(StateUpdaterOutputFormat))
+    monkeypatch.setattr(llm_cache, "_shared_cache", llm_cache.LLMResultCache(":memory:"))
+    monkeypatch.setattr(food_finder_agent, "checkpointer", MemorySaver())
+    monkeypatch.setattr(app.state, "agent", food_finder_agent, raising=False)
+    store = PlaceStore(str(tmp_path / "places.db"))
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(agent_module, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache())
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: PagePrefetcher())
+
+    async def run():
+        places_client = PlacesClient(api_key="standin", base_url="http://standin/v1", transport=httpx.ASGITransport(app=create_app(PlacesCorpus.load())))
+        monkeypatch.setattr(places_search, "get_places_client", lambda: places_client)
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await run_load(client, rate=20.0, duration=0.5, seed=3)
+        finally:
+            await places_client.aclose()
+
+    results, samples, elapsed = asyncio.run(run())
+    store.close()
+    assert results and samples == []
+    assert all(r["status"] == 200 for r in results)
+    # Follow up turns continued the threads the first turns started
+    assert {r["kind"] for r in results} == {"new", "continued"}
+    assert len(results) > len([r for r in results if r["kind"] == "new"])
@@ -0,0 +1,105 @@
+import asyncio
+import importlib
+import json
+
+import httpx
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+
+from app.main import app
+from app.schemas import Place, PlaceRef
+from app.graph.food_finder_agent import food_finder_agent
+from app.graph.tools.place_store import PlaceStore
+from app.services import chat_stream, llm_cache
+
+agent_module = importlib.import_module("app.graph.food_finder_agent")
+
+ANSWER = "I found 3 places for you. Here are the places I found for you:"
+
+with open("../test_data/test_2.txt", "r") as file:
+    places_objects = [Place.model_validate(p) for p in json.load(file)['places']]
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    # Fast path on: the message below is parsed without the extraction models
+    monkeypatch.setattr(agent_module, "PREFERENCE_FAST_PATH_ENABLED", True)
+    monkeypatch.setattr(agent_module, "llm", GenericFakeChatModel(messages=iter([AIMessage(content="asian restaurant")])))
+    monkeypatch.setattr(agent_module, "team_supervisor", GenericFakeChatModel(messages=iter([AIMessage(content=ANSWER)])))
+    monkeypatch.setattr(llm_cache, "_shared_cache", llm_cache.LLMResultCache(":memory:"))
+    monkeypatch.setattr(app.state, "agent", food_finder_agent, raising=False)
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+def post_stream(payload):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/chat/stream", json=payload)
+    return asyncio.run(run())
+
+CHAT_REQUEST = {
+    "userAllowedLocation": True,
+    "userLocation": {"latitude": 30.2672, "longitude": -97.7431},
+    "messages": [{"role": "user", "content": "Dinner at 7pm, party of 2, within 3 miles"}],
+}
+
+def test_stream_chat(fake_models):
+    response = post_stream(CHAT_REQUEST)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+
+    assert names[0] == "node_start"
+    assert {data["node"] for name, data in events if name == "node_end"} >= {"state_updater_node", "maps_query_formulator_node", "team_supervisor_node"}
+    preferences = next(data for name, data in events if name == "node_end" and data["node"] == "state_updater_node")["preferences"]
+    assert preferences["party_size"]["value"] == 2
+    # Supervisor tokens, as they came, then the whole answer
+    assert "".join(data["content"] for name, data in events if name == "token") == ANSWER
+    assert names.index("token") < names.index("message")
+    assert events[-2] == ("message", {"content": ANSWER})
+    assert events[-1][0] == "done" and events[-1][1]["thread_id"]
+
+def test_stream_without_tokens(fake_models):
+    events = parse_sse(post_stream({**CHAT_REQUEST, "stream_tokens": False}).text)
+    assert "token" not in [name for name, _ in events]
+    assert ("message", {"content": ANSWER}) in events
+
+def test_places_event(tmp_path, monkeypatch):
+    store = PlaceStore(str(tmp_path / "places.db"))
+    store.upsert_places(places_objects)
+    monkeypatch.setattr(chat_stream, "get_place_store", lambda: store)
+    valid_refs = [PlaceRef.from_place(p) for p in places_objects[:7]]
+    invalid_refs = [PlaceRef.from_place(p) for p in places_objects[7:9]]
+    event = {
+        "event": "on_chain_end",
+        "name": "google_maps_text_search_and_filter",
+        "metadata": {"langgraph_node": "google_maps_text_search_and_filter"},
+        "data": {"output": {"messages": [ToolMessage(content="Obtained 7 places", tool_call_id="1", artifact=(valid_refs, invalid_refs, None, None))]}},
+    }
+    (_, node_end), (name, places) = asyncio.run(chat_stream.sse_events_from_agent_event(event))
+    assert node_end == {"node": "google_maps_text_search_and_filter"}
+    assert name == "places"
+    assert (places["valid_count"], places["invalid_count"]) == (7, 2)
+    # The top ones, in rank order
+    assert [p["name"] for p in places["places"]] == [p.name for p in places_objects[:5]]
+    assert places["places"][0]["display_name_text"] == places_objects[0].display_name_text
+    store.close()
+
+def test_error_event(monkeypatch):
+    class FailingAgent:
+        async def astream_events(self, *args, **kwargs):
+            raise RuntimeError("model unavailable")
+            yield
+
+    async def collect():
+        kwargs = {"input": {}, "config": {"configurable": {"thread_id": "t"}}}
+        return [chunk async for chunk in chat_stream.stream_agent_events(FailingAgent(), kwargs)]
+
+    assert parse_sse("".join(asyncio.run(collect()))) == [("error", {"detail": "model unavailable"})]
@@ -0,0 +1,112 @@
+import asyncio
+import operator
+import sqlite3
+import time
+from typing import Annotated, List, TypedDict
+
+import pytest
+from langgraph.checkpoint.base.id import uuid6
+from langgraph.graph import END, StateGraph
+
+from app.services.checkpointer import open_checkpointer, checkpointer_metrics, checkpoint_id_at
+
+class CounterState(TypedDict):
+    steps: Annotated[List[int], operator.add]
+
+def build_graph(checkpointer):
+    workflow = StateGraph(CounterState)
+    workflow.add_node('first', lambda state: {"steps": [1]})
+    workflow.add_node('second', lambda state: {"steps": [2]})
+    workflow.set_entry_point('first')
+    workflow.add_edge('first', 'second')
+    workflow.add_edge('second', END)
+    return workflow.compile(checkpointer=checkpointer)
+
+def count_checkpoints(path, thread_id):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+def test_checkpoint_id_at_orders_like_langgraph_ids():
+    before = checkpoint_id_at(time.time() - 1)
+    checkpoint_id = str(uuid6(clock_seq=0))
+    after = checkpoint_id_at(time.time() + 1)
+    assert before < checkpoint_id < after
+
+def test_writes_are_coalesced_and_survive_reopening(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    config = {"configurable": {"thread_id": "a"}}
+
+    async def run():
+        async with open_checkpointer("sqlite", path, commit_interval_seconds=0.05) as saver:
+            graph = build_graph(saver)
+            await graph.ainvoke({"steps": []}, config)
+            await graph.ainvoke({"steps": []}, config)
+            return await checkpointer_metrics(saver)
+
+    metrics = asyncio.run(run())
+    assert metrics["commits"] < metrics["puts"] + metrics["put_writes"]
+    assert metrics["db_bytes"] > 0
+    assert metrics["put_latency_ms"]["max"] >= metrics["put_latency_ms"]["p50"] > 0
+
+    async def reopen():
+        async with open_checkpointer("sqlite", path) as saver:
+            return (await build_graph(saver).aget_state(config)).values
+
+    assert asyncio.run(reopen()) == {"steps": [1, 2, 1, 2]}
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def test_maintenance_keeps_the_latest_checkpoints_per_thread(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+
+    async def run():
+        async with open_checkpointer("sqlite", path, keep_last=3, max_age_seconds=0) as saver:
+            graph = build_graph(saver)
+            for thread_id in ("a", "b"):
+                for _ in range(4):
+                    await graph.ainvoke({"steps": []}, {"configurable": {"thread_id": thread_id}})
+            await saver.run_maintenance()
+            state = await graph.aget_state({"configurable": {"thread_id": "a"}})
+            return state.values, await checkpointer_metrics(saver)
+
+    values, metrics = asyncio.run(run())
+    # The latest state is still all there
+    assert values == {"steps": [1, 2] * 4}
+    assert count_checkpoints(path, "a") == 3
+    assert count_checkpoints(path, "b") == 3
+    assert metrics["pruned_checkpoints"] > 0
+    assert metrics["vacuums"] == 1
+
+def test_maintenance_drops_expired_threads(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+
+    async def run():
+        async with open_checkpointer("sqlite", path, keep_last=0, max_age_seconds=0.2) as saver:
+            graph = build_graph(saver)
+            await graph.ainvoke({"steps": []}, {"configurable": {"thread_id": "old"}})
+            await saver.run_maintenance()
+            await asyncio.sleep(0.3)
+            await graph.ainvoke({"steps": []}, {"configurable": {"thread_id": "new"}})
+            await saver.run_maintenance()
+
+    asyncio.run(run())
+    assert count_checkpoints(path, "old") == 0
+    assert count_checkpoints(path, "new") > 0
+
+def test_memory_backend():
+    async def run():
+        async with open_checkpointer("memory") as saver:
+            graph = build_graph(saver)
+            await graph.ainvoke({"steps": []}, {"configurable": {"thread_id": "a"}})
+            return await checkpointer_metrics(saver)
+
+    assert asyncio.run(run()) == {"backend": "memory"}
+
+def test_unknown_backend():
+    async def run():
+        async with open_checkpointer("postgres"):
+            pass
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
@@ -0,0 +1,119 @@
+import asyncio
+import importlib
+import time
+
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
+
+from app.schemas import StateUpdaterOutputFormat, DateTimeExtract, CombinedExtractionOutputFormat, CustomAIMessage
+from app.graph.chat_models import FakeFoodFinderChatModel, create_chat_model
+from app.graph.food_finder_agent import food_finder_agent, create_initial_state
+from app.graph.prompts import MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT
+from app.graph.tools import google_maps_text_search_and_filter, show_more_places
+from app.graph.tools.places_client import PlacesClient
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_prefetch import PagePrefetcher
+from app.services import llm_cache
+
+from places_standin import PlacesCorpus, create_app
+
+agent_module = importlib.import_module("app.graph.food_finder_agent")
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+USER_MESSAGE = "Thai food for a party of 4, within 5 miles"
+
+def test_structured_outputs():
+    fake = FakeFoodFinderChatModel()
+    updater_output = fake.with_structured_output(StateUpdaterOutputFormat).invoke([HumanMessage(content=USER_MESSAGE)])
+    assert isinstance(updater_output, StateUpdaterOutputFormat)
+    assert updater_output.party_size.value == 4
+    assert updater_output.desired_max_distance_meters == pytest.approx(5 * 1609.3)
+
+    prompt = "Some instructions about dates\ntomorrow at 7pm"
+    assert fake.with_structured_output(DateTimeExtract).invoke(prompt).dt.hour == 19
+    combined = fake.with_structured_output(CombinedExtractionOutputFormat).invoke([HumanMessage(content=USER_MESSAGE)])
+    assert combined.party_size.value == 4 and "thai" in combined.maps_query.lower()
+
+def test_query_and_supervisor_tool_calls():
+    fake = FakeFoodFinderChatModel()
+    query = fake.invoke([SystemMessage(content=MAPS_QUERY_FORMULATOR_SYSTEM_PROMPT), HumanMessage(content=USER_MESSAGE)]).content
+    assert "thai" in query.lower()
+
+    supervisor = fake.bind_tools([google_maps_text_search_and_filter, show_more_places])
+    messages = [HumanMessage(content=USER_MESSAGE), CustomAIMessage(content=query, originating_node="maps_query_formulator_node")]
+    search = supervisor.invoke(messages)
+    assert search.tool_calls[0]["name"] == "google_maps_text_search_and_filter"
+    assert search.tool_calls[0]["args"] == {"api_query": query}
+    # Same conversation, same answer
+    assert supervisor.invoke(messages).tool_calls == search.tool_calls
+
+    messages += [search, ToolMessage(content="Found places", name="google_maps_text_search_and_filter", tool_call_id=search.tool_calls[0]["id"])]
+    reply = supervisor.invoke(messages)
+    assert reply.content and not reply.tool_calls
+    more = supervisor.invoke(messages + [reply, HumanMessage(content="Show me some more")])
+    assert more.tool_calls[0]["name"] == "show_more_places"
+
+def test_latency_and_token_streaming():
+    fake = FakeFoodFinderChatModel(latency_seconds=0.05, token_seconds=0.01)
+    messages = [SystemMessage(content="Say hello"), HumanMessage(content="hi")]
+
+    async def stream():
+        started = time.perf_counter()
+        chunks = [chunk async for chunk in fake.astream(messages)]
+        return chunks, time.perf_counter() - started
+
+    chunks, elapsed = asyncio.run(stream())
+    text = "".join(chunk.content for chunk in chunks)
+    assert text == fake.invoke(messages).content
+    assert len([c for c in chunks if c.content]) > 1
+    assert elapsed >= 0.05 + 0.01 * (len(chunks) - 1)
+    assert sum(chunks[1:], chunks[0]).usage_metadata["output_tokens"] > 0
+
+def test_unknown_provider():
+    with pytest.raises(ValueError):
+        create_chat_model("nope")
+
+def test_graph_runs_end_to_end_offline(tmp_path, monkeypatch):
+    fake = FakeFoodFinderChatModel()
+    monkeypatch.setattr(agent_module, "PREFERENCE_FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent_module, "llm", fake)
+    monkeypatch.setattr(agent_module, "team_supervisor", fake.bind_tools([google_maps_text_search_and_filter, show_more_places]))
+    monkeypatch.setattr(agent_module, "datetime_extractor", fake.with_structured_output(DateTimeExtract))
+    monkeypatch.setattr(agent_module, "state_updater", fake.with_structured_output(StateUpdaterOutputFormat))
+    monkeypatch.setattr(llm_cache, "_shared_cache", llm_cache.LLMResultCache(":memory:"))
+    # Places from the local stand-in (see places_standin.py)
+    store = PlaceStore(str(tmp_path / "places.db"))
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(agent_module, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache())
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: PagePrefetcher())
+
+    async def run():
+        client = PlacesClient(api_key="standin", base_url="http://standin/v1", transport=httpx.ASGITransport(app=create_app(PlacesCorpus.load())))
+        monkeypatch.setattr(places_search, "get_places_client", lambda: client)
+        try:
+            # A time the places are open at (the fake's time is the parsed one)
+            return await food_finder_agent.ainvoke(create_initial_state("Dinner tomorrow at 7pm, party of 4, within 5 miles", (30.2672, -97.7431)))
+        finally:
+            await client.aclose()
+
+    state = asyncio.run(run())
+    store.close()
+    assert state["user_preferences"].party_size.value == 4
+    assert any(isinstance(m, ToolMessage) and m.name == "google_maps_text_search_and_filter" for m in state["messages"])
+    assert isinstance(state["messages"][-1], AIMessage) and "1. " in state["messages"][-1].content
+
+def test_state_updater_reads_follow_up_messages(monkeypatch):
+    fake = FakeFoodFinderChatModel()
+    monkeypatch.setattr(agent_module, "PREFERENCE_FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent_module, "state_updater", fake.with_structured_output(StateUpdaterOutputFormat))
+    monkeypatch.setattr(llm_cache, "_shared_cache", llm_cache.LLMResultCache(":memory:"))
+    state = create_initial_state(USER_MESSAGE)
+    state["messages"] += [AIMessage(content="Here are some places:"), HumanMessage(content="Actually we need outdoor seating")]
+
+    update = asyncio.run(agent_module.state_updater_node(state))
+    preferences = update["user_preferences"]
+    assert preferences.wants_outdoor_seating.value is True
+    assert preferences.party_size.value == 4
@@ -0,0 +1,146 @@
+import asyncio
+import importlib
+import time
+from datetime import datetime
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.schemas import StateUpdaterOutputFormat, DateTimeExtract, CombinedExtractionOutputFormat, CustomAIMessage
+from app.graph.food_finder_agent import food_finder_agent, create_initial_state
+from app.services import llm_cache
+
+# (app.graph re-exports the compiled graph under the module's name)
+agent_module = importlib.import_module("app.graph.food_finder_agent")
+
+LLM_LATENCY_SECONDS = 0.3
+EXTRACTED_DATETIME = datetime(2024, 10, 10, 19, 0)
+
+class SlowFakeLLM:
+    """Stands in for the chat model: every call takes LLM_LATENCY_SECONDS (without blocking a thread)"""
+    def __init__(self, when_to_eat_specified=True):
+        self.when_to_eat_specified = when_to_eat_specified
+        self.calls = []
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        self.calls.append("chat")
+        await asyncio.sleep(LLM_LATENCY_SECONDS)
+        return AIMessage(content="asian restaurant")
+
+class SlowFakeStructured:
+    """Stands in for a structured output runnable, returning fixed extractions"""
+    def __init__(self, llm, schema):
+        self.llm = llm
+        self.schema = schema
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        self.llm.calls.append(self.schema.__name__)
+        await asyncio.sleep(LLM_LATENCY_SECONDS)
+        if self.schema is DateTimeExtract:
+            return DateTimeExtract(dt=EXTRACTED_DATETIME)
+        if self.schema is CombinedExtractionOutputFormat:
+            return CombinedExtractionOutputFormat(
+                when_to_eat_specified=self.llm.when_to_eat_specified, length_of_stay=90,
+                dt=EXTRACTED_DATETIME, maps_query="asian restaurant",
+            )
+        return StateUpdaterOutputFormat(when_to_eat_specified=self.llm.when_to_eat_specified, length_of_stay=90)
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    def use(fast_path=False, **kwargs):
+        llm = SlowFakeLLM(**kwargs)
+        # Off by default, so the extraction nodes call the model
+        monkeypatch.setattr(agent_module, "PREFERENCE_FAST_PATH_ENABLED", fast_path)
+        monkeypatch.setattr(agent_module, "llm", llm)
+        monkeypatch.setattr(agent_module, "team_supervisor", llm)
+        monkeypatch.setattr(agent_module, "datetime_extractor", SlowFakeStructured(llm, DateTimeExtract))
+        monkeypatch.setattr(agent_module, "state_updater", SlowFakeStructured(llm, StateUpdaterOutputFormat))
+        monkeypatch.setattr(agent_module, "combined_extractor", SlowFakeStructured(llm, CombinedExtractionOutputFormat))
+        # A fresh result cache, so every test sees the model calls
+        monkeypatch.setattr(llm_cache, "_shared_cache", llm_cache.LLMResultCache(":memory:"))
+        return llm
+    return use
+
+def run(state, config=None):
+    return asyncio.run(food_finder_agent.ainvoke(state, config))
+
+def test_extraction_nodes_fan_out_from_the_start_and_join_before_the_supervisor():
+    edges = {(e.source, e.target) for e in food_finder_agent.get_graph().edges}
+    for node in agent_module.EXTRACTION_NODES:
+        assert ('__start__', node) in edges
+        assert (node, 'join_extractions_node') in edges
+    assert ('join_extractions_node', 'team_supervisor_node') in edges
+
+def test_extractions_run_concurrently(fake_llm):
+    llm = fake_llm()
+    started = time.perf_counter()
+    state = run(create_initial_state("Dinner at 7pm for an hour and a half"))
+    elapsed = time.perf_counter() - started
+
+    assert sorted(llm.calls) == sorted(["StateUpdaterOutputFormat", "DateTimeExtract", "chat", "chat"])
+    # Extractions in parallel, then the supervisor: two LLM latencies instead of four
+    assert elapsed < 3 * LLM_LATENCY_SECONDS
+    assert state["user_preferences"].desired_time_and_stay_duration == (EXTRACTED_DATETIME, 90)
+    assert state["datetime_extracted"]
+
+def test_extracted_datetime_is_dropped_when_not_specified(fake_llm):
+    fake_llm(when_to_eat_specified=False)
+    initial_state = create_initial_state("Somewhere for dinner")
+    default_time = initial_state["user_preferences"].desired_time_and_stay_duration[0]
+    state = run(initial_state)
+    assert state["user_preferences"].desired_time_and_stay_duration == (default_time, 90)
+    assert not state["datetime_extracted"]
+
+def test_datetime_is_only_extracted_once(fake_llm):
+    llm = fake_llm()
+    state = create_initial_state("Dinner at 7pm")
+    state["datetime_extracted"] = True
+    run(state)
+    assert "DateTimeExtract" not in llm.calls
+
+def test_many_concurrent_conversations(fake_llm):
+    # The nodes are async, so waiting on the model doesn't hold a thread each (a thread pool
+    # would need 200 conversations * 4 calls * 0.3s / its size to get through these)
+    llm = fake_llm()
+
+    async def run_many():
+        return await asyncio.gather(*(
+            food_finder_agent.ainvoke(create_initial_state(f"Dinner at 7pm, conversation {i}")) for i in range(200)
+        ))
+
+    started = time.perf_counter()
+    states = asyncio.run(run_many())
+    elapsed = time.perf_counter() - started
+    assert len(states) == 200 and len(llm.calls) == 200 * 4
+    assert elapsed < 10 * LLM_LATENCY_SECONDS
+
+def test_repeated_queries_reuse_cached_extractions(fake_llm):
+    llm = fake_llm()
+    run(create_initial_state("Dinner at 7pm"))
+    run(create_initial_state("dinner at  7PM"))
+    # The state updater and query formulator are cached, the datetime extractor and supervisor aren't
+    assert sorted(llm.calls) == sorted(["StateUpdaterOutputFormat", "DateTimeExtract", "chat", "chat", "DateTimeExtract", "chat"])
+
+def test_combined_extraction_mode_makes_one_extraction_call(fake_llm):
+    llm = fake_llm()
+    state = run(create_initial_state("Dinner at 7pm for an hour and a half"), {"configurable": {"extraction_mode": "combined"}})
+    assert llm.calls == ["CombinedExtractionOutputFormat", "chat"]
+    assert state["user_preferences"].desired_time_and_stay_duration == (EXTRACTED_DATETIME, 90)
+    assert state["datetime_extracted"]
+    queries = [m.content for m in state["messages"] if isinstance(m, CustomAIMessage)]
+    assert queries == ["asian restaurant"]
+
+def test_fast_path_skips_the_extraction_calls(fake_llm):
+    llm = fake_llm(fast_path=True)
+    state = run(create_initial_state("Dinner at 7pm for an hour and a half, party of 4"))
+    # Only the query formulator and the supervisor
+    assert llm.calls == ["chat", "chat"]
+    assert state["user_preferences"].desired_time_and_stay_duration[1] == 90
+    assert state["user_preferences"].desired_time_and_stay_duration[0].hour == 19
+    assert state["user_preferences"].party_size.value == 4
+    assert state["when_to_eat_specified"] and state["datetime_extracted"]
+
+def test_fast_path_falls_back_to_the_model(fake_llm):
+    llm = fake_llm(fast_path=True)
+    run(create_initial_state("Dinner at 7pm somewhere with a cozy atmosphere"))
+    assert "StateUpdaterOutputFormat" in llm.calls and "DateTimeExtract" in llm.calls
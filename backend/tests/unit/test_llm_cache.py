@@ -0,0 +1,86 @@
+import asyncio
+
+from app.schemas import StateUpdaterOutputFormat
+from app.services.llm_cache import LLMResultCache, make_llm_cache_key
+
+PROMPT = "Extract the user's preferences"
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return StateUpdaterOutputFormat(when_to_eat_specified=True, length_of_stay=90)
+
+def call(cache, model, input_text, node="state_updater_node", prompt=PROMPT):
+    return asyncio.run(cache.get_or_invoke(
+        node, "gpt-4o", prompt, input_text,
+        invoke=model, dump=lambda output: output.model_dump_json(), load=StateUpdaterOutputFormat.model_validate_json,
+    ))
+
+def test_key_normalizes_input():
+    assert make_llm_cache_key("n", "m", PROMPT, "Vegan  food\n") == make_llm_cache_key("n", "m", PROMPT, "vegan food")
+    assert make_llm_cache_key("n", "m", PROMPT, "vegan food") != make_llm_cache_key("n", "m", PROMPT + "!", "vegan food")
+    assert make_llm_cache_key("n", "m", PROMPT, "vegan food") != make_llm_cache_key("other", "m", PROMPT, "vegan food")
+
+def test_hits_and_misses(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "llm_cache.db"))
+    model = CountingModel()
+    first = call(cache, model, "Vegan food for an hour")
+    second = call(cache, model, "vegan food for an hour ")
+    call(cache, model, "Vegan food for an hour", prompt="A new prompt")
+    assert first == second and second.length_of_stay == 90
+    assert model.calls == 2
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 2
+    cache.close()
+
+    # Persisted across restarts
+    reopened = LLMResultCache(str(tmp_path / "llm_cache.db"))
+    call(reopened, model, "Vegan food for an hour")
+    assert model.calls == 2 and len(reopened) == 2
+
+def test_evicts_least_recently_used():
+    cache = LLMResultCache(":memory:")
+    model = CountingModel()
+    call(cache, model, "one")
+    # Room for two entries
+    cache.max_bytes = 2 * cache.total_bytes()
+    call(cache, model, "two")
+    call(cache, model, "one")
+    call(cache, model, "three")
+    # "two" was used least recently
+    assert cache.get("state_updater_node", "gpt-4o", PROMPT, "two") is None
+    assert cache.get("state_updater_node", "gpt-4o", PROMPT, "one") is not None
+    assert cache.total_bytes() <= cache.max_bytes
+    assert cache.stats["evictions"] == 1
+
+def test_byte_total_is_kept_up_to_date(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "llm_cache.db"))
+    model = CountingModel()
+    for text in ["one", "two", "three"]:
+        call(cache, model, text)
+    # Replacing an entry doesn't count it twice
+    cache.put("state_updater_node", "gpt-4o", PROMPT, "one", "{}")
+    stored = cache._conn.execute("SELECT SUM(size) FROM llm_cache").fetchone()[0]
+    assert cache.total_bytes() == stored
+    cache.max_bytes = stored - 1
+    cache.put("state_updater_node", "gpt-4o", PROMPT, "two", "{}")
+    assert cache.total_bytes() == cache._conn.execute("SELECT SUM(size) FROM llm_cache").fetchone()[0] <= cache.max_bytes
+    cache.close()
+    # Summed again on open
+    assert LLMResultCache(str(tmp_path / "llm_cache.db")).total_bytes() == cache.total_bytes()
+
+def test_similar_inputs_hit_the_embedding_tier():
+    vectors = {"vegan food": [1.0, 0.0], "vegan food please": [0.99, 0.05], "steak": [0.0, 1.0]}
+
+    async def embedder(text):
+        return vectors[text]
+
+    cache = LLMResultCache(":memory:", embedder=embedder, similarity_threshold=0.95)
+    model = CountingModel()
+    call(cache, model, "vegan food")
+    call(cache, model, "vegan food please")
+    call(cache, model, "steak")
+    assert model.calls == 2
+    assert cache.stats["similar_hits"] == 1
@@ -0,0 +1,101 @@
+import asyncio
+import importlib
+import json
+
+import numpy as np
+import pytest
+
+from app.schemas import Place, UserPreferences, SearchContext
+from app.graph.food_finder_agent import DEFAULT_AGENT_STATE
+from app.graph.tools import google_maps_text_search_and_filter, PlaceFeatures
+from app.graph.tools.geo import COMPASS_DIRECTIONS, direction_rectangle, distances_meters, haversine_meters, offset_point, point_in_shape
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_prefetch import PagePrefetcher
+
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+pages = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        pages.append(json.load(file)['places'])
+# test_1 is in Sydney, test_2 in Austin
+sydney_places = [Place.model_validate(p) for p in pages[0]]
+austin_places = [Place.model_validate(p) for p in pages[1]]
+DOWNTOWN_AUSTIN = (30.2672, -97.7431)
+
+@pytest.mark.parametrize("direction", list(COMPASS_DIRECTIONS))
+def test_direction_rectangle_covers_that_direction(direction):
+    north, east = COMPASS_DIRECTIONS[direction]
+    rectangle = direction_rectangle(*DOWNTOWN_AUSTIN, direction, 5000)
+    norm = np.hypot(north, east)
+    ahead = offset_point(*DOWNTOWN_AUSTIN, north / norm * 3000, east / norm * 3000)
+    behind = offset_point(*DOWNTOWN_AUSTIN, -north / norm * 1000, -east / norm * 1000)
+    assert point_in_shape(*ahead, rectangle)
+    assert not point_in_shape(*behind, rectangle)
+
+def test_diagonal_rectangle_reaches_the_distance():
+    rectangle = direction_rectangle(*DOWNTOWN_AUSTIN, "ne", 5000)["rectangle"]
+    assert (rectangle["low"]["latitude"], rectangle["low"]["longitude"]) == DOWNTOWN_AUSTIN
+    far_corner = haversine_meters(*DOWNTOWN_AUSTIN, rectangle["high"]["latitude"], rectangle["high"]["longitude"])
+    assert far_corner == pytest.approx(5000, rel=0.01)
+
+def test_location_parameters(monkeypatch):
+    state = {**DEFAULT_AGENT_STATE, "user_coordinates": DOWNTOWN_AUSTIN, "desired_max_distance_meters": 5000.0}
+    assert "circle" in places_search.get_maps_text_search_parameters(state)["locationBias"]
+    state["preferred_direction"] = "SW"
+    assert places_search.get_maps_text_search_parameters(state)["locationBias"] == direction_rectangle(*DOWNTOWN_AUSTIN, "SW", 5000.0)
+
+    # A hard restriction is always a rectangle
+    monkeypatch.setattr(places_search, "PLACES_LOCATION_RESTRICTION", True)
+    assert places_search.get_maps_text_search_parameters(state) == {"locationRestriction": direction_rectangle(*DOWNTOWN_AUSTIN, "SW", 5000.0)}
+    state["preferred_direction"] = "any"
+    restriction = places_search.get_maps_text_search_parameters(state)["locationRestriction"]
+    assert point_in_shape(*offset_point(*DOWNTOWN_AUSTIN, 4900, 4900), restriction)
+
+@pytest.mark.parametrize("direction, compass", [("north", "N"), ("Northeast", "NE"), ("south west", "SW"), ("se", "SE")])
+def test_direction_names(direction, compass):
+    assert places_search.get_location_bias(DOWNTOWN_AUSTIN, direction, 5000.0) == direction_rectangle(*DOWNTOWN_AUSTIN, compass, 5000.0)
+
+def test_distances_match_haversine():
+    features = PlaceFeatures(austin_places + sydney_places)
+    expected = [haversine_meters(*DOWNTOWN_AUSTIN, p.location.latitude, p.location.longitude) for p in features.places]
+    assert distances_meters(*DOWNTOWN_AUSTIN, features.latitude, features.longitude) == pytest.approx(expected)
+
+def test_filter_by_distance():
+    places, distances = places_search.filter_by_distance(sydney_places + austin_places, DOWNTOWN_AUSTIN, 5000)
+    expected = [p for p in austin_places if haversine_meters(*DOWNTOWN_AUSTIN, p.location.latitude, p.location.longitude) <= 5000]
+    assert places == expected
+    assert (distances <= 5000).all() and len(distances) == len(places)
+
+def test_closer_places_score_higher():
+    context = SearchContext(parameters={}, user_preferences=UserPreferences(), user_coordinates=DOWNTOWN_AUSTIN, max_distance_meters=20000.0)
+    without_distance = places_search.score_candidates(austin_places, context.model_copy(update={"user_coordinates": None}))
+    with_distance = places_search.score_candidates(austin_places, context)
+    distances = distances_meters(*DOWNTOWN_AUSTIN, PlaceFeatures(austin_places).latitude, PlaceFeatures(austin_places).longitude)
+    bonus = with_distance - without_distance
+    assert (bonus >= 0).all() and (bonus <= places_search.DISTANCE_SCORE_WEIGHT).all()
+    assert np.argmax(bonus) == np.argmin(distances)
+
+def test_tool_drops_places_out_of_range(tmp_path, monkeypatch):
+    class AnywhereSearch:
+        async def search_text(self, body, field_mask):
+            return {'places': pages[0] + pages[1]}
+
+    store = PlaceStore(str(tmp_path / "places.db"))
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache())
+    monkeypatch.setattr(places_search, "get_places_client", lambda: AnywhereSearch())
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: PagePrefetcher())
+    monkeypatch.setattr(places_search, "PLACES_TWO_PHASE_FETCH", False)
+    state = {**DEFAULT_AGENT_STATE, "user_preferences": UserPreferences(), "user_coordinates": DOWNTOWN_AUSTIN, "desired_max_distance_meters": 8000.0}
+
+    tool_call = {"name": "google_maps_text_search_and_filter", "args": {"api_query": "asian food", "state": state}, "id": "1", "type": "tool_call"}
+    message = asyncio.run(google_maps_text_search_and_filter.ainvoke(tool_call))
+    store.close()
+
+    _, _, _, last_search = message.artifact
+    in_range = places_search.filter_by_distance(austin_places, DOWNTOWN_AUSTIN, 8000.0)[0]
+    assert 0 < len(in_range) < len(austin_places)
+    assert last_search.place_names == [p.name for p in in_range]
+    assert last_search.user_coordinates == DOWNTOWN_AUSTIN
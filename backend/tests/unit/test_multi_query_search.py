@@ -0,0 +1,78 @@
+import asyncio
+import importlib
+import json
+from datetime import datetime
+
+from app.schemas import Place, UserPreferences, PreferenceWeight
+from app.graph.food_finder_agent import DEFAULT_AGENT_STATE
+from app.graph.tools import google_maps_text_search_and_filter, split_valid_places
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_ingest import dedupe_places
+from app.graph.tools.places_prefetch import PagePrefetcher
+
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+pages = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        pages.append(json.load(file)['places'])
+
+USER_PREFERENCES = UserPreferences(
+    desired_cuisines=PreferenceWeight(value=["Sushi", "Thai"], weight=0.8),
+    desired_time_and_stay_duration=(datetime(2024, 9, 25, 12, 0), 60),
+)
+NO_PREFERENCES = UserPreferences()
+
+def test_search_queries_one_per_line():
+    assert places_search.search_queries("Sushi in Austin\n\nThai food in Austin\nsushi in austin ", NO_PREFERENCES, False) == ["Sushi in Austin", "Thai food in Austin"]
+    assert places_search.search_queries("a\nb\nc\nd", NO_PREFERENCES, False) == ["a", "b", "c"]
+
+def test_search_queries_add_missing_cuisines_near_the_user():
+    assert places_search.search_queries("sushi near me", USER_PREFERENCES, True) == ["sushi near me", "Thai food"]
+    # Without a location, a query for just the cuisine could be anywhere
+    assert places_search.search_queries("sushi in Austin", USER_PREFERENCES, False) == ["sushi in Austin"]
+    assert places_search.search_queries("pizza near me", NO_PREFERENCES, True) == ["pizza near me"]
+
+def test_dedupe_places():
+    places = [Place.model_validate(p) for p in pages[0][:3]]
+    assert dedupe_places(places + places[::-1]) == places
+
+class CuisineSearch:
+    """Stands in for PlacesClient.search_text: sushi gets the first test page, Thai the second plus a few of
+    the first. Records how many searches were in flight at once"""
+    def __init__(self):
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def search_text(self, body, field_mask):
+        self.queries.append(body['textQuery'])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return {'places': pages[0] if 'sushi' in body['textQuery'] else pages[1] + pages[0][:3]}
+
+def test_queries_are_searched_concurrently_and_merged(tmp_path, monkeypatch):
+    store = PlaceStore(str(tmp_path / "places.db"))
+    search = CuisineSearch()
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache())
+    monkeypatch.setattr(places_search, "get_places_client", lambda: search)
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: PagePrefetcher())
+    monkeypatch.setattr(places_search, "PLACES_TWO_PHASE_FETCH", False)
+    state = {**DEFAULT_AGENT_STATE, "user_preferences": USER_PREFERENCES}
+
+    tool_call = {"name": "google_maps_text_search_and_filter", "args": {"api_query": "sushi in Austin\nThai food in Austin", "state": state}, "id": "1", "type": "tool_call"}
+    message = asyncio.run(google_maps_text_search_and_filter.ainvoke(tool_call))
+    store.close()
+
+    assert sorted(search.queries) == ["sushi in austin", "thai food in austin"]
+    assert search.max_in_flight == 2
+    valid_refs, invalid_refs, _, last_search = message.artifact
+    merged = [Place.model_validate(p) for p in pages[0] + pages[1]]
+    assert last_search.place_names == [p.name for p in merged]
+    expected_valid, expected_invalid = split_valid_places(merged, USER_PREFERENCES)
+    assert {ref.name for ref in valid_refs} == {p.name for p in expected_valid}
+    assert len(invalid_refs) == len(expected_invalid)
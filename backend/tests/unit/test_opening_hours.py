@@ -0,0 +1,83 @@
+import json
+from datetime import datetime, timedelta
+from typing import Tuple
+
+import pytest
+
+from app.schemas.schema import Place, OpenClosePeriod, TimeInfo, RegularOpeningHours
+from app.graph.tools import check_if_user_stay_fits_open_hours
+from app.graph.tools.opening_hours import OpeningHoursBatch, check_open_hours, format_minute_of_day
+
+# read in both test_text_search_json files
+places_objects = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        for p in json.load(file)['places']:
+            places_objects.append(Place.model_validate(p))
+
+# ~~~~~~~ The datetime based implementation the interval index replaced, kept as the reference ~~~~~~~
+def reference_check_if_user_stay_fits_open_hours(place: Place, user_stay: Tuple[datetime, int]) -> Tuple[bool, str]:
+    user_start, duration = user_stay
+    user_end = user_start + timedelta(minutes=duration)
+
+    if not place.regular_opening_hours or not place.regular_opening_hours.periods:
+        return False, "No opening hours information available for this place."
+
+    day_periods = [period for period in place.regular_opening_hours.periods
+                   if period.open.day in [user_start.weekday(), (user_start.weekday() + 1) % 7]]
+
+    if not day_periods:
+        return False, "This place is closed on the day you want to visit."
+
+    def get_datetime(date, time_info):
+        dt = datetime.combine(date, datetime.min.time().replace(hour=time_info.hour, minute=time_info.minute))
+        if time_info.day != date.weekday():
+            dt += timedelta(days=1)
+        return dt
+
+    for period in day_periods:
+        open_time = get_datetime(user_start.date(), period.open)
+        close_time = get_datetime(user_start.date(), period.close)
+
+        if close_time < open_time:
+            close_time += timedelta(days=1)
+
+        if open_time <= user_start < close_time:
+            if user_end <= close_time:
+                return True, ""
+            else:
+                return False, f"This place will close at {close_time.strftime('%I:%M %p')} before you finish your stay. Consider shortening your visit or coming earlier."
+
+    opening_hours_str = ', '.join(sorted(set([f"{get_datetime(user_start.date(), p.open).strftime('%I:%M %p')} - {get_datetime(user_start.date(), p.close).strftime('%I:%M %p')}" for p in day_periods])))
+    return False, f"This place will be closed when you want to visit. The opening hours for this day are: {opening_hours_str}. Please adjust your visit time accordingly."
+
+# Every 20 minutes (plus some seconds) of a week, for a few stay lengths
+USER_STAYS = [
+    (datetime(2024, 10, 7, 0, 0, 30) + timedelta(minutes=20 * i), duration)
+    for i in range(7 * 24 * 3)
+    for duration in (30, 90, 240)
+]
+
+def test_format_minute_of_day():
+    for minute in range(0, 24 * 60, 7):
+        assert format_minute_of_day(minute) == (datetime(2024, 1, 1) + timedelta(minutes=minute)).strftime('%I:%M %p')
+
+def test_matches_reference_on_test_data():
+    for place in places_objects:
+        for user_stay in USER_STAYS:
+            assert check_if_user_stay_fits_open_hours(place, user_stay) == reference_check_if_user_stay_fits_open_hours(place, user_stay)
+
+def test_matches_reference_across_week_wrap():
+    # Saturday (day 6) night into Sunday (day 0), and a place with no hours at all on most days
+    periods = [
+        OpenClosePeriod(open=TimeInfo(day=6, hour=20, minute=0), close=TimeInfo(day=0, hour=3, minute=0)),
+        OpenClosePeriod(open=TimeInfo(day=0, hour=11, minute=30), close=TimeInfo(day=0, hour=14, minute=0)),
+    ]
+    place = places_objects[0].model_copy(update={"regular_opening_hours": RegularOpeningHours(periods=periods)})
+    for user_stay in USER_STAYS:
+        assert check_if_user_stay_fits_open_hours(place, user_stay) == reference_check_if_user_stay_fits_open_hours(place, user_stay)
+
+def test_batch_matches_single_place_checks():
+    batch = OpeningHoursBatch(places_objects)
+    for user_stay in USER_STAYS[::7]:
+        assert batch.check(user_stay) == [check_open_hours(p, user_stay) for p in places_objects]
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.schemas.schema import Place
+from app.graph.tools import places_search
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_client import PlacesClient
+from app.graph.tools.places_search import fetch_place_details, GOOGLE_DETAILS_FIELDS, GOOGLE_LEAN_FIELD_MASK, GOOGLE_FIELD_MASK
+
+# read in test_text_search_json.txt
+TEST_JSON = None
+TEST_FILE_PATH = "../test_data/test_2.txt"
+with open(TEST_FILE_PATH, "r") as file:
+    TEST_JSON = json.load(file)
+FULL_PLACES = {p["name"]: p for p in TEST_JSON["places"]}
+
+def lean(place_json):
+    return {k: v for k, v in place_json.items() if k not in GOOGLE_DETAILS_FIELDS}
+
+class DetailsServer:
+    """Serves Place Details for the test data, keeping track of how many requests were in flight"""
+    def __init__(self, fail_names=()):
+        self.fail_names = set(fail_names)
+        self.requested = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request: httpx.Request):
+        name = request.url.path.split("/v1/")[-1]
+        self.requested.append(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if name in self.fail_names:
+            return httpx.Response(404, json={"error": "not found"})
+        fields = request.headers["X-Goog-FieldMask"].split(",")
+        return httpx.Response(200, json={k: v for k, v in FULL_PLACES[name].items() if k in fields})
+
+@pytest.fixture
+def details_server(monkeypatch):
+    def use(server):
+        clients = []
+        def get_client():
+            if not clients:
+                clients.append(PlacesClient(api_key="test-key", transport=httpx.MockTransport(server), max_retries=0))
+            return clients[0]
+        cache = PlacesSearchCache()
+        monkeypatch.setattr(places_search, "get_places_client", get_client)
+        monkeypatch.setattr(places_search, "get_places_cache", lambda: cache)
+        return server
+    return use
+
+def test_lean_mask_leaves_out_detail_fields():
+    lean_fields = set(GOOGLE_LEAN_FIELD_MASK.split(","))
+    assert lean_fields < set(GOOGLE_FIELD_MASK.split(","))
+    assert lean_fields.isdisjoint(f"places.{f}" for f in GOOGLE_DETAILS_FIELDS)
+    # Everything filter_places and scoring read is still there
+    assert {"places.regularOpeningHours", "places.userRatingCount", "places.goodForGroups", "places.parkingOptions"} <= lean_fields
+
+def test_details_fill_in_top_places(details_server):
+    server = details_server(DetailsServer())
+    places = [Place.model_validate(lean(p)) for p in TEST_JSON["places"]]
+    detailed = asyncio.run(fetch_place_details(places, top_n=5, max_concurrency=2))
+
+    assert sorted(server.requested) == sorted(p.name for p in places[:5])
+    assert server.max_in_flight <= 2
+    for place, expected in zip(detailed[:5], TEST_JSON["places"][:5]):
+        assert place == Place.model_validate(expected)
+    assert detailed[5:] == places[5:]
+
+def test_failed_details_keep_the_lean_place(details_server):
+    places = [Place.model_validate(lean(p)) for p in TEST_JSON["places"][:3]]
+    details_server(DetailsServer(fail_names=[places[1].name]))
+    detailed = asyncio.run(fetch_place_details(places, top_n=3))
+    assert detailed[1] == places[1]
+    assert detailed[0].reviews and detailed[2].reviews
@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+import json
+
+import httpx
+import numpy as np
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.main import app
+from app.schemas import Place, UserPreferences, PreferenceWeight
+from app.graph.food_finder_agent import food_finder_agent
+from app.graph.tools import PlaceFeatures, encode_preferences, score_places, rank_places, top_k_indices, first_page_ranking, next_ranked_page
+from app.graph.tools import show_more_places
+from app.graph.tools.place_store import PlaceStore
+
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+places_objects = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        for p in json.load(file)['places']:
+            places_objects.append(Place.model_validate(p))
+
+USER_PREFERENCES = UserPreferences(
+    wants_coffee=PreferenceWeight(value=True, weight=0.8),
+    desired_minimum_num_ratings=PreferenceWeight(value=500, weight=0.4),
+)
+SCORES = score_places(PlaceFeatures(places_objects), encode_preferences(USER_PREFERENCES))
+
+@pytest.mark.parametrize("k", [0, 1, 3, 5, 12, len(places_objects), len(places_objects) + 3])
+def test_top_k_matches_full_sort(k):
+    assert top_k_indices(SCORES, k).tolist() == np.argsort(-SCORES, kind='stable')[:k].tolist()
+
+def test_top_k_keeps_ties_in_order():
+    scores = np.array([1.0, 2.0, 2.0, 0.5, 2.0, 2.0])
+    assert top_k_indices(scores, 3).tolist() == [1, 2, 4]
+
+def test_rank_places_top_k():
+    assert rank_places(places_objects, USER_PREFERENCES, top_k=5) == rank_places(places_objects, USER_PREFERENCES)[:5]
+
+def test_pages_follow_the_full_ranking():
+    names = [p.name for p in places_objects]
+    ranking = first_page_ranking(names, SCORES, 5)
+    # Only the first page is ranked up front
+    assert len(ranking.ranked) == 5
+
+    pages = []
+    while ranking.remaining:
+        page, ranking = next_ranked_page(ranking, 5)
+        pages.extend(page)
+    assert pages == [p.name for p in rank_places(places_objects, USER_PREFERENCES)]
+    assert next_ranked_page(ranking, 5)[0] == []
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = PlaceStore(str(tmp_path / "places.db"))
+    store.upsert_places(places_objects)
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    # The places already have every field
+    monkeypatch.setattr(places_search, "PLACES_TWO_PHASE_FETCH", False)
+    yield store
+    store.close()
+
+def test_show_more_places_tool(store):
+    ranking = first_page_ranking([p.name for p in places_objects], SCORES, 5)
+    _, ranking = next_ranked_page(ranking, 5)
+    tool_call = {"name": "show_more_places", "args": {"state": {"place_ranking": ranking}}, "id": "1", "type": "tool_call"}
+    message = asyncio.run(show_more_places.ainvoke(tool_call))
+    page, ranking, _ = message.artifact
+    assert page == [p.name for p in rank_places(places_objects, USER_PREFERENCES)[5:10]]
+    assert ranking.shown == 10
+    assert f"{len(places_objects) - 10} left" in message.content
+
+def test_places_next_endpoint(store, monkeypatch):
+    monkeypatch.setattr(food_finder_agent, "checkpointer", MemorySaver())
+    monkeypatch.setattr(app.state, "agent", food_finder_agent, raising=False)
+    config = {"configurable": {"thread_id": "paging"}}
+    ranking = first_page_ranking([p.name for p in places_objects], SCORES, 5)
+    _, ranking = next_ranked_page(ranking, 5)
+    expected = [p.name for p in rank_places(places_objects, USER_PREFERENCES)]
+
+    async def run():
+        # As if the supervisor just showed the first page
+        await food_finder_agent.aupdate_state(config, {"messages": [AIMessage(content="Here are the places I found for you:")], "place_ranking": ranking}, as_node="team_supervisor_node")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            second = await client.get("/places/next", params={"thread_id": "paging"})
+            third = await client.get("/places/next", params={"thread_id": "paging"})
+            missing = await client.get("/places/next", params={"thread_id": "unknown"})
+        return second, third, missing
+
+    second, third, missing = asyncio.run(run())
+    assert [p["name"] for p in second.json()["places"]] == expected[5:10]
+    assert [p["name"] for p in third.json()["places"]] == expected[10:15]
+    assert third.json()["remaining"] == len(places_objects) - 15
+    assert missing.status_code == 404
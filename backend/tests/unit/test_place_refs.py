@@ -0,0 +1,72 @@
+import asyncio
+import importlib
+import json
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph.message import add_messages
+
+from app.schemas import Place, PlaceRef, SearchContext, UserPreferences
+from app.graph.chat_models import FakeFoodFinderChatModel
+from app.graph.food_finder_agent import DEFAULT_AGENT_STATE
+from app.graph.tools import google_maps_text_search_and_filter, show_more_places
+from app.graph.tools.invalid_reasons import InvalidReason
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.scoring import first_page_ranking
+
+agent_module = importlib.import_module("app.graph.food_finder_agent")
+
+# read in both test_text_search_json files
+places_objects = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        for p in json.load(file)['places']:
+            places_objects.append(Place.model_validate(p))
+
+def refs(places, **kwargs):
+    return {p.name: PlaceRef.from_place(p, **kwargs) for p in places}
+
+def test_from_place():
+    place = places_objects[0]
+    ref = PlaceRef.from_place(place, [InvalidReason("too_few_ratings", 5000)])
+    assert ref.name == place.name
+    assert ref.display_name_text == place.display_name_text
+    assert ref.invalid_reasons == (("too_few_ratings", 5000),)
+
+def test_search_replaces_the_last_searchs_places(tmp_path, monkeypatch):
+    store = PlaceStore(str(tmp_path / "places.db"))
+    store.upsert_places(places_objects)
+    fake = FakeFoodFinderChatModel()
+    monkeypatch.setattr(agent_module, "get_place_store", lambda: store)
+    monkeypatch.setattr(agent_module, "team_supervisor", fake.bind_tools([google_maps_text_search_and_filter, show_more_places]))
+
+    # Places 0-4 are from an earlier search, places 5-9 from this one (5 is filtered out)
+    valid_refs = list(refs(places_objects[6:10]).values())
+    invalid_refs = list(refs(places_objects[5:6], invalid_reasons=[InvalidReason("not_vegan")]).values())
+    ranking = first_page_ranking([ref.name for ref in valid_refs], np.arange(4, dtype=float), 2)
+    search_context = SearchContext(parameters={}, user_preferences=UserPreferences(), place_names=[p.name for p in places_objects[5:10]])
+    call = {"name": "google_maps_text_search_and_filter", "args": {"api_query": "vegan"}, "id": "call_1", "type": "tool_call"}
+    messages = [
+        HumanMessage(content="Vegan food", id="1"),
+        AIMessage(content="", tool_calls=[call], id="2"),
+        ToolMessage(content="Obtained 4 places", name=call["name"], tool_call_id="call_1", id="3", artifact=(valid_refs, invalid_refs, ranking, search_context)),
+    ]
+    state = {**DEFAULT_AGENT_STATE, "messages": messages, "valid_places": refs(places_objects[:5]), "invalid_places": refs(places_objects[:1])}
+
+    update = asyncio.run(agent_module.team_supervisor_node(state))
+    store.close()
+
+    assert list(update["valid_places"]) == [ref.name for ref in valid_refs]
+    assert list(update["invalid_places"]) == [ref.name for ref in invalid_refs]
+    assert update["last_search"] == search_context
+    # The tool message is kept without its artifact (the state has the one copy)
+    history = add_messages(messages, update["messages"])
+    assert [m.id for m in history[:3]] == ["1", "2", "3"] and len(history) == 4
+    assert history[2].artifact is None and history[2].content == "Obtained 4 places"
+
+def test_refs_are_much_smaller_than_places():
+    serde = JsonPlusSerializer()
+    _, full = serde.dumps_typed({p.name: p for p in places_objects})
+    _, slim = serde.dumps_typed(refs(places_objects))
+    assert len(slim) * 20 < len(full)
@@ -0,0 +1,152 @@
+import asyncio
+import importlib
+import json
+import time
+
+import pytest
+
+from app.schemas import Place
+from app.graph.tools.place_store import PlaceStore, start_place_store_maintenance, close_place_store
+from app.graph.tools.geo import haversine_meters
+from app.graph.tools.places_cache import PlacesSearchCache
+
+places_search = importlib.import_module("app.graph.tools.places_search")
+place_store_module = importlib.import_module("app.graph.tools.place_store")
+
+# read in test_text_search_json.txt
+TEST_JSON = None
+TEST_FILE_PATH = "../test_data/test_2.txt"
+with open(TEST_FILE_PATH, "r") as file:
+    TEST_JSON = json.load(file)
+places_objects = []
+for p in TEST_JSON['places']:
+    places_objects.append(Place.model_validate(p))
+
+FIELD_MASK = "places.name"
+# Same search as test_2.txt (see test_mappings.txt)
+SEARCH_CENTER = (30.320156, -97.720618)
+SEARCH_BODY = {'textQuery': 'Asian cuisine near me', 'locationBias': {'circle': {'center': {'latitude': SEARCH_CENTER[0], 'longitude': SEARCH_CENTER[1]}, 'radius': 8046.72}}}
+
+def circle(lat, lon, radius):
+    return {'circle': {'center': {'latitude': lat, 'longitude': lon}, 'radius': radius}}
+
+@pytest.fixture
+def store(tmp_path):
+    store = PlaceStore(str(tmp_path / "places.db"))
+    yield store
+    store.close()
+
+def test_upsert_is_keyed_by_name(store):
+    store.upsert_places(places_objects)
+    store.upsert_places(places_objects)
+    assert len(store) == len(places_objects)
+    assert store.get_places([places_objects[3].name]) == [places_objects[3]]
+
+def test_lean_upsert_keeps_stored_details(store):
+    detailed = places_objects[3]
+    lean = Place.model_validate({
+        **{k: v for k, v in TEST_JSON['places'][3].items() if k not in places_search.GOOGLE_DETAILS_FIELDS},
+        'rating': 1.5,
+    })
+    assert lean != detailed
+    store.upsert_places([detailed])
+    store.upsert_places([lean])
+    # The search's fields are updated, the details are kept
+    assert store.get_places([detailed.name]) == [detailed.model_copy(update={'rating': 1.5})]
+
+def test_fields_the_mask_asked_for_are_replaced(store):
+    detailed = places_objects[3].model_copy(update={'serves_beer': True})
+    store.upsert_places([detailed])
+    # Google leaves servesBeer out of the response once it's false
+    lean = Place.model_validate({
+        k: v for k, v in TEST_JSON['places'][3].items() if k not in places_search.GOOGLE_DETAILS_FIELDS and k != 'servesBeer'
+    })
+    store.upsert_places([lean], field_mask=places_search.GOOGLE_LEAN_FIELD_MASK)
+    [stored] = store.get_places([detailed.name])
+    assert not stored.serves_beer
+    assert stored.reviews == detailed.reviews
+
+def test_reads_do_not_wait_on_writes(store):
+    store.upsert_places(places_objects)
+
+    async def read_while_writing():
+        # A write transaction (e.g. a background upsert or prune) holds the writer lock
+        with store._lock:
+            return await asyncio.wait_for(store.aget_places([places_objects[0].name]), timeout=5)
+
+    assert asyncio.run(read_while_writing()) == [places_objects[0]]
+
+def test_radius_query_matches_brute_force(store):
+    store.upsert_places(places_objects)
+    radius = 5000.0
+    expected = {
+        p.name for p in places_objects
+        if haversine_meters(SEARCH_CENTER[0], SEARCH_CENTER[1], p.location.latitude, p.location.longitude) <= radius
+    }
+    found = {p.name for p in store.query_places(circle(*SEARCH_CENTER, radius))}
+    assert found == expected
+    assert 0 < len(found) < len(places_objects)
+
+def test_rectangle_and_type_query(store):
+    store.upsert_places(places_objects)
+    lats = [p.location.latitude for p in places_objects]
+    lons = [p.location.longitude for p in places_objects]
+    everything = {'rectangle': {'low': {'latitude': min(lats), 'longitude': min(lons)}, 'high': {'latitude': max(lats), 'longitude': max(lons)}}}
+    assert len(store.query_places(everything)) == len(places_objects)
+
+    thai = store.query_places(everything, types=["thai_restaurant"])
+    assert thai and all("thai_restaurant" in p.types for p in thai)
+
+def test_recent_search_covers_smaller_area_inside_it(store):
+    store.record_search(SEARCH_BODY, FIELD_MASK, places_objects)
+    smaller = {**SEARCH_BODY, 'locationBias': circle(*SEARCH_CENTER, 4000.0)}
+    covered = store.find_covered_places(smaller, FIELD_MASK, min_places=1)
+    assert covered is not None
+    assert all(haversine_meters(SEARCH_CENTER[0], SEARCH_CENTER[1], p.location.latitude, p.location.longitude) <= 4000.0 for p in covered)
+
+def test_search_does_not_cover_other_queries_or_areas(store):
+    store.record_search(SEARCH_BODY, FIELD_MASK, places_objects)
+    other_query = {**SEARCH_BODY, 'textQuery': 'pizza'}
+    assert store.find_covered_places(other_query, FIELD_MASK, min_places=1) is None
+    bigger = {**SEARCH_BODY, 'locationBias': circle(*SEARCH_CENTER, 20000.0)}
+    assert store.find_covered_places(bigger, FIELD_MASK, min_places=1) is None
+
+def test_old_searches_do_not_count_as_coverage(store):
+    store.record_search(SEARCH_BODY, FIELD_MASK, places_objects, fetched_at=time.time() - 3600)
+    assert store.find_covered_places(SEARCH_BODY, FIELD_MASK, max_age_seconds=60, min_places=1) is None
+    assert store.find_covered_places(SEARCH_BODY, FIELD_MASK, max_age_seconds=7200, min_places=1) is not None
+
+def test_coverage_is_no_older_than_a_fresh_cache_entry(store, monkeypatch):
+    class CountingClient:
+        calls = 0
+
+        async def search_text(self, body, field_mask):
+            self.calls += 1
+            return {'places': TEST_JSON['places']}
+
+    client = CountingClient()
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_client", lambda: client)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache(fresh_ttl_seconds=600))
+
+    # Covered by a search from an hour ago, which is older than the cache keeps entries fresh
+    store.record_search(SEARCH_BODY, FIELD_MASK, places_objects, fetched_at=time.time() - 3600)
+    asyncio.run(places_search.search_first_page(SEARCH_BODY, FIELD_MASK))
+    assert client.calls == 1
+    # The search it just made is recent enough
+    places, _ = asyncio.run(places_search.search_first_page(SEARCH_BODY, FIELD_MASK))
+    assert client.calls == 1 and places
+
+def test_maintenance_prunes_old_places_and_searches(store, monkeypatch):
+    monkeypatch.setattr(place_store_module, "get_place_store", lambda: store)
+    store.record_search(SEARCH_BODY, FIELD_MASK, places_objects[:5], fetched_at=time.time() - 3600)
+    store.upsert_places(places_objects[5:])
+
+    async def run():
+        start_place_store_maintenance(interval_seconds=0.01, max_age_seconds=60)
+        await asyncio.sleep(0.2)
+        close_place_store()
+
+    asyncio.run(run())
+    assert len(store) == len(places_objects) - 5
+    assert store.find_covered_places(SEARCH_BODY, FIELD_MASK, max_age_seconds=7200, min_places=1) is None
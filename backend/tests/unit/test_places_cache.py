@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from app.graph.tools.places_cache import PlacesSearchCache, MemoryCacheTier, SqliteCacheTier, normalize_search_request
+
+FIELD_MASK = "places.name"
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+    def __call__(self):
+        return self.now
+
+class FakeFetcher:
+    """Stands in for PlacesClient.search_text, counting upstream requests"""
+    def __init__(self):
+        self.calls = []
+    async def __call__(self, body, field_mask):
+        self.calls.append(body)
+        await asyncio.sleep(0)
+        return {"places": [{"name": f"places/{len(self.calls)}"}]}
+
+def search_body(lat=30.2670, lon=-97.7440, radius=4828.0, query="Asian cuisine"):
+    return {
+        'textQuery': query,
+        'locationBias': {'circle': {'center': {'latitude': lat, 'longitude': lon}, 'radius': radius}},
+    }
+
+def test_nearby_equivalent_searches_normalize_to_same_body():
+    # ~15 meters apart, different casing/whitespace and slightly different radius
+    a = normalize_search_request(search_body(30.26700, -97.74400, 4828.0, "Asian cuisine"))
+    b = normalize_search_request(search_body(30.26710, -97.74390, 4900.0, "  asian   Cuisine "))
+    assert a == b
+    assert a['locationBias']['circle']['radius'] == 5000.0
+
+def test_far_apart_searches_do_not_share_entries():
+    a = normalize_search_request(search_body(30.2672, -97.7431))
+    b = normalize_search_request(search_body(30.3202, -97.7206))
+    assert a != b
+
+def test_fresh_hit_skips_upstream():
+    clock = FakeClock()
+    fetch = FakeFetcher()
+    cache = PlacesSearchCache(clock=clock)
+
+    async def run():
+        first = await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+        clock.now += 60
+        second = await cache.get_or_fetch(search_body(30.26710, -97.74390), FIELD_MASK, fetch)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert len(fetch.calls) == 1
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+def test_stale_entry_is_served_and_refreshed_in_background():
+    clock = FakeClock()
+    fetch = FakeFetcher()
+    cache = PlacesSearchCache(clock=clock, fresh_ttl_seconds=60, stale_ttl_seconds=600)
+
+    async def run():
+        first = await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+        clock.now += 120
+        stale = await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+        await cache.wait_for_refreshes()
+        refreshed = await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+        return first, stale, refreshed
+
+    first, stale, refreshed = asyncio.run(run())
+    assert stale == first
+    assert refreshed == {"places": [{"name": "places/2"}]}
+    assert len(fetch.calls) == 2
+    assert cache.stats['stale_hits'] == 1 and cache.stats['refreshes'] == 1
+
+def test_expired_entry_is_a_miss():
+    clock = FakeClock()
+    fetch = FakeFetcher()
+    cache = PlacesSearchCache(clock=clock, fresh_ttl_seconds=60, stale_ttl_seconds=60)
+
+    async def run():
+        await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+        clock.now += 500
+        return await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+
+    assert asyncio.run(run()) == {"places": [{"name": "places/2"}]}
+    assert cache.stats['misses'] == 2
+
+def test_concurrent_misses_share_one_request():
+    fetch = FakeFetcher()
+    cache = PlacesSearchCache()
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_fetch(search_body(), FIELD_MASK, fetch) for _ in range(10)])
+
+    results = asyncio.run(run())
+    assert len(fetch.calls) == 1
+    assert all(r == results[0] for r in results)
+
+def test_memory_tier_evicts_least_recently_used():
+    tier = MemoryCacheTier(max_entries=2)
+    tier.set("a", 0.0, {"places": []})
+    tier.set("b", 0.0, {"places": []})
+    tier.get("a")
+    tier.set("c", 0.0, {"places": []})
+    assert tier.get("b") is None
+    assert tier.get("a") is not None and tier.get("c") is not None
+
+def test_sqlite_tier_evicts_least_recently_used_in_batches(tmp_path):
+    tier = SqliteCacheTier(str(tmp_path / "places_cache.db"), max_entries=10, evict_slack=0.5, touch_interval_seconds=0)
+    for i in range(15):
+        tier.set(str(i), 0.0, {"places": []})
+    # Not trimmed until it's over by the slack
+    assert len(tier) == 15
+    tier.get("0")
+    tier.set("15", 0.0, {"places": []})
+    assert len(tier) == 10
+    assert tier.get("0") is not None and tier.get("15") is not None
+    assert tier.get("1") is None and tier.get("6") is None and tier.get("7") is not None
+    # Counted again on open
+    tier.close()
+    assert len(SqliteCacheTier(str(tmp_path / "places_cache.db"), max_entries=10)) == 10
+
+def test_sqlite_tier_survives_a_new_memory_tier(tmp_path):
+    path = str(tmp_path / "places_cache.db")
+    fetch = FakeFetcher()
+
+    async def run():
+        cache = PlacesSearchCache(sqlite_tier=SqliteCacheTier(path))
+        first = await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+        cache.close()
+
+        # e.g. after a restart, or on another worker
+        cache = PlacesSearchCache(sqlite_tier=SqliteCacheTier(path))
+        second = await cache.get_or_fetch(search_body(), FIELD_MASK, fetch)
+        cache.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second
+    assert len(fetch.calls) == 1
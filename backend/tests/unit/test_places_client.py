@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.graph.tools.places_client import PlacesClient, PlacesAPIError, close_places_client, get_places_client
+
+# read in test_text_search_json.txt
+TEST_JSON = None
+TEST_FILE_PATH = "../test_data/test_2.txt"
+with open(TEST_FILE_PATH, "r") as file:
+    TEST_JSON = json.load(file)
+
+FIELD_MASK = "places.name,places.displayName"
+
+def make_client(handler, **kwargs) -> PlacesClient:
+    # No real sleeping between retries in tests
+    kwargs.setdefault("backoff_base_seconds", 0.0)
+    return PlacesClient(api_key="test-key", transport=httpx.MockTransport(handler), **kwargs)
+
+def test_search_text_sends_headers_and_body():
+    seen = {}
+    def handler(request: httpx.Request):
+        seen["url"] = str(request.url)
+        seen["headers"] = request.headers
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json=TEST_JSON)
+
+    async def run():
+        client = make_client(handler)
+        try:
+            return await client.search_text({"textQuery": "Asian cuisine near me"}, FIELD_MASK)
+        finally:
+            await client.aclose()
+
+    response = asyncio.run(run())
+    assert len(response["places"]) == len(TEST_JSON["places"])
+    assert seen["url"].endswith("/places:searchText")
+    assert seen["headers"]["X-Goog-Api-Key"] == "test-key"
+    assert seen["headers"]["X-Goog-FieldMask"] == FIELD_MASK
+    assert seen["body"] == {"textQuery": "Asian cuisine near me"}
+
+def test_get_place_details_sends_get_with_mask():
+    place = TEST_JSON["places"][0]
+    seen = {}
+    def handler(request: httpx.Request):
+        seen["method"] = request.method
+        seen["url"] = str(request.url)
+        seen["headers"] = request.headers
+        seen["content"] = request.content
+        return httpx.Response(200, json={"websiteUri": place["websiteUri"]})
+
+    async def run():
+        client = make_client(handler)
+        try:
+            return await client.get_place_details(place["name"], "websiteUri")
+        finally:
+            await client.aclose()
+
+    response = asyncio.run(run())
+    assert response == {"websiteUri": place["websiteUri"]}
+    assert seen["method"] == "GET"
+    assert seen["url"].endswith("/" + place["name"])
+    assert seen["headers"]["X-Goog-FieldMask"] == "websiteUri"
+    assert seen["content"] == b""
+
+@pytest.mark.parametrize("status_code", [429, 500, 503])
+def test_retries_on_retryable_status(status_code):
+    calls = []
+    def handler(request: httpx.Request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(status_code, text="try again")
+        return httpx.Response(200, json={"places": []})
+
+    async def run():
+        client = make_client(handler, max_retries=3)
+        try:
+            return await client.search_text({"textQuery": "pizza"}, FIELD_MASK)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == {"places": []}
+    assert len(calls) == 3
+
+def test_gives_up_after_max_retries():
+    calls = []
+    def handler(request: httpx.Request):
+        calls.append(request)
+        return httpx.Response(503, text="unavailable")
+
+    async def run():
+        client = make_client(handler, max_retries=2)
+        try:
+            await client.search_text({"textQuery": "pizza"}, FIELD_MASK)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(PlacesAPIError) as exc_info:
+        asyncio.run(run())
+    assert exc_info.value.status_code == 503
+    assert len(calls) == 3
+
+def test_does_not_retry_client_errors():
+    calls = []
+    def handler(request: httpx.Request):
+        calls.append(request)
+        return httpx.Response(400, text="bad request")
+
+    async def run():
+        client = make_client(handler)
+        try:
+            await client.search_text({"textQuery": "pizza"}, FIELD_MASK)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(PlacesAPIError) as exc_info:
+        asyncio.run(run())
+    assert exc_info.value.status_code == 400
+    assert len(calls) == 1
+
+def test_deadline_is_enforced():
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(1.0)
+        return httpx.Response(200, json={"places": []})
+
+    async def run():
+        client = make_client(handler, deadline_seconds=0.05)
+        try:
+            await client.search_text({"textQuery": "pizza"}, FIELD_MASK)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(PlacesAPIError):
+        asyncio.run(run())
+
+def test_shared_client_per_event_loop_closed_on_shutdown():
+    async def shared_client():
+        client = get_places_client()
+        assert get_places_client() is client
+        return client
+
+    first = asyncio.run(shared_client())
+
+    async def run():
+        client = await shared_client()
+        await close_places_client()
+        return client
+
+    second = asyncio.run(run())
+    assert second is not first
+    assert second.is_closed
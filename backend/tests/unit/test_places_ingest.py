@@ -0,0 +1,47 @@
+import copy
+import json
+
+import pytest
+
+from app.schemas.schema import Place
+from app.graph.tools.places_ingest import parse_places, parse_places_json
+
+TEST_FILE_PATHS = ["../test_data/test_1.txt", "../test_data/test_2.txt"]
+
+def read_test_file(test_file_path):
+    with open(test_file_path, "rb") as file:
+        return file.read()
+
+@pytest.mark.parametrize("test_file_path", TEST_FILE_PATHS)
+def test_adapter_matches_model_validate(test_file_path):
+    json_response = json.loads(read_test_file(test_file_path))
+    expected = [Place.model_validate(p) for p in copy.deepcopy(json_response)['places']]
+    assert parse_places(json_response) == expected
+    assert parse_places_json(read_test_file(test_file_path)) == expected
+
+@pytest.mark.parametrize("test_file_path", TEST_FILE_PATHS)
+def test_response_is_not_modified(test_file_path):
+    json_response = json.loads(read_test_file(test_file_path))
+    original = copy.deepcopy(json_response)
+    parse_places(json_response)
+    parse_places(json_response, lazy_reviews=True)
+    assert json_response == original
+
+def test_nested_display_names():
+    place = parse_places(json.loads(read_test_file(TEST_FILE_PATHS[1])))[0]
+    assert place.display_name_text == "HAHA KITCHEN"
+    assert place.primary_type_display_name_text == "Restaurant"
+    # The flattened keys are still what by_alias dumps use, and they read back the same
+    assert Place.model_validate(place.model_dump(by_alias=True)) == place
+
+@pytest.mark.parametrize("test_file_path", TEST_FILE_PATHS)
+def test_lazy_reviews(test_file_path):
+    eager = parse_places_json(read_test_file(test_file_path))
+    lazy = parse_places_json(read_test_file(test_file_path), lazy_reviews=True)
+    assert all(p.reviews == [] for p in lazy)
+    assert [p.load_reviews() for p in lazy] == [p.reviews for p in eager]
+    assert [p.model_dump() for p in lazy] == [p.model_dump() for p in eager]
+
+def test_empty_response():
+    assert parse_places({}) == []
+    assert parse_places_json(b"{}") == []
@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+import json
+from datetime import datetime
+
+import numpy as np
+
+from app.schemas import Place, UserPreferences, PreferenceWeight
+from app.graph.food_finder_agent import DEFAULT_AGENT_STATE
+from app.graph.tools import google_maps_text_search_and_filter, show_more_places, split_valid_places, rank_places
+from app.graph.tools import PlaceFeatures, encode_preferences, score_places, first_page_ranking, next_ranked_page, extend_ranking
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_prefetch import PagePrefetcher
+
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+pages = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        pages.append(json.load(file)['places'])
+places_objects = [Place.model_validate(p) for page in pages for p in page]
+
+USER_PREFERENCES = UserPreferences(
+    wants_coffee=PreferenceWeight(value=True, weight=0.8),
+    desired_minimum_num_ratings=PreferenceWeight(value=500, weight=0.4),
+    desired_time_and_stay_duration=(datetime(2024, 9, 25, 12, 0), 60),
+)
+
+class PagedSearch:
+    """Stands in for PlacesClient.search_text, serving the test pages one token at a time. The later
+    pages are held back until `release` is set"""
+    def __init__(self):
+        self.bodies = []
+        self.release = asyncio.Event()
+
+    async def search_text(self, body, field_mask):
+        self.bodies.append(body)
+        index = int(body.get('pageToken', 0))
+        if index:
+            await self.release.wait()
+        response = {'places': pages[index]}
+        if index + 1 < len(pages):
+            response['nextPageToken'] = str(index + 1)
+        return response
+
+def test_prefetcher_follows_page_tokens():
+    fetched = []
+
+    async def record(places):
+        fetched.extend(places)
+
+    async def run():
+        search = PagedSearch()
+        search.release.set()
+        prefetcher = PagePrefetcher()
+        key = prefetcher.start({'textQuery': 'coffee'}, "places.name", "1", 60, search.search_text, record)
+        assert prefetcher.is_pending(key)
+        places = await prefetcher.wait(key)
+        return search, prefetcher, key, places
+
+    search, prefetcher, key, places = asyncio.run(run())
+    assert [p.name for p in places] == [p.name for p in places_objects[len(pages[0]):]]
+    assert fetched == places
+    assert search.bodies == [{'textQuery': 'coffee', 'pageToken': '1'}]
+    # The pages can only be taken once
+    assert not prefetcher.is_pending(key) and prefetcher.take(key) is None
+
+def test_prefetcher_stops_at_max_places():
+    async def run():
+        search = PagedSearch()
+        search.release.set()
+        prefetcher = PagePrefetcher()
+        return await prefetcher.wait(prefetcher.start({}, "places.name", "1", 3, search.search_text))
+
+    assert len(asyncio.run(run())) == 3
+
+def test_extended_ranking_keeps_shown_places():
+    first, more = places_objects[:20], places_objects[20:]
+    terms = encode_preferences(USER_PREFERENCES)
+    ranking = first_page_ranking([p.name for p in first], score_places(PlaceFeatures(first), terms), 5)
+    shown, ranking = next_ranked_page(ranking, 5)
+
+    ranking = extend_ranking(ranking, [p.name for p in more], score_places(PlaceFeatures(more), terms))
+    rest = []
+    while ranking.remaining:
+        page, ranking = next_ranked_page(ranking, 5)
+        rest.extend(page)
+    assert shown == [p.name for p in rank_places(first, USER_PREFERENCES)[:5]]
+    assert rest == [p.name for p in rank_places(places_objects, USER_PREFERENCES) if p.name not in shown]
+
+def test_first_page_is_returned_before_later_pages(tmp_path, monkeypatch):
+    store = PlaceStore(str(tmp_path / "places.db"))
+    search = PagedSearch()
+    prefetcher = PagePrefetcher()
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache())
+    monkeypatch.setattr(places_search, "get_places_client", lambda: search)
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: prefetcher)
+    monkeypatch.setattr(places_search, "PLACES_TWO_PHASE_FETCH", False)
+    state = {**DEFAULT_AGENT_STATE, "user_preferences": USER_PREFERENCES}
+
+    async def run():
+        tool_call = {"name": "google_maps_text_search_and_filter", "args": {"api_query": "coffee", "state": state}, "id": "1", "type": "tool_call"}
+        searched = await google_maps_text_search_and_filter.ainvoke(tool_call)
+        # The later page is still being fetched
+        assert prefetcher.is_pending(searched.artifact[3].prefetch_key)
+        search.release.set()
+        # Let the background fetch finish (it records the pages in the place store from a worker thread)
+        await asyncio.gather(*(task for task in asyncio.all_tasks() if task is not asyncio.current_task()))
+
+        _, _, ranking, last_search = searched.artifact
+        ranking = next_ranked_page(ranking, 5)[1]
+        tool_call = {"name": "show_more_places", "args": {"state": {**state, "place_ranking": ranking, "last_search": last_search}}, "id": "2", "type": "tool_call"}
+        return searched, await show_more_places.ainvoke(tool_call)
+
+    searched, more = asyncio.run(run())
+    store.close()
+
+    valid_refs, invalid_refs, _, last_search = searched.artifact
+    assert len(valid_refs) + len(invalid_refs) == len(pages[0])
+    assert last_search.place_names == [p.name for p in places_objects[:len(pages[0])]]
+    assert search.bodies[0]['pageSize'] == 20
+
+    page, ranking, (more_valid_refs, more_invalid_refs, last_search) = more.artifact
+    assert last_search.place_names == [p.name for p in places_objects]
+    assert last_search.prefetch_key is None
+    expected_valid = split_valid_places(places_objects[len(pages[0]):], USER_PREFERENCES)[0]
+    assert [ref.name for ref in more_valid_refs] == [p.name for p in expected_valid]
+    assert len(ranking.names) == len(valid_refs) + len(more_valid_refs)
+    assert len(page) == 5
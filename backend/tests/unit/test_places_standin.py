@@ -0,0 +1,134 @@
+import asyncio
+import importlib
+import random
+
+import httpx
+import pytest
+
+from app.schemas import UserPreferences
+from app.graph.food_finder_agent import DEFAULT_AGENT_STATE
+from app.graph.tools import google_maps_text_search_and_filter
+from app.graph.tools.geo import haversine_meters, point_in_shape, direction_rectangle
+from app.graph.tools.places_client import PlacesClient, PlacesAPIError
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_prefetch import PagePrefetcher
+
+from places_standin import FaultConfig, LatencyDistribution, PlacesCorpus, create_app
+
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+CORPUS = PlacesCorpus.load(num_synthetic=500)
+DOWNTOWN_AUSTIN = (30.2672, -97.7431)
+AUSTIN_BIAS = {"circle": {"center": {"latitude": DOWNTOWN_AUSTIN[0], "longitude": DOWNTOWN_AUSTIN[1]}, "radius": 5000.0}}
+
+def make_client(faults=None, **kwargs) -> PlacesClient:
+    kwargs.setdefault("backoff_base_seconds", 0.0)
+    transport = httpx.ASGITransport(app=create_app(CORPUS, faults))
+    return PlacesClient(api_key="standin", base_url="http://standin/v1", transport=transport, **kwargs)
+
+def run_with_client(faults, calls):
+    async def run():
+        client = make_client(faults)
+        try:
+            return await calls(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+def test_field_mask_and_paging():
+    mask = "places.name,places.location,nextPageToken"
+    body = {"textQuery": "asian food", "pageSize": 20, "locationBias": AUSTIN_BIAS}
+
+    async def calls(client):
+        pages = [await client.search_text(body, mask)]
+        while "nextPageToken" in pages[-1]:
+            pages.append(await client.search_text({**body, "pageToken": pages[-1]["nextPageToken"]}, mask))
+        return pages
+
+    pages = run_with_client(None, calls)
+    places = [p for page in pages for p in page["places"]]
+    assert len(pages) == 3 and len(places) == 60
+    assert len({p["name"] for p in places}) == 60
+    assert all(set(p) == {"name", "location"} for p in places)
+    # Places inside the bias come first, nearest first
+    distances = [haversine_meters(*DOWNTOWN_AUSTIN, p["location"]["latitude"], p["location"]["longitude"]) for p in places]
+    inside = [d for d in distances if d <= 5000]
+    assert inside and distances[:len(inside)] == sorted(inside)
+
+def test_no_page_token_unless_asked_for():
+    response = run_with_client(None, lambda client: client.search_text({"textQuery": "coffee"}, "places.name"))
+    assert "nextPageToken" not in response
+
+def test_page_token_only_goes_with_its_search():
+    async def calls(client):
+        first = await client.search_text({"textQuery": "coffee"}, "places.name,nextPageToken")
+        return await client.search_text({"textQuery": "pizza", "pageToken": first["nextPageToken"]}, "places.name")
+
+    with pytest.raises(PlacesAPIError) as error:
+        run_with_client(None, calls)
+    assert error.value.status_code == 400
+
+def test_location_restriction():
+    restriction = direction_rectangle(*DOWNTOWN_AUSTIN, "N", 8000)
+    response = run_with_client(None, lambda client: client.search_text({"textQuery": "food", "locationRestriction": restriction}, "places.location"))
+    assert response["places"]
+    assert all(point_in_shape(p["location"]["latitude"], p["location"]["longitude"], restriction) for p in response["places"])
+
+def test_place_details():
+    place = CORPUS.places[0]
+    details = run_with_client(None, lambda client: client.get_place_details(place["name"], "websiteUri,reviews"))
+    assert details == {k: place[k] for k in ("websiteUri", "reviews") if k in place}
+
+    with pytest.raises(PlacesAPIError) as error:
+        run_with_client(None, lambda client: client.get_place_details("places/missing", "websiteUri"))
+    assert error.value.status_code == 404
+
+def test_injected_errors_are_retried():
+    # Every request fails, so the client gives up after its retries
+    with pytest.raises(PlacesAPIError) as error:
+        run_with_client(FaultConfig(rate_limit_rate=1.0), lambda client: client.search_text({"textQuery": "coffee"}, "places.name"))
+    assert error.value.status_code == 429
+
+    # Some fail, and the retries get through
+    async def calls(client):
+        return [await client.search_text({"textQuery": "coffee"}, "places.name") for _ in range(10)]
+    responses = run_with_client(FaultConfig(server_error_rate=0.3, seed=1), calls)
+    assert all(r["places"] for r in responses)
+
+def test_slow_body_arrives_whole():
+    faults = FaultConfig(slow_body_rate=1.0, slow_body_seconds=0.05)
+    response = run_with_client(faults, lambda client: client.search_text({"textQuery": "coffee"}, "places.*"))
+    assert len(response["places"]) == 20
+
+def test_latency_specs():
+    rng = random.Random(0)
+    assert LatencyDistribution("fixed:0.2").sample(rng) == 0.2
+    assert 0.1 <= LatencyDistribution("uniform:0.1,0.3").sample(rng) <= 0.3
+    assert LatencyDistribution("lognormal:0.1,0.5").sample(rng) > 0
+    with pytest.raises(ValueError):
+        LatencyDistribution("uniform:0.1")
+
+def test_search_tool_against_the_standin(tmp_path, monkeypatch):
+    client = make_client()
+    store = PlaceStore(str(tmp_path / "places.db"))
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache())
+    monkeypatch.setattr(places_search, "get_places_client", lambda: client)
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: PagePrefetcher())
+    state = {**DEFAULT_AGENT_STATE, "user_preferences": UserPreferences(), "user_coordinates": DOWNTOWN_AUSTIN, "desired_max_distance_meters": 8000.0}
+
+    async def run():
+        tool_call = {"name": "google_maps_text_search_and_filter", "args": {"api_query": "asian food", "state": state}, "id": "1", "type": "tool_call"}
+        try:
+            return await google_maps_text_search_and_filter.ainvoke(tool_call)
+        finally:
+            await client.aclose()
+
+    message = asyncio.run(run())
+    store.close()
+    _, _, _, last_search = message.artifact
+    assert last_search.place_names
+    for name in last_search.place_names:
+        location = CORPUS.by_name[name]["location"]
+        assert haversine_meters(*DOWNTOWN_AUSTIN, location["latitude"], location["longitude"]) <= 8000.0
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+
+from app.graph.preference_parser import parse_preferences
+
+# A Tuesday
+NOW = datetime(2024, 9, 24, 17, 30)
+
+def values(parsed):
+    return {name: field.value for name, field in parsed.fields.items()}
+
+def test_explicit_constraints():
+    parsed = parse_preferences("Party of 8, within 3 miles, under $10, at 7pm, vegetarian, outdoor seating", NOW)
+    assert parsed.is_confident()
+    assert values(parsed) == {
+        "party_size": 8,
+        "desired_max_distance_meters": 4827.9,
+        "preferred_price_level": "PRICE_LEVEL_INEXPENSIVE",
+        "dietary_requests": ["vegetarian"],
+        "wants_outdoor_seating": True,
+    }
+    assert parsed.dt.value == datetime(2024, 9, 24, 19, 0)
+
+def test_state_updater_output():
+    output = parse_preferences("I need vegan food for 4 people for an hour and a half, bonus points for live music", NOW).state_updater_output()
+    assert output.length_of_stay == 90
+    assert not output.when_to_eat_specified
+    assert (output.dietary_requests.value, output.dietary_requests.weight) == (["vegan"], 1.0)
+    assert output.party_size.value == 4
+    assert (output.wants_live_music.value, output.wants_live_music.weight) == (True, 0.3)
+    # Not mentioned, so the defaults
+    assert output.desired_cuisines.value == ["any"]
+    assert output.preferred_direction == "any"
+
+@pytest.mark.parametrize("query", ["Pizza for 10 people", "pizza for 10 people, a table for 10 would be nice"])
+def test_party_size_is_a_need(query):
+    assert parse_preferences(query, NOW).state_updater_output().party_size.weight == 1.0
+
+@pytest.mark.parametrize("query, expected", [
+    ("Dinner at 7", datetime(2024, 9, 24, 19, 0)),
+    ("This Friday, im going out to eat at lunch time. What is good?", datetime(2024, 9, 27, 12, 0)),
+    ("Tomorrow at 8:00 AM, breakfast", datetime(2024, 9, 25, 8, 0)),
+    ("tonight", datetime(2024, 9, 24, 18, 0)),
+    ("sushi at noon on Tuesday", datetime(2024, 9, 24, 12, 0)),
+])
+def test_when_to_eat(query, expected):
+    parsed = parse_preferences(query, NOW)
+    assert parsed.is_confident()
+    assert parsed.dt.value == expected
+    assert parsed.state_updater_output().when_to_eat_specified
+
+@pytest.mark.parametrize("query", [
+    # Words the parser doesn't know
+    "Somewhere with a cozy atmosphere and a view",
+    "I want to get some italian food during Halloween this year.",
+    "Tomorrow, I want to get some asian food by my house",
+    # Negated
+    "Vegan food, no live music",
+    # Travel time, not length of stay
+    "Pizza within 20 minutes",
+    # When to eat, not length of stay
+    "Sushi in 2 hours",
+    "Sushi 2 hours from now",
+    # Just a day: the meal is deduced from the food
+    "Sushi on Friday",
+    # Ambiguous without am/pm
+    "Sushi at 8",
+])
+def test_falls_back_when_unsure(query):
+    assert not parse_preferences(query, NOW).is_confident()
@@ -0,0 +1,172 @@
+import asyncio
+import importlib
+import json
+from datetime import datetime
+
+import pytest
+
+from app.schemas import Place, PlaceRef, SearchContext, UserPreferences, PreferenceWeight
+from app.graph.food_finder_agent import DEFAULT_AGENT_STATE
+from app.graph.tools import google_maps_text_search_and_filter, split_valid_places, rank_places
+from app.graph.tools.place_store import PlaceStore
+from app.graph.tools.places_cache import PlacesSearchCache
+from app.graph.tools.places_prefetch import PagePrefetcher
+from app.graph.tools.rerank import can_rerank, changed_preferences, rerank_candidates
+
+places_search = importlib.import_module("app.graph.tools.places_search")
+
+places_objects = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        for p in json.load(file)['places']:
+            places_objects.append(Place.model_validate(p))
+
+USER_PREFERENCES = UserPreferences(
+    wants_coffee=PreferenceWeight(value=True, weight=0.8),
+    desired_minimum_num_ratings=PreferenceWeight(value=500, weight=0.4),
+    desired_time_and_stay_duration=(datetime(2024, 9, 25, 12, 0), 60),
+)
+NEEDS_OUTDOOR_SEATING = USER_PREFERENCES.model_copy(update={"wants_outdoor_seating": PreferenceWeight(value=True, weight=1.0)})
+NEEDS_COFFEE = USER_PREFERENCES.model_copy(update={"wants_coffee": PreferenceWeight(value=True, weight=1.0)})
+
+def candidates_for(user_preferences):
+    valid_places, invalid_places = split_valid_places(places_objects, user_preferences)
+    valid_names = {p.name for p in valid_places}
+    by_name = dict((p.name, reasons) for p, reasons in invalid_places)
+    return [(p, () if p.name in valid_names else by_name[p.name]) for p in places_objects]
+
+def names(result):
+    valid_places, invalid_places = result
+    return [p.name for p in valid_places], [p.name for p, _ in invalid_places]
+
+def with_reasons(result):
+    valid_places, invalid_places = result
+    return [p.name for p in valid_places], [(p.name, reasons) for p, reasons in invalid_places]
+
+def test_changed_preferences():
+    assert changed_preferences(USER_PREFERENCES, USER_PREFERENCES.model_copy(deep=True)) == set()
+    assert changed_preferences(USER_PREFERENCES, NEEDS_OUTDOOR_SEATING) == {"wants_outdoor_seating"}
+
+@pytest.mark.parametrize("old, new", [
+    # Places without outdoor seating move to the invalid set
+    (USER_PREFERENCES, NEEDS_OUTDOOR_SEATING),
+    # and are restored when it's no longer needed
+    (NEEDS_OUTDOOR_SEATING, USER_PREFERENCES),
+    (USER_PREFERENCES, USER_PREFERENCES.model_copy(update={"party_size": PreferenceWeight(value=8, weight=1.0)})),
+])
+def test_rerank_matches_filtering_again(old, new):
+    result = rerank_candidates(candidates_for(old), old, new)
+    assert names(result) == names(split_valid_places(places_objects, new))
+    assert rank_places(result[0], new) == rank_places(split_valid_places(places_objects, new)[0], new)
+
+@pytest.mark.parametrize("old, new", [
+    (USER_PREFERENCES, NEEDS_OUTDOOR_SEATING),
+    (NEEDS_OUTDOOR_SEATING, USER_PREFERENCES),
+    # Places without coffee (checked last) and without outdoor seating (checked earlier) now fail for the latter
+    (NEEDS_COFFEE, NEEDS_COFFEE.model_copy(update={"wants_outdoor_seating": PreferenceWeight(value=True, weight=1.0)})),
+    (USER_PREFERENCES, USER_PREFERENCES.model_copy(update={"party_size": PreferenceWeight(value=8, weight=1.0)})),
+    (USER_PREFERENCES, USER_PREFERENCES.model_copy(update={"desired_time_and_stay_duration": (datetime(2024, 9, 25, 23, 0), 60)})),
+])
+def test_rerank_gives_the_same_reasons_as_filtering_again(old, new):
+    result = rerank_candidates(candidates_for(old), old, new)
+    assert with_reasons(result) == with_reasons(split_valid_places(places_objects, new))
+
+def test_rerank_moves_places_both_ways():
+    before, _ = names(split_valid_places(places_objects, USER_PREFERENCES))
+    after, invalid = names(rerank_candidates(candidates_for(USER_PREFERENCES), USER_PREFERENCES, NEEDS_OUTDOOR_SEATING))
+    assert set(after) < set(before)
+    assert set(before) - set(after) <= set(invalid)
+
+def test_query_cuisine_or_location_change_needs_a_new_search():
+    last_search = SearchContext(parameters={"minRating": 4.0}, queries=["sushi"], user_preferences=USER_PREFERENCES, place_names=["a"])
+    assert can_rerank(last_search, {"minRating": 4.0}, NEEDS_OUTDOOR_SEATING, ["Sushi "])
+    assert not can_rerank(None, {"minRating": 4.0}, USER_PREFERENCES, ["sushi"])
+    assert not can_rerank(last_search, {"minRating": 4.0}, USER_PREFERENCES, ["mexican food"])
+    location = {"circle": {"center": {"latitude": 30.6, "longitude": -96.3}, "radius": 1000.0}}
+    assert not can_rerank(last_search, {"minRating": 4.0, "locationBias": location}, USER_PREFERENCES, ["sushi"])
+    thai = USER_PREFERENCES.model_copy(update={"desired_cuisines": PreferenceWeight(value=["Thai"], weight=0.8)})
+    assert not can_rerank(last_search, {"minRating": 4.0}, thai, ["sushi"])
+
+class NoSearchClient:
+    async def search_text(self, *args, **kwargs):
+        raise AssertionError("searched Google Maps again")
+
+def test_tool_reranks_without_searching(tmp_path, monkeypatch):
+    store = PlaceStore(str(tmp_path / "places.db"))
+    store.upsert_places(places_objects)
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_client", lambda: NoSearchClient())
+    monkeypatch.setattr(places_search, "PLACES_TWO_PHASE_FETCH", False)
+
+    valid_places, invalid_places = split_valid_places(places_objects, USER_PREFERENCES)
+    state = {
+        **DEFAULT_AGENT_STATE,
+        "user_preferences": NEEDS_OUTDOOR_SEATING,
+        "valid_places": {p.name: PlaceRef.from_place(p) for p in valid_places},
+        "invalid_places": {p.name: PlaceRef.from_place(p, reasons) for p, reasons in invalid_places},
+        "last_search": SearchContext(parameters={}, queries=["coffee"], user_preferences=USER_PREFERENCES, place_names=[p.name for p in places_objects]),
+    }
+    tool_call = {"name": "google_maps_text_search_and_filter", "args": {"api_query": "coffee", "state": state}, "id": "1", "type": "tool_call"}
+    message = asyncio.run(google_maps_text_search_and_filter.ainvoke(tool_call))
+    store.close()
+
+    valid_refs, invalid_refs, ranking, search_context = message.artifact
+    expected_valid, expected_invalid = split_valid_places(places_objects, NEEDS_OUTDOOR_SEATING)
+    assert {ref.name for ref in valid_refs} == {p.name for p in expected_valid}
+    assert {ref.name for ref in invalid_refs} == {p.name for p, _ in expected_invalid}
+    assert ranking.names[ranking.ranked[0]] == rank_places(expected_valid, NEEDS_OUTDOOR_SEATING)[0].name
+    assert search_context.user_preferences == NEEDS_OUTDOOR_SEATING
+
+def test_tool_searches_again_for_a_different_query(tmp_path, monkeypatch):
+    class RecordingClient:
+        queries = []
+
+        async def search_text(self, body, field_mask):
+            self.queries.append(body["textQuery"])
+            return {"places": []}
+
+    client = RecordingClient()
+    store = PlaceStore(str(tmp_path / "places.db"))
+    store.upsert_places(places_objects)
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_places_client", lambda: client)
+    monkeypatch.setattr(places_search, "get_places_cache", lambda: PlacesSearchCache())
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: PagePrefetcher())
+    monkeypatch.setattr(places_search, "PLACES_TWO_PHASE_FETCH", False)
+
+    state = {
+        **DEFAULT_AGENT_STATE,
+        "user_preferences": USER_PREFERENCES,
+        "last_search": SearchContext(parameters={}, queries=["sushi"], user_preferences=USER_PREFERENCES, place_names=[p.name for p in places_objects]),
+    }
+    tool_call = {"name": "google_maps_text_search_and_filter", "args": {"api_query": "mexican food", "state": state}, "id": "1", "type": "tool_call"}
+    message = asyncio.run(google_maps_text_search_and_filter.ainvoke(tool_call))
+    store.close()
+
+    assert client.queries == ["mexican food"]
+    assert message.artifact[3].queries == ["mexican food"] and message.artifact[3].place_names == []
+
+def test_rerank_drops_prefetched_places_out_of_range(tmp_path, monkeypatch):
+    # The search was in Austin; its later pages brought back places in Sydney
+    austin_places, sydney_places = places_objects[20:], places_objects[:20]
+    assert {p.name for p in austin_places}.isdisjoint(p.name for p in sydney_places)
+
+    class DonePrefetcher:
+        def take(self, key):
+            return sydney_places + austin_places[:1] if key == "pages" else None
+
+    store = PlaceStore(str(tmp_path / "places.db"))
+    store.upsert_places(places_objects)
+    monkeypatch.setattr(places_search, "get_place_store", lambda: store)
+    monkeypatch.setattr(places_search, "get_page_prefetcher", lambda: DonePrefetcher())
+
+    last_search = SearchContext(
+        parameters={}, queries=["coffee"], user_preferences=USER_PREFERENCES, place_names=[p.name for p in austin_places],
+        user_coordinates=(30.2672, -97.7431), max_distance_meters=20000.0, prefetch_key="pages",
+    )
+    state = {**DEFAULT_AGENT_STATE, "user_preferences": NEEDS_OUTDOOR_SEATING, "last_search": last_search}
+    valid_places, invalid_places, place_names = asyncio.run(places_search.rerank_last_search(state, {}, ["coffee"]))
+    store.close()
+
+    assert place_names == last_search.place_names
+    assert {p.name for p in valid_places} | {p.name for p, _ in invalid_places} <= set(place_names)
@@ -0,0 +1,59 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from app.schemas.schema import Place, UserPreferences, PreferenceWeight
+from app.graph.tools import compile_restriction_plan, format_invalid_reasons, filter_places
+
+# read in test_text_search_json.txt
+TEST_JSON = None
+TEST_FILE_PATH = "../test_data/test_2.txt"
+with open(TEST_FILE_PATH, "r") as file:
+    TEST_JSON = json.load(file)
+places_objects = []
+for p in TEST_JSON['places']:
+    places_objects.append(Place.model_validate(p))
+
+# Thursday, 4pm for an hour (same as the filter_places tests)
+DESIRED_TIME_AND_STAY_DURATION = (datetime(2024, 10, 10, 16, 0), 60)
+
+@pytest.fixture
+def strict_preferences():
+    return UserPreferences(
+        party_size=PreferenceWeight(value=8, weight=1.0),
+        desired_minimum_num_ratings=PreferenceWeight(value=5000, weight=1.0),
+        wants_live_music=PreferenceWeight(value=True, weight=1.0),
+        wants_coffee=PreferenceWeight(value=True, weight=1.0),
+        # Not a restriction (weight < 1.0)
+        wants_beer=PreferenceWeight(value=True, weight=0.5),
+        desired_time_and_stay_duration=DESIRED_TIME_AND_STAY_DURATION,
+    )
+
+def test_only_needed_preferences_are_compiled(strict_preferences):
+    # party size, min ratings, live music, coffee, plus the opening hours check
+    assert len(compile_restriction_plan(strict_preferences)) == 5
+    # By default, only the opening hours check
+    assert len(compile_restriction_plan(UserPreferences(desired_time_and_stay_duration=DESIRED_TIME_AND_STAY_DURATION))) == 1
+
+def test_early_exit_stops_at_first_failure(strict_preferences):
+    plan = compile_restriction_plan(strict_preferences)
+    for place in places_objects:
+        first = plan.check(place)
+        everything = plan.check(place, early_exit=False)
+        assert len(first) <= 1
+        assert first == everything[:1]
+
+def test_reason_codes_format_to_messages(strict_preferences):
+    plan = compile_restriction_plan(strict_preferences)
+    place = next(p for p in places_objects if p.user_rating_count < 5000 and not p.live_music)
+    text = format_invalid_reasons(plan.check(place, early_exit=False))
+    assert "This place has less than your desired 5000 ratings.\n" in text
+    assert "This place does not have live music.\n" in text
+
+def test_filter_places_returns_reason_codes(strict_preferences):
+    valid_places, invalid_places = filter_places(places_objects, strict_preferences)
+    assert len(valid_places) + len(invalid_places) == len(places_objects)
+    for place, reasons in invalid_places:
+        assert len(reasons) == 1
+        assert format_invalid_reasons(reasons).startswith("This place")
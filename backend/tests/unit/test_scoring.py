@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from app.schemas.schema import Place, UserPreferences, PreferenceWeight
+from app.graph.tools import calculate_place_score, PlaceFeatures, encode_preferences, score_places, rank_places
+
+# read in both test_text_search_json files
+places_objects = []
+for test_file_path in ["../test_data/test_1.txt", "../test_data/test_2.txt"]:
+    with open(test_file_path, "r") as file:
+        for p in json.load(file)['places']:
+            places_objects.append(Place.model_validate(p))
+
+preference_scenarios = [
+    UserPreferences(),
+    UserPreferences(
+        wants_coffee=PreferenceWeight(value=True, weight=1.0),
+        desired_minimum_num_ratings=PreferenceWeight(value=3000, weight=0.9),
+    ),
+    UserPreferences(
+        dietary_requests=PreferenceWeight(value=["vegetarian"], weight=0.8),
+        wants_outdoor_seating=PreferenceWeight(value=True, weight=0.5),
+        wants_beer=PreferenceWeight(value=True, weight=0.3),
+        wants_wine=PreferenceWeight(value=True, weight=0.3),
+        desired_minimum_num_ratings=PreferenceWeight(value=500, weight=0.4),
+    ),
+    UserPreferences(
+        dietary_requests=PreferenceWeight(value=["vegan", "vegetarian"], weight=1.0),
+        wants_family_friendly=PreferenceWeight(value=True, weight=0.6),
+        wants_childrens_menu=PreferenceWeight(value=True, weight=0.5),
+        wants_free_parking=PreferenceWeight(value=False, weight=0.8),
+        wants_dessert=PreferenceWeight(value=True, weight=0.3),
+        wants_brunch=PreferenceWeight(value=True, weight=0.7),
+        wants_live_music=PreferenceWeight(value=True, weight=0.3),
+        wants_cocktails=PreferenceWeight(value=True, weight=0.3),
+    ),
+]
+
+@pytest.mark.parametrize("user_preferences", preference_scenarios)
+def test_batch_scores_match_scalar_scores(user_preferences):
+    scores = score_places(PlaceFeatures(places_objects), encode_preferences(user_preferences))
+    expected = [calculate_place_score(p, user_preferences) for p in places_objects]
+    assert list(scores) == pytest.approx(expected, abs=1e-12)
+
+@pytest.mark.parametrize("user_preferences", preference_scenarios)
+def test_ranking_matches_sorted_scalar_scores(user_preferences):
+    expected = sorted(places_objects, key=lambda p: calculate_place_score(p, user_preferences), reverse=True)
+    assert [p.name for p in rank_places(places_objects, user_preferences)] == [p.name for p in expected]
+
+def test_rank_places_reuses_features():
+    features = PlaceFeatures(places_objects)
+    for user_preferences in preference_scenarios:
+        assert rank_places(places_objects, user_preferences, features) == rank_places(places_objects, user_preferences)
+
+def test_rank_no_places():
+    assert rank_places([], UserPreferences()) == []
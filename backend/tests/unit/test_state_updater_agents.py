@@ -48,16 +48,17 @@ test_queries = [
     "Tomorrow at 8:00 AM, I want to grab some breakfast with friends."
 ]
 
-def test_extract_datetime():
-    expected_times = [
-        datetime(2024, 9, 24, 19, 0), # 7 PM
-        datetime(2024, 9, 24, 18, 0), # 6 PM
-        datetime(2024, 9, 25, 18, 0), # 6 PM
-        datetime(2024, 9, 27, 12, 0), # 12 PM
-        datetime(2024, 10, 31, 18, 0), # Halloween, no time of day, but deduce dinner (6 PM)
-        datetime(2024, 9, 25, 8, 0) # 8 AM
-    ]
+# When the user wants to eat for each of the test queries, if asked at ANCHOR_TIME
+expected_times = [
+    datetime(2024, 9, 24, 19, 0), # 7 PM
+    datetime(2024, 9, 24, 18, 0), # 6 PM
+    datetime(2024, 9, 25, 18, 0), # 6 PM
+    datetime(2024, 9, 27, 12, 0), # 12 PM
+    datetime(2024, 10, 31, 18, 0), # Halloween, no time of day, but deduce dinner (6 PM)
+    datetime(2024, 9, 25, 8, 0) # 8 AM
+]
 
+def test_extract_datetime():
     test_cases = list(zip(test_queries, expected_times))
 
     for query, expected_time in test_cases:
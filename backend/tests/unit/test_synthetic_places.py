@@ -0,0 +1,38 @@
+import pytest
+
+from app.graph.tools.places_search import get_places_from_json
+
+from synthetic_places import BOOLEAN_FIELDS, FieldDistributions, load_test_places, synthetic_places, synthetic_batches
+from bench_places_pipeline import find_regressions
+
+SAMPLES = load_test_places()
+DISTRIBUTIONS = FieldDistributions(SAMPLES)
+
+def test_same_seed_same_places():
+    assert synthetic_places(50, seed=1) == synthetic_places(50, seed=1)
+    assert synthetic_places(50, seed=1) != synthetic_places(50, seed=2)
+    assert sum(len(batch) for batch in synthetic_batches(250, 100)) == 250
+
+def test_field_distributions_match_the_samples():
+    places = synthetic_places(4000, distributions=DISTRIBUTIONS)
+    generated = FieldDistributions(places)
+    for field in BOOLEAN_FIELDS:
+        assert generated.presence.get(field, 0.0) == pytest.approx(DISTRIBUTIONS.presence.get(field, 0.0), abs=0.05)
+        assert generated.true_rate[field] == pytest.approx(DISTRIBUTIONS.true_rate[field], abs=0.05)
+    assert generated.log_count_mean == pytest.approx(DISTRIBUTIONS.log_count_mean, abs=0.1)
+    assert len({p["name"] for p in places}) == len(places)
+
+def test_synthetic_places_parse():
+    places = get_places_from_json({"places": synthetic_places(200)})
+    assert len(places) == 200
+
+def test_regressions_fail_past_the_threshold():
+    baselines = {"10000": {"filter_places": {"seconds": 0.100, "peak_mib": 5.0}}}
+    def results(seconds, peak_mib=5.0):
+        return {"10000": {"filter_places": {"seconds": seconds, "peak_mib": peak_mib}}}
+
+    assert find_regressions(results(0.140), baselines, 1.5) == []
+    assert len(find_regressions(results(0.160), baselines, 1.5)) == 1
+    assert len(find_regressions(results(0.100, peak_mib=9.0), baselines, 1.5)) == 1
+    # Stages without a baseline (e.g. a new size) aren't compared
+    assert find_regressions({"100": results(1.0)["10000"]}, baselines, 1.5) == []